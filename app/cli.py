@@ -0,0 +1,122 @@
+"""Operational commands: ``python -m app.cli create-schema``.
+
+Schema creation used to run on every import of app.main, which made every
+worker race on DDL; run it once per deploy instead.
+
+``create_all`` only creates missing tables, so create-schema also upgrades
+tables made by older releases: it adds the columns listed in ADDED_COLUMNS
+that are missing, backfills them, creates any missing index, and fills the
+conversations table from existing messages the first time it is created.
+Every step checks first, so running it again is a no-op.
+"""
+import argparse
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+# Columns added to tables that already existed in earlier releases
+ADDED_COLUMNS = {
+    "properties": ("created_at", "updated_at", "latitude", "longitude", "geocell"),
+    "property_images": (
+        "storage_key", "content_hash", "width", "height", "variants", "variants_leased_until",
+        "import_job_id", "import_leased_until",
+    ),
+    "messages": ("created_at", "read_at"),
+}
+# Values for rows that predate a column. Messages older than read tracking
+# count as read, so nobody inherits their whole history as unread.
+BACKFILLS = {
+    ("properties", "created_at"): "CURRENT_TIMESTAMP",
+    ("properties", "updated_at"): "created_at",
+    ("messages", "created_at"): "CURRENT_TIMESTAMP",
+    ("messages", "read_at"): "CURRENT_TIMESTAMP",
+}
+
+CONVERSATIONS_BACKFILL = text(
+    "INSERT INTO conversations (user_id, peer_id, property_id, last_message_id, unread_count) "
+    "SELECT user_id, peer_id, property_id, MAX(id), 0 FROM ("
+    "SELECT id, sender_id AS user_id, receiver_id AS peer_id, property_id FROM messages "
+    "UNION ALL "
+    "SELECT id, receiver_id, sender_id, property_id FROM messages"
+    ") AS sides "
+    "WHERE user_id IS NOT NULL AND peer_id IS NOT NULL "
+    "GROUP BY user_id, peer_id, property_id"
+)
+
+
+def _add_column(connection, column):
+    """ALTER TABLE ... ADD COLUMN for ``column``, then its backfill and NOT NULL."""
+    dialect = connection.dialect
+    table = column.table.name
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+    for foreign_key in column.foreign_keys:
+        ddl += f" REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+    # Added nullable: SQLite can't add a NOT NULL column whose default isn't constant
+    connection.execute(text(ddl))
+    backfill = BACKFILLS.get((table, column.name))
+    if backfill is not None:
+        connection.execute(text(f"UPDATE {table} SET {column.name} = {backfill}"))
+    if dialect.name == "postgresql":
+        if column.server_default is not None:
+            default = column.server_default.arg.compile(dialect=dialect)
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column.name} SET DEFAULT {default}"))
+        if not column.nullable:
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column.name} SET NOT NULL"))
+    print(f"Added {table}.{column.name}")
+
+
+def upgrade_schema(engine, metadata):
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing = set(inspector.get_table_names())
+        for table_name, columns in ADDED_COLUMNS.items():
+            if table_name not in existing:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table_name)}
+            table = metadata.tables[table_name]
+            for name in columns:
+                if name not in present:
+                    _add_column(connection, table.c[name])
+
+    new_tables = [table for name, table in metadata.tables.items() if name not in existing]
+    metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table in new_tables:
+                continue
+            for index in table.indexes:
+                only_on = index._ddl_if.dialect if index._ddl_if is not None else None
+                if only_on not in (None, connection.dialect.name):
+                    continue
+                # Not checkfirst: reflection skips expression indexes
+                connection.execute(CreateIndex(index, if_not_exists=True))
+        if connection.dialect.name == "postgresql":
+            from app.models.models import SEARCH_VECTOR_DDL
+
+            connection.execute(SEARCH_VECTOR_DDL)
+        if "conversations" not in existing and "messages" in existing:
+            connection.execute(CONVERSATIONS_BACKFILL)
+            print("Filled conversations from existing messages")
+
+
+def create_schema():
+    from app.database import engine
+    from app.models import models  # registers every table on Base.metadata
+
+    upgrade_schema(engine, models.Base.metadata)
+    print(f"Schema up to date on {engine.url.render_as_string(hide_password=True)}")
+
+
+COMMANDS = {"create-schema": create_schema}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
-from authlib.integrations.starlette_client import OAuth
-import os
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=os.getenv("GOOGLE_CLIENT_ID"),
-    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
-)
\ No newline at end of file
+from functools import lru_cache
+
+from app.config.settings import get_settings
+
+
+@lru_cache
+def get_oauth():
+    """Google OAuth client, built on the first Google login rather than at import."""
+    from authlib.integrations.starlette_client import OAuth
+
+    settings = get_settings()
+    oauth = OAuth()
+    oauth.register(
+        name='google',
+        client_id=settings.google_client_id,
+        client_secret=settings.google_client_secret,
+        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+        client_kwargs={'scope': 'openid email profile'},
+    )
+    return oauth
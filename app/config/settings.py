@@ -0,0 +1,162 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Every environment setting the app reads, loaded once from the env and .env.
+
+    Field names match the environment variables case-insensitively, so
+    ``DATABASE_URL`` populates ``database_url``.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    database_url: str
+    # Optional read replica; unset means every read goes to DATABASE_URL
+    database_replica_url: Optional[str] = None
+    # After a write, that client's reads stay on the primary this long
+    replica_sticky_seconds: float = 5
+    replica_health_interval: float = 5
+    replica_health_timeout: float = 2
+    replica_max_lag_seconds: float = 30
+    # Per engine and per worker process; size * workers must fit max_connections
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # Recycle before server/proxy idle timeouts drop connections under us
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Connections opened by the lifespan before the first request
+    db_warm_connections: int = 1
+    sql_profiler_enabled: bool = False
+    sql_slow_query_ms: float = 200
+    sql_n_plus_one_threshold: int = 5
+    sql_explain_slow: bool = True
+
+    secret_key: str = "defaultsecretkey"
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 60
+    session_secret_key: str = "defaultsessionkey"
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = os.cpu_count() or 2
+    password_hash_max_pending: int = 64
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60
+    # Bearer token for /internal and /metrics besides an admin's; unset means admins only
+    internal_token: Optional[str] = None
+
+    frontend_url: str = "http://localhost:5173"
+    backend_url: str = "http://127.0.0.1:8000"
+
+    google_client_id: Optional[str] = None
+    google_client_secret: Optional[str] = None
+    cloudinary_cloud_name: Optional[str] = None
+    cloudinary_api_key: Optional[str] = None
+    cloudinary_api_secret: Optional[str] = None
+
+    storage_backend: str = "cloudinary"
+    media_root: str = "media"
+    media_url: str = "/media"
+    upload_workers: int = 8
+    upload_timeout: float = 30
+    upload_breaker_threshold: int = 5
+    upload_breaker_reset: float = 30
+    image_workers: int = max(1, (os.cpu_count() or 2) - 1)
+    image_pipeline_concurrency: Optional[int] = None
+    # Failed variant builds are retried with a doubling delay, then left for the next start
+    image_pipeline_max_attempts: int = 3
+    image_pipeline_retry_delay: float = 5
+    # A hash being processed by one worker is skipped by the others until this runs out
+    image_pipeline_lease_seconds: float = 600
+    import_chunk_size: int = 500
+    import_max_errors: int = 1000
+    # Longest line (NDJSON) or record (CSV, quoted newlines included) an import buffers, in characters
+    import_max_record_length: int = 1024 * 1024
+    import_image_fetch_concurrency: int = 4
+    import_image_max_bytes: int = 20 * 1024 * 1024
+    import_image_timeout: float = 30
+    # A claimed batch of import images becomes claimable again after this long
+    import_image_lease_seconds: float = 300
+    export_batch_size: int = 1000
+    # Rows per cursor fetch when a list page is streamed (?stream=true)
+    stream_batch_size: int = 50
+
+    # Negotiated response compression; br and zstd need the optional brotli and
+    # zstandard packages and are skipped when they are not installed
+    compression_min_size: int = 1024
+    # Preference when the client accepts several encodings equally
+    compression_encodings: str = "zstd,br,gzip"
+    # "media/type=level", comma separated; only these types are compressed. The
+    # level is passed as-is to gzip (1-9), brotli (0-11) or zstd (1-22)
+    compression_levels: str = (
+        "application/json=5,application/x-ndjson=5,text/csv=5,text/html=5,text/plain=5"
+    )
+    # Compressed copies of ETagged responses, so cache hits aren't recompressed
+    compression_cache_max_bytes: int = 16 * 1024 * 1024
+    geo_max_cells: int = 16
+    geo_max_radius_km: float = 100
+    geo_max_results: int = 500
+    geo_max_candidates: int = 5000
+
+    response_cache_backend: str = "memory"
+    response_cache_max_entries: int = 1024
+    response_cache_max_bytes: int = 32 * 1024 * 1024
+    response_cache_ttl: float = 60
+    # Without native full-text search, how often (seconds) a search checks the
+    # properties table for writes made by other worker processes
+    search_index_check_interval: float = 1
+    facet_price_buckets: str = "50000,100000,250000,500000,1000000,5000000"
+    facet_cache_size: int = 256
+    facet_cache_ttl: float = 300
+
+    # "METHOD /path=limit:queue", comma separated: at most `limit` requests run at
+    # once per worker, `queue` more wait; routes not listed are never held back
+    admission_limits: str = (
+        "POST /auth/login=8:32,POST /auth/signup=4:16,POST /properties/=4:8,POST /properties/import=2:2"
+    )
+    admission_queue_timeout: float = 5
+    # "METHOD /path=per_minute:burst" token buckets, per client address
+    rate_limits: str = "POST /auth/forgot-password=6:3"
+    # Proxies whose X-Forwarded-For is believed, comma separated ("*" trusts any
+    # peer); set it to the load balancer's addresses when running behind one
+    forwarded_allow_ips: str = "127.0.0.1"
+    # Messages per second per user, across all of their sockets
+    ws_message_rate: float = 10
+    ws_message_burst: int = 20
+
+    hub_broker: str = "memory"
+    hub_channel: str = "lanvera_messages"
+    # Backoff bounds (seconds) for reopening dropped broker connections
+    hub_reconnect_min: float = 0.5
+    hub_reconnect_max: float = 30
+    # Idle listener connections are pinged this often to spot silent drops
+    hub_keepalive_interval: float = 30
+    message_batch_size: int = 200
+    message_batch_linger_ms: float = 5
+
+    # Gmail account the outbox sends from; SMTP_* override the transport
+    email: Optional[str] = None
+    password: Optional[str] = None
+    mail_from: Optional[str] = None
+    smtp_host: str = "smtp.gmail.com"
+    smtp_port: int = 465
+    smtp_use_tls: bool = True
+    smtp_starttls: bool = False
+    smtp_username: Optional[str] = None
+    smtp_password: Optional[str] = None
+    smtp_timeout: float = 30
+    smtp_pool_size: int = 3
+    outbox_batch_size: int = 50
+    outbox_poll_interval: float = 2
+    outbox_max_attempts: int = 8
+    outbox_backoff_base: float = 30
+    outbox_backoff_max: float = 3600
+    outbox_lease_seconds: float = 300
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
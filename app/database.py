@@ -1,18 +1,69 @@
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
-print(DATABASE_URL)
+from app.config.settings import get_settings
+from app.services.db_pool import instrument, pool_options
+from app.services.replica import ReplicaMonitor, pinned_to_primary
 
+settings = get_settings()
+DATABASE_URL = settings.database_url
 
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
 
-engine = create_engine(DATABASE_URL)
+
+def to_async_url(url: str):
+    """Map a sync DATABASE_URL onto the matching asyncio driver."""
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    query = dict(url.query)
+    if drivername == "postgresql+asyncpg" and "sslmode" in query:
+        # asyncpg spells libpq's sslmode as ssl
+        query["ssl"] = query.pop("sslmode")
+    return url.set(drivername=drivername, query=query)
+
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, settings))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    to_async_url(DATABASE_URL), **pool_options(DATABASE_URL, settings, is_async=True)
+)
+instrument(engine)
+instrument(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Reads go to DATABASE_REPLICA_URL when set; without one the "replica" is the primary
+DATABASE_REPLICA_URL = settings.database_replica_url
+if DATABASE_REPLICA_URL:
+    async_read_engine = create_async_engine(
+        to_async_url(DATABASE_REPLICA_URL), **pool_options(DATABASE_REPLICA_URL, settings, is_async=True)
+    )
+    instrument(async_read_engine.sync_engine)
+    replica = ReplicaMonitor(
+        async_read_engine,
+        interval=settings.replica_health_interval,
+        timeout=settings.replica_health_timeout,
+        max_lag=settings.replica_max_lag_seconds,
+    )
+else:
+    async_read_engine = async_engine
+    replica = None
+ReadSessionLocal = async_sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
-# Dependency to get DB session
+# Dependency to get DB session (sync; kept for scripts and code not yet ported)
 def get_db():
     db = SessionLocal()
     try:
@@ -20,3 +71,33 @@ def get_db():
     finally:
         db.close()
 
+
+# Dependency to get an async DB session for async endpoints (the primary)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_write_db = get_async_db
+
+
+def read_sessionmaker(primary: bool = False):
+    """The replica's sessionmaker, unless ``primary`` is asked for or the replica is down."""
+    if replica is None or primary:
+        return AsyncSessionLocal
+    if not replica.healthy:
+        replica.fallbacks += 1
+        return AsyncSessionLocal
+    return ReadSessionLocal
+
+
+# Dependency for read-only endpoints; never write through this session
+async def get_read_db(request: Request):
+    pinned = pinned_to_primary(request)
+    factory = read_sessionmaker(pinned)
+    # For the response cache: whether this body may miss recent writes
+    request.state.pinned_to_primary = pinned
+    request.state.replica_caught_up_at = replica.caught_up_at if factory is ReadSessionLocal else None
+    request.state.read_from_replica = factory is ReadSessionLocal and replica is not None
+    async with factory() as db:
+        yield db
@@ -1,25 +1,73 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, properties, messaging
-from app.database import engine 
-from app.models import models   # <-- This is necessary BEFORE create_all
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import text
+from app.config.settings import get_settings
+from app.routers import auth, properties, messaging, facets, internal
+from app.database import async_engine, async_read_engine, replica
+from app.security import require_internal_access
+from app.services import storage
+from app.services.admission import AdmissionMiddleware
+from app.services.compression import CompressionMiddleware
+from app.services.metrics import MetricsMiddleware, registry
+from app.services.replica import ReadYourWritesMiddleware
+from app.services.sql_profiler import SQLProfilerMiddleware
+from app.services.images import pipeline as image_pipeline
+from app.services.imports import image_fetcher
+from app.services.hub import hub
+from app.services.message_writer import message_writer
 from starlette.middleware.sessions import SessionMiddleware
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+settings = get_settings()
 
 
+async def warm_database_pool(connections: int = settings.db_warm_connections):
+    """Open pool connections up front so the first requests skip the connect."""
+    async def ping():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
 
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+
+# Schema changes are applied by `python -m app.cli create-schema`, not on import
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_database_pool()
+    if replica is not None:
+        await replica.start()
+    await hub.start()
+    await message_writer.start()
+    # Both pick up images an earlier process left half done
+    await image_pipeline.start(on_updated=properties._invalidate_cached_reads)
+    await image_fetcher.start(on_updated=properties._invalidate_cached_reads)
+    try:
+        yield
+    finally:
+        # Flush queued messages before the broker goes away
+        await message_writer.stop()
+        await image_fetcher.stop()
+        await image_pipeline.stop()
+        await hub.stop()
+        if replica is not None:
+            await replica.stop()
+            await async_read_engine.dispose()
+        await async_engine.dispose()
 
-models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="lanvera",
     description="Luxury Real Estate Marketplace",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
-app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET_KEY"))
+app.add_middleware(SessionMiddleware, secret_key=settings.session_secret_key)
+# Inside CORS so shed requests still carry CORS headers the browser can read
+app.add_middleware(AdmissionMiddleware)
 origins = [
     "http://localhost:3000",  # React/Vue frontend dev
     "http://localhost:5173" , # Replace in prod
@@ -33,9 +81,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ReadYourWritesMiddleware)
+if settings.sql_profiler_enabled:
+    app.add_middleware(SQLProfilerMiddleware)
+# Just inside metrics, so response sizes are the bytes actually sent
+app.add_middleware(CompressionMiddleware)
+# Outermost, so latency covers every other middleware too
+app.add_middleware(MetricsMiddleware)
+if storage.STORAGE_BACKEND == "local":
+    app.mount(storage.MEDIA_URL, StaticFiles(directory=storage.MEDIA_ROOT, check_dir=False), name="media")
+
 app.include_router(auth.router)
 app.include_router(properties.router)
+app.include_router(facets.router)
 app.include_router(messaging.router)
+app.include_router(internal.router)
 
 
 @app.get("/")
@@ -45,3 +105,11 @@ def read_root():
 @app.head("/")
 def head_root():
     return
+
+
+@app.get(
+    "/metrics", include_in_schema=False, response_class=PlainTextResponse,
+    dependencies=[Depends(require_internal_access)],
+)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text
+from sqlalchemy import BigInteger, Column, Float, Integer, String, Boolean, DateTime, ForeignKey, Index, JSON, Text, DDL, event, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 import enum
 from sqlalchemy import Enum
+from datetime import datetime
 
 class UserRole(enum.Enum):
     user = "user"
@@ -34,20 +35,66 @@ class Property(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=False)
-    price = Column(Integer, nullable=False)
-    location = Column(String(255), nullable=False)
-    owner_id = Column(Integer, ForeignKey('users.id'), nullable=False) 
+    price = Column(Integer, nullable=False, index=True)
+    location = Column(String(255), nullable=False, index=True)
+    owner_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+    # Microsecond resolution on every backend, so the search index spots each edit
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # Interleaved lat/lng bits (see app.services.geo); box queries are index range scans
+    geocell = Column(BigInteger, nullable=True, index=True)
     owner = relationship("User", back_populates="properties")
     images = relationship("PropertyImage", back_populates="property", cascade="all, delete")
     messages = relationship("Message", back_populates="property")
 
 
+# Location filters are case-insensitive prefix matches, lower(location) LIKE 'prefix%'.
+# text_pattern_ops lets PostgreSQL use this for LIKE under any collation. SQLite
+# never uses an index for LIKE on an expression, so it isn't built there.
+Index(
+    "ix_properties_location_prefix",
+    func.lower(Property.location).label("location_lower"),
+    postgresql_ops={"location_lower": "text_pattern_ops"},
+).ddl_if(dialect="postgresql")
+
+
+# PostgreSQL keeps a weighted tsvector in sync with every insert/update and
+# indexes it with GIN; other dialects fall back to app.services.search.
+# Idempotent, so app.cli also runs it on tables created before it existed.
+SEARCH_VECTOR_DDL = DDL(
+    "ALTER TABLE properties ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+    ") STORED; "
+    "CREATE INDEX IF NOT EXISTS ix_properties_search_vector "
+    "ON properties USING GIN (search_vector)"
+)
+event.listen(Property.__table__, "after_create", SEARCH_VECTOR_DDL.execute_if(dialect="postgresql"))
+
+
 class PropertyImage(Base):
     __tablename__ = "property_images"
     
     id = Column(Integer, primary_key=True, index=True)
     property_id = Column(Integer, ForeignKey('properties.id'), nullable=False)
     url = Column(String(500), nullable=False)
+    storage_key = Column(String(255), nullable=True)
+    # sha256 of the original bytes; identical photos share one stored copy
+    content_hash = Column(String(64), nullable=True, index=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    # {"thumbnail": {"url": ..., "width": ..., "height": ...}, "card": ..., "full": ...}
+    variants = Column(JSON, nullable=True)
+    # Until then the variants are being built by one worker; the others skip the hash
+    variants_leased_until = Column(DateTime, nullable=True)
+    # Set while url is still the agency's source URL from a bulk import
+    import_job_id = Column(Integer, ForeignKey('import_jobs.id'), nullable=True, index=True)
+    # Until then the image is being fetched by one worker; the others skip it
+    import_leased_until = Column(DateTime, nullable=True)
     
     property = relationship("Property", back_populates="images")
 
@@ -60,7 +107,109 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey('users.id'))
     receiver_id = Column(Integer, ForeignKey('users.id'))
     property_id = Column(Integer, ForeignKey('properties.id'),  nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    read_at = Column(DateTime, nullable=True)
     
     sender = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
     receiver = relationship("User", back_populates="received_messages", foreign_keys=[receiver_id])
     property = relationship("Property", back_populates="messages")
+
+    # Inbox/sent pages walk a user's messages newest-first by id
+    __table_args__ = (
+        Index("ix_messages_receiver_id_id", "receiver_id", "id"),
+        Index("ix_messages_sender_id_id", "sender_id", "id"),
+    )
+
+
+class Conversation(Base):
+    """One user's view of a thread with a peer about a property.
+
+    Maintained by the message writer as messages are stored, so the
+    conversation list and unread counts never aggregate the messages table.
+    """
+    __tablename__ = "conversations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    peer_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    property_id = Column(Integer, ForeignKey('properties.id'), nullable=True)
+    last_message_id = Column(Integer, ForeignKey('messages.id'), nullable=False)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+    last_message = relationship("Message", foreign_keys=[last_message_id])
+
+    __table_args__ = (
+        Index("ix_conversations_user_id_last_message_id", "user_id", "last_message_id"),
+    )
+
+
+# property_id is nullable, so uniqueness goes through coalesce() to treat
+# "no property" as a single thread
+Index(
+    "uq_conversations_thread",
+    Conversation.user_id,
+    Conversation.peer_id,
+    func.coalesce(Conversation.property_id, 0),
+    unique=True,
+)
+
+
+class OutboxStatus(enum.Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
+
+class EmailOutbox(Base):
+    """Mail queued by the web workers and delivered by app.workers.email_worker.
+
+    Rows are written in the same transaction as the change that triggers
+    them, so a mail is never lost to a restart nor sent for a rolled-back
+    signup.
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    # Set while a mail is pending so a recipient never gets the same kind twice;
+    # cleared once it is sent
+    dedup_key = Column(String(320), nullable=True, unique=True)
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.pending, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+
+class ImportStatus(enum.Enum):
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class ImportJob(Base):
+    """Progress of a bulk listing import; rows are counted as each chunk commits."""
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    format = Column(String(10), nullable=False)
+    status = Column(Enum(ImportStatus), default=ImportStatus.running, nullable=False)
+    rows_total = Column(Integer, nullable=False, default=0)
+    rows_imported = Column(Integer, nullable=False, default=0)
+    rows_failed = Column(Integer, nullable=False, default=0)
+    # [{"row": n, "error": "..."}], capped at IMPORT_MAX_ERRORS
+    errors = Column(JSON, nullable=False, default=list)
+    images_queued = Column(Integer, nullable=False, default=0)
+    images_fetched = Column(Integer, nullable=False, default=0)
+    images_failed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,31 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Streamed pages (?stream=true) are encoded batch by batch, so they may be larger
+STREAM_MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(values: dict) -> str:
+    """Pack the sort key of the last row on a page into an opaque cursor."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def check_page_size(limit: int, stream: bool):
+    if limit > MAX_PAGE_SIZE and not stream:
+        raise HTTPException(status_code=400, detail=f"limit above {MAX_PAGE_SIZE} needs stream=true")
@@ -1,62 +1,63 @@
-from app.config.oauth import oauth
+from app.config.oauth import get_oauth
 from starlette.responses import RedirectResponse
 from fastapi import (
-    APIRouter, Depends, HTTPException, BackgroundTasks, Request, status, Form, Query
+    APIRouter, Depends, HTTPException, Request, status, Form, Query
 )
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 from datetime import timedelta
 import os
 import logging
 
-from app.database import get_db
+from app.config.settings import get_settings
+from app.database import get_async_db
 from app.schemas.schemas import UserCreate, UserOut, ForgotPasswordRequest, Token, BecomeAgency, UpdateProfile,LoginSchema
-from app.models.models import User
-from app.security import hash_password, verify_password, create_access_token, get_current_user
+from app.models.models import User, UserRole
+from app.security import (
+    hash_password_async, verify_and_update_password, create_access_token, get_current_user, invalidate_principal,
+    user_token_claims
+)
 from app.services.email import send_email_verification, send_welcome_email, send_reset_password_email
-from dotenv import load_dotenv
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+settings = get_settings()
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+FRONTEND_URL = settings.frontend_url
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 templates = Jinja2Templates(directory="app/templates")
 
-from dotenv import load_dotenv
-load_dotenv()
-
-FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
-
 @router.post("/signup", response_model=UserOut)
-def signup(user_data: UserCreate, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == user_data.email).first():
+async def signup(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User).where(User.email == user_data.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     new_user = User(
         username=user_data.username,
         email=user_data.email,
         phone = user_data.phone,
-        password=hash_password(user_data.password),
+        password=await hash_password_async(user_data.password),
         is_verified=False
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    background_tasks.add_task(send_email_verification, new_user, request)
-    logger.info("Signup: verification email sent to %s", new_user.email)
+    await db.flush()
+    # Queued in the signup transaction; the email worker delivers it
+    await send_email_verification(db, new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    logger.info("Signup: verification email queued for %s", new_user.email)
 
     return new_user
 
 @router.get("/confirm-email/{token}", response_class=HTMLResponse)
-def confirm_email(request: Request, token: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def confirm_email(request: Request, token: str, db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("email")
@@ -64,22 +65,22 @@ def confirm_email(request: Request, token: str, background_tasks: BackgroundTask
         if not email:
             raise ValueError("Missing email in token")
 
-        user = db.query(User).filter(User.email == email).first()
+        user = await db.scalar(select(User).where(User.email == email))
         if not user:
             raise ValueError("User not found")
         if user.is_verified:
             status_msg = ("info", "Email already verified")
         else:
             user.is_verified = True
-            db.commit()
-            background_tasks.add_task(send_welcome_email, user.email, db, background_tasks)
+            await send_welcome_email(db, user)
+            await db.commit()
             status_msg = ("success", "Email verified successfully!")
 
         return templates.TemplateResponse("email_confirmation.html", {
          "request": request,
          "status": status_msg[0],
          "message": status_msg[1],
-        "frontend_url": os.getenv("FRONTEND_URL", "http://localhost:5173")
+        "frontend_url": FRONTEND_URL
         })
 
     except (JWTError, ValueError) as e:
@@ -90,7 +91,7 @@ def confirm_email(request: Request, token: str, background_tasks: BackgroundTask
 @router.get("/google-login")
 async def google_login(request: Request):
     redirect_uri = request.url_for('google_callback')
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    return await get_oauth().google.authorize_redirect(request, redirect_uri)
 
 @router.get("/login-google", response_class=HTMLResponse)
 async def login_google_page(request: Request):
@@ -98,8 +99,9 @@ async def login_google_page(request: Request):
 
 
 @router.get("/google-callback")
-async def google_callback(request: Request, db: Session = Depends(get_db)):
+async def google_callback(request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
+        oauth = get_oauth()
         token = await oauth.google.authorize_access_token(request)
         user_info = token.get("userinfo") or await oauth.google.userinfo(request, token=token)
 
@@ -109,20 +111,20 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         email = user_info["email"]
         username = user_info.get("name", email.split('@')[0])
 
-        user = db.query(User).filter(User.email == email).first()
+        user = await db.scalar(select(User).where(User.email == email))
         if not user:
             user = User(
                 username=username,
                 email=email,
-                password=hash_password(os.urandom(8).hex()),
+                password=await hash_password_async(os.urandom(8).hex()),
                 is_verified=True
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
 
         access_token = create_access_token(
-            data={"sub": user.email},
+            data=user_token_claims(user),
             expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         )
 
@@ -135,34 +137,43 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Google login failed")
 
 @router.post("/login", response_model=Token)
-def login(data: LoginSchema, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email).first()
-    if not user or not verify_password(data.password, user.password):
+async def login(data: LoginSchema, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == data.email))
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_and_update_password(data.password, user.password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Hash policy (e.g. BCRYPT_ROUNDS) changed since this hash was made
+        user.password = new_hash
+        await db.commit()
+        invalidate_principal(user.email)
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Please verify your email first")
 
     token = create_access_token(
-        {"sub": user.email}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        user_token_claims(user), timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     logger.info("Login: %s", user.email)
     return {"access_token": token, "token_type": "bearer"}
 
 @router.post("/forgot-password")
-async def forgot_password(request: ForgotPasswordRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
+async def forgot_password(request: ForgotPasswordRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == request.email))
 
     if user:
         reset_token = create_access_token({"sub": user.email}, timedelta(minutes=30))
-        background_tasks.add_task(send_reset_password_email, user.email, db, reset_token)
-        logger.info("Password reset token sent to %s", user.email)
+        await send_reset_password_email(db, user, reset_token)
+        await db.commit()
+        logger.info("Password reset email queued for %s", user.email)
 
     return {"message": "If an account with that email exists, a reset link has been sent."}
 
 @router.api_route("/reset-password", methods=["GET", "POST"], response_class=HTMLResponse)
 async def reset_password(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Query(None),
     new_password: str = Form(None)
 ):
@@ -184,36 +195,39 @@ async def reset_password(
     except (JWTError, ValueError):
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
-    user = db.query(User).filter(User.email == user_email).first()
+    user = await db.scalar(select(User).where(User.email == user_email))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.password = hash_password(new_password)
-    db.commit()
+    user.password = await hash_password_async(new_password)
+    await db.commit()
+    invalidate_principal(user.email)
     logger.info("Password reset successful for %s", user.email)
     return RedirectResponse(url="/auth/login", status_code=303)
 
 
 @router.post("/become-agency")
-def become_agency(data: BecomeAgency, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    if current_user.role == "agency":
+async def become_agency(data: BecomeAgency, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    if current_user.role == UserRole.agency:
         raise HTTPException(status_code=400, detail="User is already an agency")
 
-    current_user.role = "agency"
+    current_user.role = UserRole.agency
     current_user.agency_name = data.agency_name
     current_user.agency_address = data.agency_address
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    invalidate_principal(current_user.email)
+    await db.refresh(current_user)
 
     return {"message": "You are now registered as an agency", "role": current_user.role}
 
 @router.put("/update-profile", response_model=UserOut)
-def update_profile(
+async def update_profile(
     data: UpdateProfile,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
+    previous_email = current_user.email
     if data.username:
         current_user.username = data.username
     if data.email:
@@ -223,8 +237,9 @@ def update_profile(
     if data.agency_address:
         current_user.agency_address = data.agency_address
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    invalidate_principal(previous_email, current_user.email)
+    await db.refresh(current_user)
 
     return current_user
 
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app import database
+from app.routers.properties import filter_properties
+from app.schemas import schemas
+from app.services import facets
+
+router = APIRouter(prefix="/facets", tags=["Facets"])
+
+MAX_FACET_VALUES = 50
+
+
+@router.get("/properties", response_model=schemas.PropertyFacets)
+async def property_facets(
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    location: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    # The primary, not the replica: cached counts are only patched from here on,
+    # so a write the replica had not seen yet would stay missing until the TTL
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    filters = facets.FacetFilters(min_price, max_price, location, owner_id)
+    counts = facets.facet_cache.get(filters)
+    if counts is None:
+        version = facets.facet_cache.version
+        counts = await facets.count_facets(db, filters, filter_properties)
+        facets.facet_cache.set(filters, counts, version)
+
+    def top(values):
+        return sorted(values.items(), key=lambda item: (-item[1], item[0]))[:MAX_FACET_VALUES]
+
+    bounds = [0] + facets.PRICE_BUCKETS
+    price_buckets = []
+    for index, lower in enumerate(bounds):
+        count = counts["price"].get(index, 0)
+        if count:
+            upper = bounds[index + 1] if index + 1 < len(bounds) else None
+            price_buckets.append({"min_price": lower, "max_price": upper, "count": count})
+
+    return {
+        "total": sum(counts["owner_id"].values()),
+        "locations": [{"value": value, "count": count} for value, count in top(counts["location"])],
+        "price_buckets": price_buckets,
+        "owners": [{"owner_id": value, "count": count} for value, count in top(counts["owner_id"])],
+    }
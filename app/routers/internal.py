@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import async_engine, async_read_engine, engine, get_async_db, replica
+from app.models.models import EmailOutbox
+from app.security import password_hash_stats, principal_cache, require_internal_access
+from app.services import admission, compression, storage
+from app.services.db_pool import pool_stats
+from app.services.cache import response_cache
+from app.services.hub import hub
+from app.services.images import pipeline as image_pipeline
+from app.services.imports import image_fetcher
+from app.services.message_writer import message_writer
+
+# Operational stats for dashboards; kept out of the public OpenAPI schema
+router = APIRouter(
+    prefix="/internal", tags=["Internal"], include_in_schema=False, dependencies=[Depends(require_internal_access)]
+)
+
+
+@router.get("/admission")
+def admission_stats():
+    return admission.stats()
+
+
+@router.get("/compression")
+def compression_stats():
+    return compression.stats()
+
+
+@router.get("/cache")
+def cache_stats():
+    return {"responses": response_cache.stats(), "principals": principal_cache.stats()}
+
+
+@router.get("/hub")
+def hub_stats():
+    return hub.stats()
+
+
+@router.get("/message-writer")
+def message_writer_stats():
+    return message_writer.stats()
+
+
+@router.get("/password-hashing")
+def password_hashing_stats():
+    return password_hash_stats()
+
+
+@router.get("/storage")
+def storage_stats():
+    return {
+        "backend": storage.STORAGE_BACKEND,
+        "breaker": storage.breaker.state,
+        "consecutive_failures": storage.breaker.failures,
+        "background_breaker": storage.background_breaker.state,
+        "background_consecutive_failures": storage.background_breaker.failures,
+        "late_saves_discarded": storage.late_saves_discarded,
+    }
+
+
+@router.get("/images")
+def image_pipeline_stats():
+    return image_pipeline.stats()
+
+
+@router.get("/imports")
+def image_fetcher_stats():
+    return image_fetcher.stats()
+
+
+@router.get("/pool")
+def database_pool_stats():
+    stats = {"async": pool_stats(async_engine.sync_engine), "sync": pool_stats(engine)}
+    if replica is not None:
+        stats["replica"] = pool_stats(async_read_engine.sync_engine)
+    return stats
+
+
+@router.get("/replica")
+def replica_stats():
+    if replica is None:
+        return {"configured": False}
+    return {"configured": True, **replica.stats()}
+
+
+@router.get("/email-outbox")
+async def email_outbox_stats(db: AsyncSession = Depends(get_async_db)):
+    rows = await db.execute(
+        select(EmailOutbox.status, func.count(), func.min(EmailOutbox.created_at))
+        .group_by(EmailOutbox.status)
+    )
+    return {
+        status.value: {"count": count, "oldest": oldest}
+        for status, count, oldest in rows
+    }
@@ -1,75 +1,199 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.orm import Session
-from typing import Dict, List
-from app.database import get_db
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+from typing import Optional
+from app.database import get_async_db, get_read_db, get_write_db
+from app.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_MAX_PAGE_SIZE, check_page_size, decode_cursor, encode_cursor,
+)
 from app.security import get_user_by_token, get_current_user
 from app.models import models
 from app.schemas import schemas
+from app.services import conversations, exports, row_serializers
+from app.services.admission import admission_rejected, ws_message_bucket
+from app.services.hub import hub
+from app.services.message_writer import message_writer
+from app.services.replica import pinned_to_primary
 
 import json
 
 router = APIRouter(prefix="/messages", tags=["Messaging"])
 
-# In-memory connections map: user_id -> WebSocket
-active_connections: Dict[int, WebSocket] = {}
-
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = get_user_by_token(token, db)
+    user = await get_user_by_token(token, db)
     if not user:
         await websocket.close(code=1008)  # Policy Violation
         return
+    # Don't pin a pooled connection (and an open transaction) for the socket's lifetime
+    await db.close()
 
     await websocket.accept()
-    active_connections[user.id] = websocket
+    hub.connect(user.id, websocket)
 
     try:
         while True:
             data = await websocket.receive_text()
+            wait = ws_message_bucket.take(user.id)
+            if wait:
+                admission_rejected.inc(("/messages/ws", "rate_limit"))
+                await websocket.send_text(json.dumps({"error": "Rate limit exceeded", "retry_after": round(wait, 2)}))
+                continue
             payload = json.loads(data)
 
-            message = models.Message(
-                sender_id=user.id,
-                receiver_id=payload["receiver_id"],
-                content=payload["content"],
-                property_id=payload.get("property_id")
-            )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
-
-            response = {
-                "id": message.id,
-                "content": message.content,
-                "sender_id": message.sender_id,
-                "receiver_id": message.receiver_id,
-                "property_id": message.property_id
-            }
-
-            # Send to receiver if connected
-            receiver_ws = active_connections.get(payload["receiver_id"])
-            if receiver_ws:
-                await receiver_ws.send_text(json.dumps(response))
+            # Group-committed with other connections' messages; returns once durable
+            try:
+                response = await message_writer.write(
+                    sender_id=user.id,
+                    receiver_id=payload["receiver_id"],
+                    content=payload["content"],
+                    property_id=payload.get("property_id")
+                )
+            except SQLAlchemyError:
+                await websocket.send_text(json.dumps({"error": "Message could not be saved"}))
+                continue
+
+            # Deliver to every socket the receiver has open, on any worker
+            await hub.send_to_user(response["receiver_id"], response)
 
             # Optionally send confirmation back to sender
             await websocket.send_text(json.dumps(response))
 
     except WebSocketDisconnect:
-        active_connections.pop(user.id, None)
+        pass
+    finally:
+        hub.disconnect(user.id, websocket)
+
+
+
+async def _message_items(db: AsyncSession, rows):
+    return row_serializers.message_dicts(rows)
+
+
+async def _message_page(
+    request: Request, db: AsyncSession, owner_column, user_id: int, cursor: Optional[str], limit: int, stream: bool
+):
+    check_page_size(limit, stream)
+    query = select(*row_serializers.message_columns()).where(owner_column == user_id)
+    if cursor:
+        query = query.where(models.Message.id < _cursor_id(cursor))
+    query = query.order_by(models.Message.id.desc())
+    if stream:
+        chunks = row_serializers.stream_page(
+            query, limit, _message_items, lambda last: encode_cursor({"id": last.id}),
+            primary=pinned_to_primary(request),
+        )
+        return StreamingResponse(chunks, media_type="application/json")
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = encode_cursor({"id": rows[limit - 1].id}) if len(rows) > limit else None
+    # Row tuples straight to JSON; response_model stays for the OpenAPI schema
+    body = row_serializers.dumps({"items": row_serializers.message_dicts(rows[:limit]), "next_cursor": next_cursor})
+    return Response(body, media_type="application/json")
+
+
+def _cursor_id(cursor: str) -> int:
+    try:
+        return int(decode_cursor(cursor)["id"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/inbox", response_model=schemas.MessagePage)
+async def get_inbox_messages(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=STREAM_MAX_PAGE_SIZE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return await _message_page(request, db, models.Message.receiver_id, current_user.id, cursor, limit, stream)
 
 
+@router.get("/sent", response_model=schemas.MessagePage)
+async def get_sent_messages(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=STREAM_MAX_PAGE_SIZE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return await _message_page(request, db, models.Message.sender_id, current_user.id, cursor, limit, stream)
+
+
+@router.get("/export")
+async def export_messages(
+    request: Request,
+    format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+    gzip: bool = False,
+    peer_id: Optional[int] = None,
+    property_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Stream the user's full message history, sent and received, oldest first."""
+    query = exports.message_query(current_user.id, peer_id, property_id, created_after, created_before)
+    chunks = exports.stream_rows(
+        query, exports.MESSAGE_COLUMNS, format, compress=gzip, primary=pinned_to_primary(request)
+    )
+    return exports.export_response(chunks, format, "messages", compress=gzip)
+
+
+@router.get("/conversations", response_model=schemas.ConversationPage)
+async def get_conversations(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    Conversation = models.Conversation
+    query = (
+        select(Conversation)
+        .options(selectinload(Conversation.last_message))
+        .where(Conversation.user_id == current_user.id)
+    )
+    if cursor:
+        query = query.where(Conversation.last_message_id < _cursor_id(cursor))
+    rows = (await db.scalars(query.order_by(Conversation.last_message_id.desc()).limit(limit + 1))).all()
+    next_cursor = encode_cursor({"id": rows[limit - 1].last_message_id}) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+@router.get("/unread", response_model=schemas.UnreadCount)
+async def get_unread_count(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return {"unread": await conversations.unread_total(db, current_user.id)}
+
 
-@router.get("/inbox", response_model=List[schemas.MessageOut])
-def get_inbox_messages(
-    db: Session = Depends(get_db),
+@router.post("/read", response_model=schemas.UnreadCount)
+async def mark_conversation_read(
+    data: schemas.MarkRead,
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    messages = db.query(models.Message).filter(
-        models.Message.receiver_id == current_user.id
-    ).order_by(models.Message.id.desc()).all()
+    marked = await conversations.mark_read(
+        db, current_user.id, data.peer_id, data.property_id, data.up_to_id
+    )
+    await db.commit()
 
-    return messages
+    if marked:
+        # Read receipt for the other side's open sockets
+        await hub.send_to_user(data.peer_id, {
+            "type": "read_receipt",
+            "reader_id": current_user.id,
+            "property_id": data.property_id,
+            "up_to_id": data.up_to_id,
+        })
+    return {"unread": await conversations.unread_total(db, current_user.id)}
@@ -1,95 +1,425 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, bindparam, func, insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app import database, security
 from app.models import models
+from app.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_MAX_PAGE_SIZE, check_page_size, decode_cursor, encode_cursor,
+)
 from app.schemas import schemas
-from typing import List
-from app.services.cloudinary_config import cloudinary
-import cloudinary.uploader
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import urlencode
+from app.services import exports, facets, geo, imports, row_serializers, search, storage
+from app.services import images as images_service
+from app.services.cache import cached_json_response, response_cache
+from app.services.replica import pinned_to_primary
 
 router = APIRouter(prefix="/properties", tags=["Properties"])
 
+LIST_CACHE_NAMESPACE = "properties:list"
+
+
+def _detail_namespace(property_id: int) -> str:
+    return f"property:{property_id}"
+
+
+def _invalidate_cached_reads(property_id: int):
+    # Generations, not deletes: a build that read the old row before this
+    # write can only store its body under a key nobody looks up any more
+    response_cache.bump(_detail_namespace(property_id))
+    response_cache.bump(LIST_CACHE_NAMESPACE)
+
 
 @router.post("/", response_model=schemas.PropertyOut)
-def create_property(
-    title: str,
-    description: str,
-    price: int,
-    location: str,
+async def create_property(
+    title: str = Query(..., max_length=255),
+    description: str = Query(...),
+    price: int = Query(..., ge=0, le=schemas.PRICE_MAX),
+    location: str = Query(..., max_length=255),
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
     images: List[UploadFile] = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_write_db),
     current_user: models.User = Depends(security.get_current_agency)
 ):
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=422, detail="latitude and longitude must be given together")
+
+    # Identical photos (the same shot reused across listings) are stored once
+    hashes = await images_service.hash_files([image.file for image in images])
+    known = await images_service.find_stored(db, hashes)
+    pending = {}
+    for image, digest in zip(images, hashes):
+        if digest not in known and digest not in pending:
+            pending[digest] = image
+
+    # Upload first so a failed upload never leaves a listing without photos
+    try:
+        uploaded = await storage.upload_files([(image.file, image.filename) for image in pending.values()])
+    except storage.UploadError as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc))
+    stored = dict(zip(pending, uploaded))
+
+    rows = []
+    for digest in hashes:
+        if digest in stored:
+            rows.append({"url": stored[digest].url, "storage_key": stored[digest].key, "content_hash": digest})
+        else:
+            existing = known[digest]
+            rows.append({
+                "url": existing.url,
+                "storage_key": existing.storage_key,
+                "content_hash": digest,
+                "width": existing.width,
+                "height": existing.height,
+                "variants": existing.variants,
+            })
+
     new_property = models.Property(
         title=title,
         description=description,
         price=price,
         location=location,
+        latitude=latitude,
+        longitude=longitude,
+        geocell=geo.geocell(latitude, longitude),
         owner_id=current_user.id
     )
-    db.add(new_property)
-    db.commit()
-    db.refresh(new_property)
-
-    for image in images:
-        uploaded = cloudinary.uploader.upload(image.file)
-        db_image = models.PropertyImage(
-            property_id=new_property.id,
-            url=uploaded["secure_url"]
+    try:
+        db.add(new_property)
+        await db.flush()
+        await db.execute(
+            insert(models.PropertyImage),
+            [{"property_id": new_property.id, **row} for row in rows],
         )
-        db.add(db_image)
-    db.commit()
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        await storage.discard_files(uploaded)
+        raise
+    # Patched before the next await so a facet count racing this write can tell
+    facets.facet_cache.property_added(facets.snapshot(new_property))
+
+    # Reused photos whose variants are still being built pick them up when that run lands
+    unprocessed = list(stored.items())
+    unprocessed += [
+        (digest, storage.StoredFile(existing.url, existing.storage_key))
+        for digest, existing in known.items()
+        if not existing.variants
+    ]
+    await images_service.pipeline.submit(unprocessed, on_updated=_invalidate_cached_reads)
 
-    db.refresh(new_property)
+    await db.refresh(new_property, ["images"])
+    search.index_property(db, new_property)
+    _invalidate_cached_reads(new_property.id)
     return new_property
 
 
-@router.get("/", response_model=List[schemas.PropertyOut])
-def list_properties(db: Session = Depends(database.get_db)):
-    return db.query(models.Property).all()
+def _index_imported(db: AsyncSession, imported):
+    for prop in imported:
+        search.index_property(db, prop)
+        facets.facet_cache.property_added(facets.snapshot(prop))
+    response_cache.bump(LIST_CACHE_NAMESPACE)
+
+
+@router.post("/import", response_model=schemas.ImportJobOut)
+async def import_properties(
+    request: Request,
+    format: Optional[schemas.ImportFormat] = None,
+    db: AsyncSession = Depends(database.get_write_db),
+    current_user: models.User = Depends(security.get_current_agency)
+):
+    """Bulk-create listings from a CSV or NDJSON request body.
+
+    The body is parsed as it streams in and committed in chunks, so memory
+    stays flat whatever the file size. CSV needs a header with title,
+    description, price and location, plus optional image_urls separated by
+    "|". Images are fetched in the background; poll the job for progress.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = schemas.ImportFormat.csv if "csv" in content_type else schemas.ImportFormat.ndjson
+
+    job = models.ImportJob(owner_id=current_user.id, format=format.value, status=models.ImportStatus.running)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    await imports.BulkImporter(db, job, on_chunk=_index_imported).run(request.stream())
+    if job.images_queued:
+        await imports.image_fetcher.submit(job.id)
+    return job
+
+
+@router.get("/imports/{job_id}", response_model=schemas.ImportJobOut)
+async def get_import(
+    job_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(security.get_current_agency)
+):
+    job = await db.get(models.ImportJob, job_id)
+    if not job or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return job
+
+
+@router.get("/export")
+async def export_properties(
+    request: Request,
+    format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+    gzip: bool = False,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    current_user: models.User = Depends(security.get_current_agency)
+):
+    """Stream every listing the agency owns, with image URLs, as CSV or NDJSON."""
+    query = exports.property_query(current_user.id, created_after, created_before)
+    chunks = exports.stream_rows(
+        query, exports.PROPERTY_COLUMNS, format, compress=gzip, decorate=exports.attach_image_urls,
+        primary=pinned_to_primary(request),
+    )
+    return exports.export_response(chunks, format, "properties", compress=gzip)
+
+
+def _pin_query(where, limit: int, min_price: Optional[int], max_price: Optional[int]):
+    Property = models.Property
+    query = select(
+        Property.id, Property.title, Property.price, Property.location, Property.latitude, Property.longitude
+    ).where(where)
+    return filter_properties(query, min_price, max_price).limit(limit)
+
+
+@router.get("/nearby", response_model=schemas.PropertyPinPage)
+async def properties_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=geo.GEO_MAX_RADIUS_KM),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=geo.GEO_MAX_RESULTS),
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """Listings within ``radius_km`` of a point, nearest first."""
+    box = geo.radius_box(lat, lng, radius_km)
+    rows = (await db.execute(_pin_query(geo.box_filter(box), geo.GEO_MAX_CANDIDATES + 1, min_price, max_price))).all()
+    # The box's corners lie outside the circle; exact distances decide
+    pins = []
+    for row in rows[:geo.GEO_MAX_CANDIDATES]:
+        distance = geo.distance_km(lat, lng, row.latitude, row.longitude)
+        if distance <= radius_km:
+            pins.append({**row._mapping, "distance_km": round(distance, 3)})
+    pins.sort(key=lambda pin: pin["distance_km"])
+    truncated = len(pins) > limit or len(rows) > geo.GEO_MAX_CANDIDATES
+    return {"items": pins[:limit], "truncated": truncated}
+
+
+@router.get("/within", response_model=schemas.PropertyPinPage)
+async def properties_within(
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    limit: int = Query(geo.GEO_MAX_RESULTS, ge=1, le=geo.GEO_MAX_RESULTS),
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """Listings inside a map viewport; ``west > east`` crosses the antimeridian."""
+    if south > north:
+        raise HTTPException(status_code=400, detail="south must not be greater than north")
+    box = geo.Box(south, west, north, east)
+    # No ORDER BY: sorting would make the database read every match before the limit
+    rows = (await db.execute(_pin_query(geo.box_filter(box), limit + 1, min_price, max_price))).all()
+    return {"items": [row._mapping for row in rows[:limit]], "truncated": len(rows) > limit}
+
+
+def filter_properties(
+    query,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    location: Optional[str] = None,
+    owner_id: Optional[int] = None,
+):
+    """Apply the listing filters shared by the list and aggregate endpoints."""
+    if min_price is not None:
+        query = query.filter(models.Property.price >= min_price)
+    if max_price is not None:
+        query = query.filter(models.Property.price <= max_price)
+    if location:
+        # Matches ix_properties_location_prefix on PostgreSQL. The pattern is
+        # inlined: the planner can only turn LIKE into an index range when it
+        # sees the prefix, which a generic plan for a bound parameter doesn't
+        escaped = location.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = bindparam("location_prefix", f"{escaped}%", literal_execute=True)
+        query = query.filter(func.lower(models.Property.location).like(pattern, escape="\\"))
+    if owner_id is not None:
+        query = query.filter(models.Property.owner_id == owner_id)
+    return query
+
+
+def _apply_keyset(query, sort: schemas.PropertySort, cursor: Optional[str]):
+    Property = models.Property
+    if sort == schemas.PropertySort.price_asc:
+        order_by = (Property.price.asc(), Property.id.asc())
+    elif sort == schemas.PropertySort.price_desc:
+        order_by = (Property.price.desc(), Property.id.desc())
+    elif sort == schemas.PropertySort.oldest:
+        order_by = (Property.id.asc(),)
+    else:
+        order_by = (Property.id.desc(),)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            last_id = int(values["id"])
+            last_price = int(values["price"]) if "price" in values else None
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        if sort in (schemas.PropertySort.price_asc, schemas.PropertySort.price_desc):
+            if last_price is None:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            if sort == schemas.PropertySort.price_asc:
+                query = query.filter(or_(
+                    Property.price > last_price,
+                    and_(Property.price == last_price, Property.id > last_id),
+                ))
+            else:
+                query = query.filter(or_(
+                    Property.price < last_price,
+                    and_(Property.price == last_price, Property.id < last_id),
+                ))
+        elif sort == schemas.PropertySort.oldest:
+            query = query.filter(Property.id > last_id)
+        else:
+            query = query.filter(Property.id < last_id)
+
+    return query.order_by(*order_by)
+
+
+async def _get_property_with_images(db: AsyncSession, id: int):
+    return await db.scalar(
+        select(models.Property)
+        .options(selectinload(models.Property.images))
+        .where(models.Property.id == id)
+    )
+
+
+def _next_cursor(sort: schemas.PropertySort, last) -> str:
+    if sort in (schemas.PropertySort.price_asc, schemas.PropertySort.price_desc):
+        return encode_cursor({"price": last.price, "id": last.id})
+    return encode_cursor({"id": last.id})
+
+
+@router.get("/", response_model=schemas.PropertyPage)
+async def list_properties(
+    request: Request,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    location: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    sort: schemas.PropertySort = schemas.PropertySort.newest,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=STREAM_MAX_PAGE_SIZE),
+    stream: bool = False,
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """With ``stream=true`` the page is sent as its rows are read, uncached,
+    and may hold up to STREAM_MAX_PAGE_SIZE listings."""
+    check_page_size(limit, stream)
+    # Plain column rows, not entities: the page is encoded without ORM hydration
+    query = select(*row_serializers.property_columns())
+    query = filter_properties(query, min_price, max_price, location, owner_id)
+    query = _apply_keyset(query, sort, cursor)
+    if stream:
+        chunks = row_serializers.stream_page(
+            query, limit, row_serializers.property_dicts, lambda last: _next_cursor(sort, last),
+            primary=pinned_to_primary(request),
+        )
+        return StreamingResponse(chunks, media_type="application/json")
+
+    async def build():
+        # Fetch one extra row to know whether another page exists
+        rows = (await db.execute(query.limit(limit + 1))).all()
+        next_cursor = _next_cursor(sort, rows[limit - 1]) if len(rows) > limit else None
+        items = await row_serializers.property_dicts(db, rows[:limit])
+        return row_serializers.dumps({"items": items, "next_cursor": next_cursor})
+
+    generation = response_cache.generation(LIST_CACHE_NAMESPACE)
+    params = urlencode(sorted(request.query_params.multi_items()))
+    return await cached_json_response(request, f"{LIST_CACHE_NAMESPACE}:{generation}:{params}", build, generation)
+
+
+@router.get("/search", response_model=List[schemas.PropertyOut])
+async def search_properties(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    results = await search.search_properties(db, q, limit, offset)
+    adapter = schemas.PropertyOutList
+    return Response(adapter.dump_json(adapter.validate_python(results, from_attributes=True)), media_type="application/json")
 
 
 @router.get("/{id}", response_model=schemas.PropertyOut)
-def get_property(id: int, db: Session = Depends(database.get_db)):
-    prop = db.query(models.Property).filter(models.Property.id == id).first()
-    if not prop:
-        raise HTTPException(status_code=404, detail="Property not found")
-    return prop
+async def get_property(id: int, request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    async def build():
+        prop = await _get_property_with_images(db, id)
+        if not prop:
+            raise HTTPException(status_code=404, detail="Property not found")
+        return schemas.PropertyOut.model_validate(prop, from_attributes=True).model_dump_json().encode()
+
+    namespace = _detail_namespace(id)
+    generation = response_cache.generation(namespace)
+    return await cached_json_response(request, f"{namespace}:{generation}", build, generation)
 
 
 @router.put("/{id}", response_model=schemas.PropertyOut)
-def update_property(
+async def update_property(
     id: int,
     update_data: schemas.PropertyUpdate,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_write_db),
     current_user: models.User = Depends(security.get_current_agency)
 ):
-    prop = db.query(models.Property).filter(models.Property.id == id).first()
+    prop = await _get_property_with_images(db, id)
     if not prop:
         raise HTTPException(status_code=404, detail="Property not found")
     if prop.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    for field, value in update_data.dict(exclude_unset=True).items():
+    before = facets.snapshot(prop)
+    for field, value in update_data.model_dump(exclude_unset=True).items():
         setattr(prop, field, value)
+    prop.geocell = geo.geocell(prop.latitude, prop.longitude)
 
-    db.commit()
-    db.refresh(prop)
+    await db.commit()
+    search.index_property(db, prop)
+    facets.facet_cache.property_changed(before, facets.snapshot(prop))
+    _invalidate_cached_reads(prop.id)
     return prop
 
 
 @router.delete("/{id}")
-def delete_property(
+async def delete_property(
     id: int,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_write_db),
     current_user: models.User = Depends(security.get_current_agency)
 ):
-    prop = db.query(models.Property).filter(models.Property.id == id).first()
+    prop = await _get_property_with_images(db, id)
     if not prop:
         raise HTTPException(status_code=404, detail="Property not found")
     if prop.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db.delete(prop)
-    db.commit()
+    removed = facets.snapshot(prop)
+    await db.delete(prop)
+    await db.commit()
+    search.unindex_property(db, id)
+    facets.facet_cache.property_removed(removed)
+    _invalidate_cached_reads(id)
     return {"message": "Property deleted successfully"}
@@ -1,6 +1,7 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, EmailStr, constr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, TypeAdapter, constr, field_validator, model_validator
 from enum import Enum
 
 
@@ -36,17 +37,13 @@ class UserOut(BaseModel):
     is_verified: bool
     role: UserRole
 
-    class Config:
-        orm_mode = True
-
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UpdateProfile(BaseModel):
-    username: Optional[str]
-    email: Optional[EmailStr]
-    agency_name: Optional[str]
-    agency_address: Optional[str]
+    username: Optional[str] = None
+    email: Optional[EmailStr] = None
+    agency_name: Optional[str] = None
+    agency_address: Optional[str] = None
 
 # ========== AUTH SCHEMAS ==========
 
@@ -69,28 +66,61 @@ class ForgotPasswordRequest(BaseModel):
 
 # ========== PROPERTY IMAGE SCHEMAS ==========
 
+class ImageVariantOut(BaseModel):
+    url: str
+    width: int
+    height: int
+
+
 class PropertyImageOut(BaseModel):
     id: int
     url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # Empty until the background pipeline has produced the resized copies
+    variants: Dict[str, ImageVariantOut] = {}
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+    @field_validator("variants", mode="before")
+    @classmethod
+    def _missing_variants(cls, value):
+        return value or {}
 
 
 # ========== PROPERTY SCHEMAS ==========
 
+def _check_coordinates(model):
+    if (model.latitude is None) != (model.longitude is None):
+        raise ValueError("latitude and longitude must be given together")
+    return model
+
+
 class PropertyBase(BaseModel):
     title: str
     description: str
     price: int
     location: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def _coordinates_together(self):
+        return _check_coordinates(self)
 
 class BecomeAgency(BaseModel):
     agency_name: str
     agency_address: str
 
 
+# What the columns hold: String(255) text and a 32-bit INTEGER price
+PRICE_MAX = 2**31 - 1
+
+
 class PropertyCreate(PropertyBase):
+    title: str = Field(max_length=255)
+    price: int = Field(ge=0, le=PRICE_MAX)
+    location: str = Field(max_length=255)
     image_urls: List[str]
 
 
@@ -99,17 +129,114 @@ class PropertyOut(PropertyBase):
     owner_id: int
     images: List[PropertyImageOut] = []
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Built once: validates ORM objects and dumps JSON bytes in pydantic-core
+PropertyOutList = TypeAdapter(List[PropertyOut])
+
+
+class PropertySort(str, Enum):
+    newest = "newest"
+    oldest = "oldest"
+    price_asc = "price_asc"
+    price_desc = "price_desc"
+
+
+class PropertyPage(BaseModel):
+    items: List[PropertyOut]
+    next_cursor: Optional[str] = None
+
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+
+class PriceBucketFacet(BaseModel):
+    min_price: int
+    max_price: Optional[int] = None
+    count: int
+
+
+class OwnerFacet(BaseModel):
+    owner_id: int
+    count: int
+
+
+class PropertyFacets(BaseModel):
+    total: int
+    locations: List[FacetValue]
+    price_buckets: List[PriceBucketFacet]
+    owners: List[OwnerFacet]
 
 
 class PropertyUpdate(BaseModel):
-    title: Optional[str] = None
+    title: Optional[str] = Field(None, max_length=255)
     description: Optional[str] = None
-    price: Optional[int] = None
-    location: Optional[str] = None
+    price: Optional[int] = Field(None, ge=0, le=PRICE_MAX)
+    location: Optional[str] = Field(None, max_length=255)
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def _coordinates_together(self):
+        return _check_coordinates(self)
 
 
+class PropertyPin(BaseModel):
+    """What a map marker needs, without images."""
+    id: int
+    title: str
+    price: int
+    location: str
+    latitude: float
+    longitude: float
+    distance_km: Optional[float] = None
+
+
+class PropertyPinPage(BaseModel):
+    items: List[PropertyPin]
+    # More listings matched than were returned; zoom in to see them all
+    truncated: bool = False
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ImportJobOut(BaseModel):
+    id: int
+    format: str
+    status: str
+    rows_total: int
+    rows_imported: int
+    rows_failed: int
+    errors: List[ImportRowError] = []
+    images_queued: int
+    images_fetched: int
+    images_failed: int
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @field_validator("status", mode="before")
+    @classmethod
+    def _status_value(cls, value):
+        return getattr(value, "value", value)
+
 
 # ========== MESSAGE SCHEMAS ==========
 
@@ -126,7 +253,37 @@ class MessageOut(MessageBase):
     id: int
     sender_id: int
     receiver_id: int
-    property_id: int
+    property_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    read_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class MessagePage(BaseModel):
+    items: List[MessageOut]
+    next_cursor: Optional[str] = None
+
+
+class ConversationOut(BaseModel):
+    peer_id: int
+    property_id: Optional[int] = None
+    unread_count: int
+    last_message: MessageOut
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ConversationPage(BaseModel):
+    items: List[ConversationOut]
+    next_cursor: Optional[str] = None
+
+
+class MarkRead(BaseModel):
+    peer_id: int
+    property_id: Optional[int] = None
+    up_to_id: Optional[int] = None
+
 
-    class Config:
-        orm_mode = True
+class UnreadCount(BaseModel):
+    unread: int
@@ -2,42 +2,106 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.models import User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from app.config.settings import get_settings
+from app.database import get_async_db
+from app.models.models import User, UserRole
+from app.services.cache import LRUCache
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import os
+import asyncio
+import hmac
 
-SECRET_KEY = os.getenv("SECRET_KEY", "defaultsecretkey")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+settings = get_settings()
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+# Hash jobs allowed running or queued per process before callers get a 503
+PASSWORD_HASH_MAX_PENDING = settings.password_hash_max_pending
+PRINCIPAL_CACHE_SIZE = settings.principal_cache_size
+# Bounds how long another worker can serve a user changed elsewhere
+PRINCIPAL_CACHE_TTL = settings.principal_cache_ttl
+INTERNAL_TOKEN = settings.internal_token
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS marks older hashes as needing an update; login rehashes them
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# Detached User snapshots keyed by token subject (email)
+principal_cache = LRUCache(PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+# Identity taken from a cached user, without a database round trip
+Principal = namedtuple("Principal", "id email role")
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# bcrypt releases the GIL, so a small thread pool hashes in parallel while
+# keeping CPU-heavy work off the event loop and the default threadpool
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+async def _run_hash_job(func, *args):
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hash_job(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hash_job(verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash is outdated."""
+    return await _run_hash_job(pwd_context.verify_and_update, plain_password, hashed_password)
+
+def password_hash_stats() -> dict:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "pending": _hash_pending,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "rounds": BCRYPT_ROUNDS,
+    }
+
+def user_token_claims(user: User) -> dict:
+    role = getattr(user.role, "value", user.role)
+    return {"sub": user.email, "user_id": user.id, "role": role}
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=15))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_user_by_token(token: str, db: Session):
+async def get_user_by_token(token: str, db: AsyncSession):
     try:
         payload = jwt.decode(token, SECRET_KEY, ALGORITHM)
         user_id = payload.get("user_id")
         if not user_id:
             return None
-        return db.query(User).filter(User.id == user_id).first()
+        return await db.get(User, user_id)
     except JWTError:
         return None
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid credentials",
@@ -48,16 +112,58 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         email: str = payload.get("sub")
         if not email:
             raise credentials_exception
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise credentials_exception
-        return user
     except JWTError:
         raise credentials_exception
 
+    cached = principal_cache.get(email)
+    if cached is not None:
+        # Attach a copy to this session without emitting a SELECT
+        return await db.merge(cached, load=False)
+
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user:
+        raise credentials_exception
+    principal_cache.set(email, _detached_copy(user))
+    return user
+
+def _detached_copy(user: User) -> User:
+    copy = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+    make_transient_to_detached(copy)
+    return copy
+
+def invalidate_principal(*emails: str):
+    """Drop cached users after a change to their row (profile, role, password)."""
+    for email in emails:
+        if email:
+            principal_cache.delete(email)
+
 # ----- ROLE-BASED ACCESS -----
-def get_current_agency(current_user: User = Depends(get_current_user)) -> User:
-    if current_user.role != "agency":
+async def get_current_agency(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """The role is read from the principal cache, not the token's role claim, so a
+    demoted or deleted user loses access as soon as their entry is dropped here,
+    and within PRINCIPAL_CACHE_TTL on other workers."""
+    try:
+        email = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        email = None
+    cached = principal_cache.get(email) if email else None
+    if cached is not None:
+        # Agency writes on a cache hit skip the user lookup and the session merge
+        if cached.role != UserRole.agency:
+            raise HTTPException(status_code=403, detail="Only agencies allowed")
+        return Principal(cached.id, cached.email, cached.role)
+
+    current_user = await get_current_user(token, db)
+    if current_user.role != UserRole.agency:
         raise HTTPException(status_code=403, detail="Only agencies allowed")
     return current_user
 
+async def require_internal_access(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Guards /internal and /metrics: INTERNAL_TOKEN as the bearer token (for
+    scrapers), or an admin's access token."""
+    if INTERNAL_TOKEN and hmac.compare_digest(token.encode(), INTERNAL_TOKEN.encode()):
+        return None
+    current_user = await get_current_user(token, db)
+    if current_user.role != UserRole.admin:
+        raise HTTPException(status_code=403, detail="Only admins allowed")
+    return current_user
@@ -0,0 +1,287 @@
+"""Admission control: per-route concurrency limits and token-bucket rate limits.
+
+Expensive routes (bcrypt logins and signups, uploads, imports) each get
+their own concurrency limit with a short bounded queue, configured in
+ADMISSION_LIMITS. When one of them spikes, its excess is shed with a fast
+503 and a Retry-After estimate. Its queue never grows without bound, and
+unlisted routes such as cheap reads keep their latency. RATE_LIMITS
+applies per-client token buckets and answers 429. The websocket handler
+uses the same buckets for message rates.
+
+Behind a proxy every request arrives from the proxy's address, so when the
+peer is listed in FORWARDED_ALLOW_IPS the client is taken from
+X-Forwarded-For instead: the nearest hop that is not itself a trusted proxy.
+"""
+import asyncio
+import ipaddress
+import json
+import math
+import time
+from collections import OrderedDict, deque
+
+from starlette.datastructures import Headers
+
+from app.config.settings import get_settings
+from app.services.metrics import registry
+
+settings = get_settings()
+ADMISSION_QUEUE_TIMEOUT = settings.admission_queue_timeout
+WS_MESSAGE_RATE = settings.ws_message_rate
+WS_MESSAGE_BURST = settings.ws_message_burst
+# Buckets kept per rate limit; the least recently seen clients are forgotten first
+RATE_LIMIT_MAX_CLIENTS = 10_000
+# Same spelling as uvicorn's --forwarded-allow-ips: addresses or networks, or "*"
+FORWARDED_ALLOW_IPS = [entry.strip() for entry in settings.forwarded_allow_ips.split(",") if entry.strip()]
+TRUST_ALL_PROXIES = "*" in FORWARDED_ALLOW_IPS
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry, strict=False) for entry in FORWARDED_ALLOW_IPS if entry != "*"
+]
+
+admission_in_flight = registry.gauge(
+    "admission_in_flight", "Requests running under a concurrency limit.", ("route",)
+)
+admission_queue_depth = registry.gauge(
+    "admission_queue_depth", "Requests waiting for a concurrency slot.", ("route",)
+)
+admission_wait = registry.histogram(
+    "admission_wait_seconds", "Time admitted requests spent queued.", ("route",)
+)
+admission_rejected = registry.counter(
+    "admission_rejected_total", "Requests and messages shed by admission control.", ("route", "reason")
+)
+
+
+def parse_routes(spec: str) -> dict:
+    """``"POST /auth/login=8:32,..."`` -> ``{("POST", "/auth/login"): (8.0, 32.0)}``."""
+    routes = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        route, _, values = entry.partition("=")
+        method, path = route.split()
+        first, _, second = values.partition(":")
+        routes[(method.upper(), path)] = (float(first), float(second))
+    return routes
+
+
+def _trusted_proxy(address: str) -> bool:
+    if TRUST_ALL_PROXIES:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_address(scope) -> str:
+    """The address rate limits are keyed by: the peer's, unless it is a trusted proxy."""
+    address = (scope.get("client") or ("unknown",))[0]
+    if not _trusted_proxy(address):
+        return address
+    hops = [
+        hop.strip()
+        for value in Headers(scope=scope).getlist("x-forwarded-for")
+        for hop in value.split(",")
+        if hop.strip()
+    ]
+    # Rightmost first: each trusted proxy appended the address it received from
+    for hop in reversed(hops):
+        address = hop
+        if not _trusted_proxy(hop):
+            break
+    return address
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` holders; up to ``queue`` more wait in FIFO order for ``timeout`` seconds."""
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Smoothed seconds per request, for Retry-After estimates
+        self.service_time = 0.1
+        self._waiters = deque()
+
+    def retry_after(self) -> int:
+        """Seconds for the current backlog to drain at the observed service time."""
+        backlog = self.in_flight + len(self._waiters)
+        return max(1, math.ceil(self.service_time * backlog / self.limit))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise Rejected(503, reason, self.retry_after())
+
+    def _gauges(self):
+        admission_in_flight.set((self.name,), self.in_flight)
+        admission_queue_depth.set((self.name,), len(self._waiters))
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            self._gauges()
+            return
+        if len(self._waiters) >= self.queue:
+            self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._gauges()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout")
+        except BaseException:
+            # Cancelled (client gone) after release() handed us the slot: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._hand_off()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._gauges()
+        self.admitted += 1
+        admission_wait.observe((self.name,), time.perf_counter() - started)
+
+    def release(self, seconds: float):
+        self.service_time = 0.8 * self.service_time + 0.2 * seconds
+        self._hand_off()
+
+    def _hand_off(self):
+        # The slot moves straight to the next waiter, so in_flight is unchanged
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._gauges()
+                return
+        self.in_flight -= 1
+        self._gauges()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "service_time": round(self.service_time, 4),
+        }
+
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``burst``, tracked separately per key."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._buckets = OrderedDict()
+
+    def take(self, key) -> float:
+        """Spend a token: 0 if one was available, else seconds until there is one."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.rejected += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets), "rejected": self.rejected}
+
+
+limiters = {
+    route: ConcurrencyLimiter(" ".join(route), int(limit), int(queue))
+    for route, (limit, queue) in parse_routes(settings.admission_limits).items()
+}
+rate_limits = {
+    route: TokenBucket(per_minute / 60, int(burst))
+    for route, (per_minute, burst) in parse_routes(settings.rate_limits).items()
+}
+# Keyed by user, so opening more sockets doesn't buy more messages
+ws_message_bucket = TokenBucket(WS_MESSAGE_RATE, WS_MESSAGE_BURST)
+
+
+def stats() -> dict:
+    return {
+        "limits": {limiter.name: limiter.stats() for limiter in limiters.values()},
+        "rate_limits": {" ".join(route): bucket.stats() for route, bucket in rate_limits.items()},
+        "websocket_messages": ws_message_bucket.stats(),
+    }
+
+
+async def _send_rejection(send, status: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Applies ``rate_limits`` and ``limiters`` to matching HTTP requests (pure ASGI)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = (scope["method"], scope["path"])
+        name = " ".join(route)
+
+        bucket = rate_limits.get(route)
+        if bucket is not None:
+            wait = bucket.take(client_address(scope))
+            if wait:
+                admission_rejected.inc((name, "rate_limit"))
+                await _send_rejection(send, 429, "Too many requests, retry later", math.ceil(wait))
+                return
+
+        limiter = limiters.get(route)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await limiter.acquire()
+        except Rejected as exc:
+            admission_rejected.inc((name, exc.reason))
+            await _send_rejection(send, exc.status, "Server busy, retry later", exc.retry_after)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - started)
@@ -0,0 +1,265 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from fastapi import Request, Response
+
+from app.config.settings import get_settings
+
+settings = get_settings()
+RESPONSE_CACHE_BACKEND = settings.response_cache_backend
+RESPONSE_CACHE_MAX_ENTRIES = settings.response_cache_max_entries
+RESPONSE_CACHE_MAX_BYTES = settings.response_cache_max_bytes
+RESPONSE_CACHE_TTL = settings.response_cache_ttl
+
+CachedResponse = namedtuple("CachedResponse", "etag body")
+
+
+class CacheBackend:
+    """Storage interface for cached values.
+
+    The in-process LRU below is the default; a shared cache (Redis, memcached)
+    only has to implement these four methods to be plugged in through
+    ``configure_response_cache``.
+    """
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class NullCache(CacheBackend):
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe LRU with per-entry TTL, bounded by entry count and total size."""
+
+    def __init__(self, max_entries: int, ttl: float = None, max_bytes: int = None, weigher=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.weigher = weigher or _default_weigher
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, weight, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        weight = self.weigher(value)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.max_bytes is not None and weight > self.max_bytes:
+                return
+            self._entries[key] = (expires_at, weight, value)
+            self._size += weight
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._size > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _pop(self, key):
+        _, weight, _ = self._entries.pop(key)
+        self._size -= weight
+
+
+def _default_weigher(value):
+    if isinstance(value, CachedResponse):
+        return len(value.body) + len(value.etag)
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 1
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    candidates = (value.strip() for value in if_none_match.split(","))
+    return any(value.removeprefix("W/") == etag for value in candidates)
+
+
+class ResponseCache:
+    """Serialized response bodies with strong ETags.
+
+    Keys embed a generation number per namespace (the paginated list, each
+    single resource) that writes bump, so old bodies become unreachable and
+    age out of the backend. A body built from rows read before a write is
+    stored under the generation it started with, so it is never served after
+    that write.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        cached = self.backend.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def put(self, key: str, body: bytes) -> CachedResponse:
+        cached = CachedResponse(make_etag(body), body)
+        self.backend.set(key, cached)
+        return cached
+
+    def invalidate(self, *keys: str):
+        for key in keys:
+            self.backend.delete(key)
+
+    def generation(self, namespace: str) -> int:
+        key = f"{namespace}:generation"
+        generation = self.backend.get(key)
+        if generation is None:
+            # Never reuse a generation an evicted counter may have handed out
+            generation = time.time_ns()
+            self.backend.set(key, generation, ttl=0)
+        return generation
+
+    def bump(self, namespace: str):
+        self.backend.set(f"{namespace}:generation", time.time_ns(), ttl=0)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "backend": self.backend.stats(),
+        }
+
+
+def _default_backend() -> CacheBackend:
+    if RESPONSE_CACHE_BACKEND == "none":
+        return NullCache()
+    return LRUCache(
+        RESPONSE_CACHE_MAX_ENTRIES,
+        ttl=RESPONSE_CACHE_TTL,
+        max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    )
+
+
+response_cache = ResponseCache(_default_backend())
+
+
+def configure_response_cache(backend: CacheBackend):
+    response_cache.backend = backend
+
+
+def _complete_since(request: Request, written_at) -> bool:
+    """Whether a body built for ``request`` saw every write up to ``written_at`` (ns)."""
+    if not getattr(request.state, "read_from_replica", False):
+        return True
+    caught_up_at = request.state.replica_caught_up_at
+    return caught_up_at is not None and written_at is not None and caught_up_at * 1e9 > written_at
+
+
+async def cached_json_response(request: Request, key: str, build, written_at: int = None) -> Response:
+    """Serve ``key`` from the response cache, awaiting ``build()`` for the body on a miss.
+
+    ``written_at`` is the key's generation: the time (ns) of the last write it
+    covers. A client pinned to the primary after a write skips the lookup,
+    since a cached body may come from a replica that lacks that write. A body
+    read from the replica is only stored once the replica had caught up past
+    ``written_at``; otherwise it is served to this client alone.
+    """
+    cached = None if getattr(request.state, "pinned_to_primary", False) else response_cache.get(key)
+    if cached is None:
+        body = await build()
+        if _complete_since(request, written_at):
+            cached = response_cache.put(key, body)
+        else:
+            cached = CachedResponse(make_etag(body), body)
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        response_cache.record_not_modified()
+        # What the 200 would have carried, so compression can give the 304 the same ETag
+        request.state.not_modified_representation = ("application/json", len(cached.body))
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
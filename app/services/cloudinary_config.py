@@ -1,12 +1,17 @@
+from functools import lru_cache
+
 import cloudinary
-import cloudinary.uploader
-import os
-from dotenv import load_dotenv
 
-load_dotenv()  # Load from .env
+from app.config.settings import get_settings
+
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
+@lru_cache
+def configure_cloudinary():
+    """Apply credentials on first use so importing the app never touches Cloudinary."""
+    settings = get_settings()
+    cloudinary.config(
+        cloud_name=settings.cloudinary_cloud_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret
+    )
+    return cloudinary
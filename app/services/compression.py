@@ -0,0 +1,244 @@
+"""Accept-Encoding negotiation and response compression (gzip, brotli, zstd).
+
+Only media types listed in COMPRESSION_LEVELS are compressed, each at its
+own level. Whole bodies are compressed when they reach COMPRESSION_MIN_SIZE.
+Streamed bodies are compressed chunk by chunk, with a flush after every
+chunk, so the client can decode each one as it arrives. Responses that are
+already encoded (the gzip exports, for instance) pass through untouched.
+
+A compressed response's ETag is made weak. ``etag_matches`` compares
+If-None-Match weakly, so revalidating a cached page still gets a 304, and
+the 304 is given the ETag its 200 would have had: weak only if that body
+would have been compressed. The 304's producer records the media type and
+size of the body it stands for in ``request.state.not_modified_representation``;
+without it the ETag is weakened whenever an encoding was negotiated. The
+compressed bytes of ETagged bodies are cached by (ETag, encoding, level),
+so response-cache hits are not compressed again.
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config.settings import get_settings
+from app.services.cache import LRUCache
+from app.services.metrics import registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+settings = get_settings()
+COMPRESSION_MIN_SIZE = settings.compression_min_size
+COMPRESSION_CACHE_MAX_BYTES = settings.compression_cache_max_bytes
+COMPRESSION_LEVELS = {}
+for entry in settings.compression_levels.split(","):
+    if entry.strip():
+        media_type, _, level = entry.partition("=")
+        COMPRESSION_LEVELS[media_type.strip().lower()] = int(level)
+
+compression_input = registry.counter(
+    "compression_input_bytes_total", "Response bytes before compression.", ("encoding",)
+)
+compression_output = registry.counter(
+    "compression_output_bytes_total", "Response bytes after compression.", ("encoding",)
+)
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._stream = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._stream.compress(data)
+
+    def flush(self) -> bytes:
+        return self._stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._stream.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        self._stream = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._stream.process(data)
+
+    def flush(self) -> bytes:
+        return self._stream.flush()
+
+    def finish(self) -> bytes:
+        return self._stream.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._stream = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._stream.compress(data)
+
+    def flush(self) -> bytes:
+        return self._stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._stream.flush()
+
+
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+# Server preference, limited to what is installed
+ENCODINGS = [name.strip() for name in settings.compression_encodings.split(",") if name.strip() in COMPRESSORS]
+
+compressed_cache = LRUCache(max_entries=4096, max_bytes=COMPRESSION_CACHE_MAX_BYTES)
+
+
+def negotiate(accept_encoding: str):
+    """The encoding to use for ``accept_encoding``, or None to send identity."""
+    weights = {}
+    for entry in accept_encoding.split(","):
+        name, *params = entry.strip().split(";")
+        weight = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    # Strictly greater, so ties go to the earlier (preferred) encoding
+    for name in ENCODINGS:
+        weight = weights.get(name, wildcard)
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int, etag: str = None) -> bytes:
+    key = (etag, encoding, level)
+    if etag is not None:
+        cached = compressed_cache.get(key)
+        if cached is not None:
+            return cached
+    compressor = COMPRESSORS[encoding](level)
+    compressed = compressor.compress(body) + compressor.finish()
+    if etag is not None:
+        compressed_cache.set(key, compressed)
+    return compressed
+
+
+def _compressible(media_type: str, size: int = None) -> bool:
+    """Whether a body is compressed; ``size`` is None for a streamed one."""
+    return media_type in COMPRESSION_LEVELS and (size is None or size >= COMPRESSION_MIN_SIZE)
+
+
+def _media_type(headers) -> str:
+    return headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+def _weak(headers: MutableHeaders):
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = "W/" + etag
+
+
+def stats() -> dict:
+    return {
+        "encodings": ENCODINGS,
+        "min_size": COMPRESSION_MIN_SIZE,
+        "levels": COMPRESSION_LEVELS,
+        "cache": compressed_cache.stats(),
+    }
+
+
+class CompressionMiddleware:
+    """Compresses HTTP responses with the client's preferred encoding (pure ASGI)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        compressor = None
+        media_type = None
+        level = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, media_type, level, passthrough
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if message["status"] == 304:
+                    # Same validator as the 200 the client holds: weak only if that was compressed
+                    representation = scope.get("state", {}).get("not_modified_representation")
+                    if encoding and (representation is None or _compressible(*representation)):
+                        _weak(headers)
+                    passthrough = True
+                elif "content-encoding" in headers:
+                    passthrough = True
+                else:
+                    media_type = _media_type(headers)
+                    level = COMPRESSION_LEVELS.get(media_type)
+                    if level is None:
+                        passthrough = True
+                    else:
+                        headers.add_vary_header("Accept-Encoding")
+                        passthrough = encoding is None
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(scope=start)
+                if not more_body:
+                    # The whole body in one message: compress it if it's worth it
+                    if _compressible(media_type, len(body)):
+                        compressed = compress(body, encoding, level, headers.get("etag"))
+                        compression_input.inc((encoding,), len(body))
+                        compression_output.inc((encoding,), len(compressed))
+                        body = compressed
+                        headers["content-encoding"] = encoding
+                        headers["content-length"] = str(len(body))
+                        _weak(headers)
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    start = None
+                    passthrough = True
+                    return
+                compressor = COMPRESSORS[encoding](level)
+                headers["content-encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                _weak(headers)
+                await send(start)
+                start = None
+
+            chunk = compressor.compress(body) + (compressor.flush() if more_body else compressor.finish())
+            compression_input.inc((encoding,), len(body))
+            compression_output.inc((encoding,), len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import models
+
+
+def _thread(user_id: int, peer_id: int, property_id):
+    Conversation = models.Conversation
+    if property_id is None:
+        same_property = Conversation.property_id.is_(None)
+    else:
+        same_property = Conversation.property_id == property_id
+    return and_(Conversation.user_id == user_id, Conversation.peer_id == peer_id, same_property)
+
+
+async def record_messages(db: AsyncSession, rows):
+    """Fold freshly inserted messages into both participants' conversations.
+
+    Runs inside the inserting transaction, so counters commit atomically with
+    the messages. Rows are aggregated per thread first: a batch costs one
+    UPDATE per touched thread, not one per message.
+    """
+    threads = defaultdict(lambda: [0, 0])
+    for row in rows:
+        receiver_view = threads[(row.receiver_id, row.sender_id, row.property_id)]
+        receiver_view[0] = max(receiver_view[0], row.id)
+        receiver_view[1] += 1
+        sender_view = threads[(row.sender_id, row.receiver_id, row.property_id)]
+        sender_view[0] = max(sender_view[0], row.id)
+
+    for (user_id, peer_id, property_id), (last_message_id, unread) in threads.items():
+        await _bump(db, user_id, peer_id, property_id, last_message_id, unread)
+
+
+async def _bump(db, user_id, peer_id, property_id, last_message_id, unread):
+    Conversation = models.Conversation
+    statement = (
+        update(Conversation)
+        .where(_thread(user_id, peer_id, property_id))
+        .values(
+            # Writers in other processes may commit out of id order
+            last_message_id=case(
+                (Conversation.last_message_id < last_message_id, last_message_id),
+                else_=Conversation.last_message_id,
+            ),
+            unread_count=Conversation.unread_count + unread,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(statement)
+    if result.rowcount:
+        return
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(Conversation).values(
+                user_id=user_id,
+                peer_id=peer_id,
+                property_id=property_id,
+                last_message_id=last_message_id,
+                unread_count=unread,
+            ))
+    except IntegrityError:
+        # Another writer created the thread first; add to it instead
+        await db.execute(statement)
+
+
+async def mark_read(db: AsyncSession, user_id: int, peer_id: int, property_id=None, up_to_id: int = None) -> int:
+    """Stamp read_at on the thread's unread messages and decrement its counter."""
+    Message = models.Message
+    conditions = [
+        Message.receiver_id == user_id,
+        Message.sender_id == peer_id,
+        Message.read_at.is_(None),
+        Message.property_id.is_(None) if property_id is None else Message.property_id == property_id,
+    ]
+    if up_to_id is not None:
+        conditions.append(Message.id <= up_to_id)
+    result = await db.execute(
+        update(Message)
+        .where(*conditions)
+        .values(read_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    marked = result.rowcount
+    if marked:
+        Conversation = models.Conversation
+        await db.execute(
+            update(Conversation)
+            .where(_thread(user_id, peer_id, property_id))
+            .values(unread_count=case(
+                (Conversation.unread_count > marked, Conversation.unread_count - marked),
+                else_=0,
+            ))
+            .execution_options(synchronize_session=False)
+        )
+    return marked
+
+
+async def unread_total(db: AsyncSession, user_id: int) -> int:
+    Conversation = models.Conversation
+    total = await db.scalar(
+        select(func.coalesce(func.sum(Conversation.unread_count), 0))
+        .where(Conversation.user_id == user_id)
+    )
+    return int(total)
@@ -0,0 +1,140 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Checkout wait histogram bounds, in milliseconds
+WAIT_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolStats:
+    """Counters for one engine's pool, fed by pool events and timed checkouts."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.peak_in_use = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_ms_counts = {str(bound): 0 for bound in WAIT_MS_BUCKETS + ("+Inf",)}
+        self._lock = threading.Lock()
+
+    def record_checkout(self, pool, seconds: float, timed_out: bool = False):
+        bucket = next((bound for bound in WAIT_MS_BUCKETS if seconds * 1000 <= bound), "+Inf")
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.peak_in_use = max(self.peak_in_use, pool.checkedout())
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.wait_ms_counts[str(bucket)] += 1
+
+    def attach(self, pool):
+        pool.stats = self
+
+        @event.listens_for(pool, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            self.connects += 1
+
+        @event.listens_for(pool, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            self.checkins += 1
+
+        @event.listens_for(pool, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            self.invalidations += 1
+
+    def snapshot(self, pool) -> dict:
+        attempts = self.checkouts + self.timeouts
+        stats = {
+            "pool": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "peak_in_use": self.peak_in_use,
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "wait_seconds_mean": round(self.wait_seconds_total / attempts, 6) if attempts else 0.0,
+            "wait_ms_buckets": dict(self.wait_ms_counts),
+        }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                # QueuePool counts overflow from -size; only report connections beyond size
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+            })
+        return stats
+
+
+class _InstrumentedPool:
+    """Times every checkout, including the wait for a free slot, into ``stats``."""
+
+    stats = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_checkout(self, time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record_checkout(self, time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(url, settings, is_async: bool = False) -> dict:
+    """create_engine() pool arguments for ``url`` from the DB_POOL_* settings.
+
+    In-memory SQLite keeps SQLAlchemy's single-connection pool, since every
+    new connection would be a separate, empty database.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def instrument(engine):
+    if isinstance(engine.pool, _InstrumentedPool):
+        PoolStats().attach(engine.pool)
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = getattr(pool, "stats", None)
+    if stats is None:
+        return {"pool": type(pool).__name__, "instrumented": False}
+    return stats.snapshot(pool)
@@ -1,42 +1,26 @@
-from fastapi import BackgroundTasks
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+from datetime import datetime
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from jose import jwt
-from app.models.models import User
-from fastapi.templating import Jinja2Templates
-from starlette.requests import Request
-from sqlalchemy.orm import Session
-from jinja2 import Template
-
-from dotenv import load_dotenv
-import os
-
-load_dotenv()  
-
-
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-EMAIL = os.getenv("EMAIL")
-PASSWORD = os.getenv("PASSWORD")
-FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
-BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
-
-
-# Email Configuration
-conf = ConnectionConfig(
-    MAIL_USERNAME=EMAIL,
-    MAIL_PASSWORD=PASSWORD,
-    MAIL_FROM=EMAIL,
-    MAIL_PORT=465,  # Port 465 for SSL
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=False,  # False for SSL
-    MAIL_SSL_TLS=True,  # True for SSL
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER="app/templates"  # Ensure template folder exists
-)
-
-# Initialize Jinja2Templates
-templates = Jinja2Templates(directory="app/templates")
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import get_settings
+from app.models.models import EmailOutbox, OutboxStatus, User
+
+settings = get_settings()
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+FRONTEND_URL = settings.frontend_url
+BACKEND_URL = settings.backend_url
+
+# Compiled once at import; rendering is then a plain function call per mail
+_env = Environment(loader=FileSystemLoader("app/templates"), autoescape=select_autoescape(["html"]))
+TEMPLATES = {
+    name: _env.get_template(f"{name}.html")
+    for name in ("email_verification", "welcome_email", "reset_password_email")
+}
 
 # ✅ Generate Email Verification Token
 def generate_email_token(user: User):
@@ -44,79 +28,68 @@ def generate_email_token(user: User):
     token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
     return token
 
-# ✅ Send Verification Email
-async def send_email_verification(user: User, request: Request):
+
+async def enqueue_email(db: AsyncSession, kind: str, recipient: str, subject: str, body: str):
+    """Add a mail to the outbox in the caller's transaction; the caller commits.
+
+    While a mail of the same kind is still waiting for the recipient it is
+    replaced rather than duplicated, so repeated clicks on "resend" or
+    "forgot password" deliver one mail carrying the newest link. A pending
+    row whose next attempt is in the future is leased by a worker (or backing
+    off) and may be on its way out already, so it is left alone: it gives up
+    the dedup key and the new mail is queued as a fresh row.
+    """
+    now = datetime.utcnow()
+    dedup_key = f"{kind}:{recipient.lower()}"
+    values = {
+        "kind": kind,
+        "recipient": recipient,
+        "subject": subject,
+        "body": body,
+        "dedup_key": dedup_key,
+        "status": OutboxStatus.pending,
+        "next_attempt_at": now,
+    }
+    pending = (EmailOutbox.dedup_key == dedup_key, EmailOutbox.status == OutboxStatus.pending)
+
+    def replace(at: datetime):
+        return (
+            update(EmailOutbox)
+            .where(*pending, EmailOutbox.next_attempt_at <= at)
+            .values(subject=subject, body=body, next_attempt_at=at)
+            .execution_options(synchronize_session=False)
+        )
+
+    if (await db.execute(replace(now))).rowcount:
+        return
+    try:
+        async with db.begin_nested():
+            await db.execute(
+                update(EmailOutbox).where(*pending).values(dedup_key=None).execution_options(synchronize_session=False)
+            )
+            await db.execute(insert(EmailOutbox).values(**values))
+    except IntegrityError:
+        # A concurrent request queued the same mail first
+        await db.execute(replace(datetime.utcnow()))
+
+
+# ✅ Queue Verification Email
+async def send_email_verification(db: AsyncSession, user: User):
     token = generate_email_token(user)
     verification_link = f"{BACKEND_URL}/auth/confirm-email/{token}"
-    # Render email template with Jinja2
-    email_body = templates.get_template("email_verification.html").render(
+    email_body = TEMPLATES["email_verification"].render(
         username=user.username,
         verification_link=verification_link
     )
+    await enqueue_email(db, "verification", user.email, "Email Verification", email_body)
 
-    # Prepare Email
-    message = MessageSchema(
-        subject="Email Verification",
-        recipients=[user.email],
-        body=email_body,
-        subtype=MessageType.html
-    )
-
-    # Send Email in Background
-    fm = FastMail(conf)
-    await fm.send_message(message)
-
-    return {"message": "Verification email sent"}
 
-async def send_welcome_email(user_email: str, db_session: Session, background_tasks: BackgroundTasks):
-    user = db_session.query(User).filter(User.email == user_email).first()
+async def send_welcome_email(db: AsyncSession, user: User):
+    email_body = TEMPLATES["welcome_email"].render(username=user.username)
+    await enqueue_email(db, "welcome", user.email, "Welcome to Our Platform!", email_body)
 
-    if not user:
-        print("User not found")  # Log error instead of returning a response
-        return
-
-    # Render welcome email template with Jinja2
-    email_body = templates.get_template("welcome_email.html").render(
-        username=user.username
-    )
-
-    # Prepare Email
-    message = MessageSchema(
-        subject="Welcome to Our Platform!",
-        recipients=[user.email],
-        body=email_body,
-        subtype=MessageType.html
-    )
-
-    # Send Email in Background
-    fm = FastMail(conf)
-    background_tasks.add_task(fm.send_message, message)
-
-
-
-async def send_reset_password_email(user_email: str, db_session: Session, token: str):
-    reset_link =  f"{FRONTEND_URL}/auth/reset-password?token={token}"
-    user = db_session.query(User).filter(User.email == user_email).first()
-
-    if not user:
-        print("User not found")
-        return
-
-    # Load email template using Jinja2
-    email_template = Template("""
-    <h1>Password Reset Request</h1>
-    <p>Click the link below to reset your password:</p>
-    <a href="{{ reset_link }}">Reset Password</a>
-    """)
-
-    email_body = email_template.render(reset_link=reset_link)
-
-    message = MessageSchema(
-        subject="Password Reset Request",
-        recipients=[user.email],
-        body=email_body,
-        subtype=MessageType.html,
-    )
 
-    fm = FastMail(conf)
-    await fm.send_message(message)  # Now it's a synchronous function
\ No newline at end of file
+async def send_reset_password_email(db: AsyncSession, user: User, token: str):
+    reset_link = f"{FRONTEND_URL}/auth/reset-password?token={token}"
+    email_body = TEMPLATES["reset_password_email"].render(reset_link=reset_link)
+    await enqueue_email(db, "reset_password", user.email, "Password Reset Request", email_body)
@@ -0,0 +1,151 @@
+"""Streaming CSV/NDJSON exports that hold one batch of rows at a time.
+
+Rows come off a server-side cursor (``AsyncSession.stream`` with
+``yield_per``) and are encoded and written to the response batch by batch,
+optionally through a gzip stream, so memory stays flat for any export size.
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import datetime
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.config.settings import get_settings
+from app.database import read_sessionmaker
+from app.models import models
+from app.schemas.schemas import ExportFormat
+
+settings = get_settings()
+EXPORT_BATCH_SIZE = settings.export_batch_size
+
+MEDIA_TYPES = {ExportFormat.csv: "text/csv; charset=utf-8", ExportFormat.ndjson: "application/x-ndjson"}
+# Matches the import format, so an export can be imported again
+CSV_LIST_SEPARATOR = "|"
+# Spreadsheets run cells starting with these as formulas; such text cells get a
+# leading "'" (the importer drops it again)
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+PROPERTY_COLUMNS = (
+    "id", "title", "description", "price", "location", "latitude", "longitude", "owner_id", "created_at", "image_urls",
+)
+MESSAGE_COLUMNS = ("id", "sender_id", "receiver_id", "property_id", "content", "created_at", "read_at")
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        value = CSV_LIST_SEPARATOR.join(value)
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return "" if value is None else _plain(value)
+
+
+def encode_batch(records, columns, format: ExportFormat) -> bytes:
+    if format == ExportFormat.csv:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([_csv_value(record[column]) for column in columns] for record in records)
+        return buffer.getvalue().encode()
+    return "".join(json.dumps(record, default=_plain) + "\n" for record in records).encode()
+
+
+async def stream_rows(query, columns, format: ExportFormat, compress: bool = False, decorate=None,
+                      primary: bool = False):
+    """Yield encoded chunks for ``query``, one batch of EXPORT_BATCH_SIZE rows at a time.
+
+    The export runs on its own read session (the replica unless ``primary``):
+    the request's session is closed before a streamed body starts.
+    ``decorate(db, records)`` can add columns to each batch before it is
+    encoded.
+    """
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(data: bytes) -> bytes:
+        return gzip.compress(data) if gzip else data
+
+    if format == ExportFormat.csv:
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        yield emit(header.getvalue().encode())
+
+    async with read_sessionmaker(primary)() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.mappings().partitions():
+            records = [dict(row) for row in rows]
+            if decorate is not None:
+                await decorate(db, records)
+            chunk = emit(encode_batch(records, columns, format))
+            if chunk:
+                yield chunk
+    if gzip:
+        yield gzip.flush()
+
+
+def export_response(chunks, format: ExportFormat, filename: str, compress: bool = False) -> StreamingResponse:
+    extension = format.value
+    media_type = MEDIA_TYPES[format]
+    if compress:
+        extension += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
+
+
+def _date_range(query, column, created_after, created_before):
+    if created_after is not None:
+        query = query.where(column >= created_after)
+    if created_before is not None:
+        query = query.where(column < created_before)
+    return query
+
+
+def property_query(owner_id: int, created_after=None, created_before=None):
+    Property = models.Property
+    query = select(*(getattr(Property, column) for column in PROPERTY_COLUMNS[:-1])).where(Property.owner_id == owner_id)
+    return _date_range(query, Property.created_at, created_after, created_before).order_by(Property.id)
+
+
+async def attach_image_urls(db, records):
+    """One query per batch for the batch's image URLs, instead of one per listing."""
+    by_property = {record["id"]: record for record in records}
+    for record in records:
+        record["image_urls"] = []
+    if not by_property:
+        return
+    PropertyImage = models.PropertyImage
+    rows = await db.execute(
+        select(PropertyImage.property_id, PropertyImage.url)
+        .where(PropertyImage.property_id.in_(by_property))
+        .order_by(PropertyImage.id)
+    )
+    for property_id, url in rows:
+        by_property[property_id]["image_urls"].append(url)
+
+
+def message_query(user_id: int, peer_id=None, property_id=None, created_after=None, created_before=None):
+    """Every message the user sent or received, oldest first."""
+    Message = models.Message
+    query = select(*(getattr(Message, column) for column in MESSAGE_COLUMNS))
+    if peer_id is not None:
+        query = query.where(
+            ((Message.sender_id == user_id) & (Message.receiver_id == peer_id))
+            | ((Message.sender_id == peer_id) & (Message.receiver_id == user_id))
+        )
+    else:
+        query = query.where((Message.sender_id == user_id) | (Message.receiver_id == user_id))
+    if property_id is not None:
+        query = query.where(Message.property_id == property_id)
+    return _date_range(query, Message.created_at, created_after, created_before).order_by(Message.id)
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import String, case, cast, func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import get_settings
+from app.models import models
+
+settings = get_settings()
+PRICE_BUCKETS = [int(bound) for bound in settings.facet_price_buckets.split(",") if bound.strip()]
+FACET_CACHE_SIZE = settings.facet_cache_size
+FACET_CACHE_TTL = settings.facet_cache_ttl
+
+FacetFilters = namedtuple("FacetFilters", "min_price max_price location owner_id")
+PropertySnapshot = namedtuple("PropertySnapshot", "price location owner_id")
+
+
+def snapshot(prop: models.Property) -> PropertySnapshot:
+    return PropertySnapshot(prop.price, prop.location, prop.owner_id)
+
+
+def price_bucket(price: int) -> int:
+    for index, bound in enumerate(PRICE_BUCKETS):
+        if price < bound:
+            return index
+    return len(PRICE_BUCKETS)
+
+
+def _bucket_expression():
+    whens = [(models.Property.price < bound, index) for index, bound in enumerate(PRICE_BUCKETS)]
+    if not whens:
+        return literal(0)
+    return case(*whens, else_=len(PRICE_BUCKETS))
+
+
+async def count_facets(db: AsyncSession, filters: FacetFilters, apply_filters) -> dict:
+    """Count every facet for ``filters`` with one grouped UNION ALL round trip."""
+    Property = models.Property
+
+    def grouped(facet, key):
+        query = select(
+            literal(facet).label("facet"),
+            cast(key, String).label("value"),
+            func.count().label("count"),
+        ).select_from(Property)
+        query = apply_filters(query, *filters)
+        return query.group_by(key)
+
+    statement = union_all(
+        grouped("location", Property.location),
+        grouped("price", _bucket_expression()),
+        grouped("owner_id", Property.owner_id),
+    )
+    counts = {"location": {}, "price": {}, "owner_id": {}}
+    for facet, value, count in await db.execute(statement):
+        if facet == "location":
+            counts[facet][value] = count
+        else:
+            counts[facet][int(value)] = count
+    return counts
+
+
+def matches(filters: FacetFilters, prop: PropertySnapshot) -> bool:
+    if filters.min_price is not None and prop.price < filters.min_price:
+        return False
+    if filters.max_price is not None and prop.price > filters.max_price:
+        return False
+    if filters.location and not prop.location.lower().startswith(filters.location.lower()):
+        return False
+    if filters.owner_id is not None and prop.owner_id != filters.owner_id:
+        return False
+    return True
+
+
+class FacetCache:
+    """LRU of facet counts per filter set, patched in place on property writes.
+
+    Writes adjust the counts of every cached filter set the property falls in,
+    so a create/update/delete never forces the sidebar back to the database.
+    Counts are stored only if no write was patched in while they were being
+    read (``version``), since that write may or may not be in them. The TTL
+    bounds drift from writes made by other worker processes.
+    """
+
+    def __init__(self, max_entries: int = FACET_CACHE_SIZE, ttl: float = FACET_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Moves on every patched write; read before counting and handed back to set
+        self.version = 0
+
+    def get(self, filters: FacetFilters):
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(filters)
+            if entry is None:
+                return None
+            expires_at, counts = entry
+            if expires_at < time.monotonic():
+                del self._entries[filters]
+                return None
+            self._entries.move_to_end(filters)
+            return _copy(counts)
+
+    def set(self, filters: FacetFilters, counts: dict, version: int = None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[filters] = (time.monotonic() + self.ttl, _copy(counts))
+            self._entries.move_to_end(filters)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def property_added(self, prop: PropertySnapshot):
+        self._apply(prop, 1)
+
+    def property_removed(self, prop: PropertySnapshot):
+        self._apply(prop, -1)
+
+    def property_changed(self, old: PropertySnapshot, new: PropertySnapshot):
+        if old != new:
+            self._apply(old, -1)
+            self._apply(new, 1)
+
+    def _apply(self, prop: PropertySnapshot, delta: int):
+        keys = (
+            ("location", prop.location),
+            ("price", price_bucket(prop.price)),
+            ("owner_id", prop.owner_id),
+        )
+        with self._lock:
+            self.version += 1
+            for filters, (_, counts) in self._entries.items():
+                if not matches(filters, prop):
+                    continue
+                for facet, value in keys:
+                    count = counts[facet].get(value, 0) + delta
+                    if count > 0:
+                        counts[facet][value] = count
+                    else:
+                        counts[facet].pop(value, None)
+
+
+def _copy(counts: dict) -> dict:
+    return {facet: dict(values) for facet, values in counts.items()}
+
+
+facet_cache = FacetCache()
@@ -0,0 +1,136 @@
+"""Grid-cell spatial indexing that works on a plain B-tree, on SQLite and Postgres.
+
+Each located listing stores ``geocell``: its latitude and longitude quantized
+to GEOCELL_BITS / 2 bits each and bit-interleaved (longitude first), i.e. a
+geohash kept as an integer. Every geohash prefix is then a contiguous
+integer range, so a box is covered by a handful of ``geocell`` ranges that
+an ordinary index answers, and exact coordinates filter what is left.
+"""
+import math
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+from app.config.settings import get_settings
+from app.models import models
+
+settings = get_settings()
+GEO_MAX_CELLS = settings.geo_max_cells
+GEO_MAX_RADIUS_KM = settings.geo_max_radius_km
+GEO_MAX_RESULTS = settings.geo_max_results
+GEO_MAX_CANDIDATES = settings.geo_max_candidates
+
+# 26 bits per axis: cells of roughly 0.6m, and well inside a BIGINT
+GEOCELL_BITS = 52
+EARTH_RADIUS_KM = 6371.0088
+
+Box = namedtuple("Box", "south west north east")
+
+
+def _quantize(value: float, low: float, high: float, bits: int) -> int:
+    index = int((value - low) / (high - low) * (1 << bits))
+    return min(max(index, 0), (1 << bits) - 1)
+
+
+def _interleave(lng_index: int, lat_index: int, lng_bits: int, lat_bits: int) -> int:
+    """Geohash bit order: longitude, latitude, longitude, ... from the top."""
+    cell = 0
+    for position in range(lng_bits + lat_bits):
+        if position % 2 == 0:
+            bit = (lng_index >> (lng_bits - 1 - position // 2)) & 1
+        else:
+            bit = (lat_index >> (lat_bits - 1 - position // 2)) & 1
+        cell = (cell << 1) | bit
+    return cell
+
+
+def _axis_bits(bits: int):
+    return (bits + 1) // 2, bits // 2
+
+
+def geocell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    lng_bits, lat_bits = _axis_bits(GEOCELL_BITS)
+    return _interleave(
+        _quantize(longitude, -180.0, 180.0, lng_bits),
+        _quantize(latitude, -90.0, 90.0, lat_bits),
+        lng_bits,
+        lat_bits,
+    )
+
+
+def _split(box: Box):
+    """A box crossing the antimeridian (west > east) as two plain boxes."""
+    if box.west <= box.east:
+        return [box]
+    return [Box(box.south, box.west, box.north, 180.0), Box(box.south, -180.0, box.north, box.east)]
+
+
+def _cells(box: Box, bits: int):
+    lng_bits, lat_bits = _axis_bits(bits)
+    lat_range = range(_quantize(box.south, -90.0, 90.0, lat_bits), _quantize(box.north, -90.0, 90.0, lat_bits) + 1)
+    lng_range = range(_quantize(box.west, -180.0, 180.0, lng_bits), _quantize(box.east, -180.0, 180.0, lng_bits) + 1)
+    return len(lat_range) * len(lng_range), (
+        _interleave(lng_index, lat_index, lng_bits, lat_bits) for lat_index in lat_range for lng_index in lng_range
+    )
+
+
+def cover(box: Box, max_cells: int = GEO_MAX_CELLS):
+    """Merged ``[low, high)`` geocell ranges covering ``box``.
+
+    Uses the finest cell size that still needs at most ``max_cells`` cells,
+    so a city viewport and a country both cost a few index range scans.
+    """
+    boxes = _split(box)
+    bits = 0
+    for candidate in range(1, GEOCELL_BITS + 1):
+        if sum(_cells(part, candidate)[0] for part in boxes) > max_cells:
+            break
+        bits = candidate
+    shift = GEOCELL_BITS - bits
+    prefixes = sorted({cell for part in boxes for cell in _cells(part, bits)[1]})
+
+    ranges = []
+    for prefix in prefixes:
+        low, high = prefix << shift, (prefix + 1) << shift
+        if ranges and ranges[-1][1] == low:
+            ranges[-1][1] = high
+        else:
+            ranges.append([low, high])
+    return [tuple(bounds) for bounds in ranges]
+
+
+def box_filter(box: Box):
+    """Coarse geocell ranges plus the exact coordinate test, as one WHERE clause."""
+    Property = models.Property
+    cells = or_(*(and_(Property.geocell >= low, Property.geocell < high) for low, high in cover(box)))
+    if box.west <= box.east:
+        longitude = Property.longitude.between(box.west, box.east)
+    else:
+        longitude = or_(Property.longitude >= box.west, Property.longitude <= box.east)
+    return and_(cells, Property.latitude.between(box.south, box.north), longitude)
+
+
+def radius_box(latitude: float, longitude: float, radius_km: float) -> Box:
+    """The smallest lat/lng box containing the circle."""
+    angular = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = latitude - angular, latitude + angular
+    if south <= -90.0 or north >= 90.0:
+        # The circle covers a pole: every longitude is in range
+        return Box(max(south, -90.0), -180.0, min(north, 90.0), 180.0)
+    spread = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)))))
+    west, east = longitude - spread, longitude + spread
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return Box(south, west, north, east)
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
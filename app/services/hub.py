@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import defaultdict
+
+from fastapi import WebSocket
+from sqlalchemy.engine import make_url
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+HUB_BROKER = settings.hub_broker
+HUB_CHANNEL = settings.hub_channel
+HUB_RECONNECT_MIN = settings.hub_reconnect_min
+HUB_RECONNECT_MAX = settings.hub_reconnect_max
+HUB_KEEPALIVE_INTERVAL = settings.hub_keepalive_interval
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+
+class Broker:
+    """Carries hub deliveries between worker processes.
+
+    ``start`` receives a callback that is invoked with every payload published
+    by *any* process, including this one; the hub drops its own echoes.
+    """
+
+    async def start(self, on_message):
+        pass
+
+    async def publish(self, payload: str):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class InProcessBroker(Broker):
+    """Single-process deployments: the hub's local delivery is all there is."""
+
+
+class PostgresBroker(Broker):
+    """Fan-out over PostgreSQL LISTEN/NOTIFY on the application database.
+
+    The listener connection is supervised: when it drops it is reopened with
+    exponential backoff (HUB_RECONNECT_MIN up to HUB_RECONNECT_MAX seconds).
+    Notifications sent while it is down are lost; clients catch up from the
+    message history. The publisher reconnects on the next publish after a
+    failure, waiting out the same backoff first.
+    """
+
+    def __init__(self, dsn: str, channel: str = HUB_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self._listener = None
+        self._publisher = None
+        self._publish_lock = asyncio.Lock()
+        self._publisher_backoff = 0.0
+        self._publisher_retry_at = 0.0
+        self._supervisor = None
+        self._tasks = set()
+        self.reconnects = 0
+
+    async def start(self, on_message):
+        def notify(connection, pid, channel, payload):
+            task = asyncio.get_running_loop().create_task(on_message(payload))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if self._supervisor is None:
+            self._supervisor = asyncio.create_task(self._listen(notify))
+
+    async def _listen(self, notify):
+        import asyncpg
+
+        backoff = HUB_RECONNECT_MIN
+        while True:
+            closed = asyncio.Event()
+            try:
+                self._listener = await asyncpg.connect(self.dsn)
+                self._listener.add_termination_listener(lambda connection: closed.set())
+                await self._listener.add_listener(self.channel, notify)
+            except Exception as exc:
+                logger.warning("Hub listener could not connect (%r); retrying in %.1fs", exc, backoff)
+                self._close_listener()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, HUB_RECONNECT_MAX)
+                continue
+            backoff = HUB_RECONNECT_MIN
+            await self._wait_closed(closed)
+            logger.warning("Hub listener connection lost; reconnecting")
+            self.reconnects += 1
+            self._close_listener()
+
+    async def _wait_closed(self, closed: asyncio.Event):
+        # A peer that vanished without a FIN never fires the termination
+        # listener, so ping while idle and treat a failed ping as a drop
+        while not closed.is_set():
+            try:
+                await asyncio.wait_for(closed.wait(), HUB_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.wait_for(self._listener.execute("SELECT 1"), HUB_KEEPALIVE_INTERVAL)
+                except Exception:
+                    return
+
+    def _close_listener(self):
+        listener, self._listener = self._listener, None
+        if listener is not None and not listener.is_closed():
+            listener.terminate()
+
+    async def publish(self, payload: str):
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            logger.warning("Hub payload too large for NOTIFY; delivered locally only")
+            return
+        async with self._publish_lock:
+            if self._publisher is None or self._publisher.is_closed():
+                await self._connect_publisher()
+            try:
+                await self._publisher.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            except Exception:
+                self._publisher.terminate()
+                self._publisher = None
+                raise
+
+    async def _connect_publisher(self):
+        import asyncpg
+
+        loop = asyncio.get_running_loop()
+        if loop.time() < self._publisher_retry_at:
+            raise ConnectionError("hub publisher is reconnecting")
+        try:
+            self._publisher = await asyncpg.connect(self.dsn)
+        except Exception:
+            self._publisher_backoff = min(max(self._publisher_backoff * 2, HUB_RECONNECT_MIN), HUB_RECONNECT_MAX)
+            self._publisher_retry_at = loop.time() + self._publisher_backoff
+            raise
+        self._publisher_backoff = 0.0
+
+    async def stop(self):
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        self._close_listener()
+        if self._publisher is not None:
+            await self._publisher.close()
+            self._publisher = None
+
+
+class ConnectionHub:
+    """Tracks every open socket per user and delivers messages to all of them.
+
+    Deliveries go to sockets held by this process first and are then published
+    on the broker so other workers can reach sockets they hold.
+    """
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.node_id = uuid.uuid4().hex
+        self._connections = defaultdict(set)
+        self.publish_failures = 0
+
+    def is_online(self, user_id: int) -> bool:
+        return bool(self._connections.get(user_id))
+
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self._connections.values())
+
+    async def start(self):
+        await self.broker.start(self._on_broker_message)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def stats(self) -> dict:
+        return {
+            "broker": type(self.broker).__name__,
+            "connections": self.connection_count(),
+            "publish_failures": self.publish_failures,
+            "reconnects": getattr(self.broker, "reconnects", 0),
+        }
+
+    def connect(self, user_id: int, websocket: WebSocket):
+        self._connections[user_id].add(websocket)
+
+    def disconnect(self, user_id: int, websocket: WebSocket):
+        sockets = self._connections.get(user_id)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self._connections[user_id]
+
+    async def send_to_user(self, user_id: int, message: dict):
+        text = json.dumps(message)
+        await self._deliver_local(user_id, text)
+        try:
+            await self.broker.publish(json.dumps({"node": self.node_id, "user_id": user_id, "text": text}))
+        except Exception as exc:
+            # Already delivered here and stored; other workers' sockets miss the push
+            self.publish_failures += 1
+            logger.warning("Hub publish failed; delivered locally only: %r", exc)
+
+    async def _on_broker_message(self, payload: str):
+        try:
+            envelope = json.loads(payload)
+        except ValueError:
+            logger.warning("Dropping malformed hub payload")
+            return
+        if envelope.get("node") == self.node_id:
+            return
+        await self._deliver_local(envelope["user_id"], envelope["text"])
+
+    async def _deliver_local(self, user_id: int, text: str):
+        sockets = self._connections.get(user_id)
+        if not sockets:
+            return
+        for websocket in list(sockets):
+            try:
+                await websocket.send_text(text)
+            except Exception:
+                # The socket's own receive loop will notice and clean up too
+                self.disconnect(user_id, websocket)
+
+
+def _make_broker() -> Broker:
+    if HUB_BROKER == "postgres":
+        url = make_url(settings.database_url).set(drivername="postgresql")
+        return PostgresBroker(url.render_as_string(hide_password=False))
+    return InProcessBroker()
+
+
+hub = ConnectionHub(_make_broker())
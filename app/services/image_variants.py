@@ -0,0 +1,30 @@
+"""CPU-bound image resizing, kept free of app imports so pool workers start fast."""
+import io
+
+from PIL import Image, ImageOps
+
+# name -> longest edge in pixels
+VARIANT_SIZES = {"thumbnail": 320, "card": 800, "full": 1600}
+JPEG_QUALITY = 80
+
+
+def make_variants(data: bytes, sizes: dict = VARIANT_SIZES, quality: int = JPEG_QUALITY) -> dict:
+    """Return the original's dimensions and a recompressed JPEG per variant.
+
+    ``{"width": w, "height": h, "variants": {name: (jpeg_bytes, width, height)}}``
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        variants = {}
+        for name, edge in sizes.items():
+            variant = image.copy()
+            # thumbnail() only ever shrinks, so small originals are just recompressed
+            variant.thumbnail((edge, edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            variant.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+            variants[name] = (buffer.getvalue(), variant.width, variant.height)
+    return {"width": width, "height": height, "variants": variants}
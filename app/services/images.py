@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select, update
+
+from app.config.settings import get_settings
+from app.database import AsyncSessionLocal
+from app.models import models
+from app.services import storage
+from app.services.image_variants import make_variants
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+IMAGE_WORKERS = settings.image_workers
+IMAGE_PIPELINE_CONCURRENCY = settings.image_pipeline_concurrency or IMAGE_WORKERS * 2
+IMAGE_PIPELINE_MAX_ATTEMPTS = max(1, settings.image_pipeline_max_attempts)
+IMAGE_PIPELINE_RETRY_DELAY = settings.image_pipeline_retry_delay
+IMAGE_PIPELINE_LEASE_SECONDS = settings.image_pipeline_lease_seconds
+
+
+def content_hash(fileobj) -> str:
+    """sha256 of an upload, leaving the file rewound for the storage backend."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(1024 * 1024)
+        if not chunk:
+            break
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def hash_files(fileobjs):
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(None, content_hash, fileobj) for fileobj in fileobjs))
+
+
+async def find_stored(db, hashes) -> dict:
+    """Map each already-stored content hash to one of its PropertyImage rows."""
+    if not hashes:
+        return {}
+    PropertyImage = models.PropertyImage
+    rows = await db.scalars(
+        select(PropertyImage)
+        .where(PropertyImage.content_hash.in_(set(hashes)))
+        .order_by(PropertyImage.id)
+    )
+    found = {}
+    for row in rows:
+        # Prefer a copy whose variants are already built
+        if row.content_hash not in found or (row.variants and not found[row.content_hash].variants):
+            found[row.content_hash] = row
+    return found
+
+
+class ImagePipeline:
+    """Builds resized variants of uploaded photos off the request path.
+
+    Each content hash is decoded and resized once on a process pool, the
+    variants are stored through the storage backend, and every PropertyImage
+    row sharing that hash is updated. A hash submitted again while it is in
+    flight is re-applied afterwards, so rows committed mid-run aren't missed.
+    Rows still without variants are leased per hash and picked up again by
+    ``start``; a failed build is retried a few times before being left for
+    the next start.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, workers: int = IMAGE_WORKERS,
+                 concurrency: int = IMAGE_PIPELINE_CONCURRENCY):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.concurrency = concurrency
+        self.on_updated = None
+        self._executor = None
+        self._semaphore = None
+        self._tasks = {}
+        self._stale = set()
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.variants_stored = 0
+        self.process_seconds_total = 0.0
+
+    async def start(self, on_updated=None):
+        """Open the process pool and resume images a previous process left without variants."""
+        if on_updated is not None:
+            self.on_updated = on_updated
+        if self._executor is not None:
+            return
+        self._open()
+        PropertyImage = models.PropertyImage
+        # One row per hash; imported rows still hold the source URL until the fetcher stores them
+        first = (
+            select(func.min(PropertyImage.id))
+            .where(
+                PropertyImage.variants.is_(None),
+                PropertyImage.content_hash.is_not(None),
+                PropertyImage.import_job_id.is_(None),
+            )
+            .group_by(PropertyImage.content_hash)
+        )
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(PropertyImage.content_hash, PropertyImage.url, PropertyImage.storage_key)
+                .where(PropertyImage.id.in_(first))
+            )).all()
+        await self.submit(
+            [(row.content_hash, storage.StoredFile(row.url, row.storage_key)) for row in rows],
+            on_updated=self.on_updated,
+        )
+
+    def _open(self):
+        # spawn keeps the workers clear of the server's threads and event loop
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, images, on_updated=None):
+        """Queue ``(content_hash, StoredFile)`` pairs; returns without waiting."""
+        if self._executor is None:
+            self._open()
+        for digest, stored in images:
+            if digest in self._tasks:
+                self._stale.add(digest)
+                continue
+            task = asyncio.create_task(self._process(digest, stored, on_updated))
+            self._tasks[digest] = task
+            task.add_done_callback(lambda _, digest=digest: self._tasks.pop(digest, None))
+
+    async def _process(self, digest, stored, on_updated):
+        if not await self.claim(digest):
+            # Built already, or another worker holds the lease and applies it to every row
+            return
+        for attempt in range(1, IMAGE_PIPELINE_MAX_ATTEMPTS + 1):
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    original = await storage.read_file(stored)
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(self._executor, make_variants, original)
+                    variants = await self._store(result["variants"])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    error = exc
+                else:
+                    self.process_seconds_total += time.perf_counter() - started
+                    break
+            if attempt == IMAGE_PIPELINE_MAX_ATTEMPTS:
+                self.failed += 1
+                logger.warning("Image processing failed for %s after %s attempts: %r", digest, attempt, error)
+                # Released rather than dropped: the next start tries the hash again
+                await self._apply(digest, {"variants_leased_until": None})
+                return
+            self.retried += 1
+            delay = IMAGE_PIPELINE_RETRY_DELAY * 2 ** (attempt - 1)
+            logger.warning("Image processing failed for %s: %r; retrying in %.0fs", digest, error, delay)
+            await asyncio.sleep(delay)
+
+        values = {
+            "width": result["width"], "height": result["height"], "variants": variants, "variants_leased_until": None,
+        }
+        while True:
+            self._stale.discard(digest)
+            property_ids = await self._apply(digest, values)
+            if on_updated is not None:
+                for property_id in property_ids:
+                    on_updated(property_id)
+            if digest not in self._stale:
+                break
+        self.processed += 1
+
+    async def claim(self, digest: str) -> bool:
+        """Lease the hash's rows that still need variants; False if there are none to take.
+
+        Every worker resumes the same rows at startup, so without the lease
+        each hash would be decoded and its variants stored once per worker.
+        """
+        PropertyImage = models.PropertyImage
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            claimed = (await db.scalars(
+                update(PropertyImage)
+                .where(
+                    PropertyImage.content_hash == digest,
+                    PropertyImage.variants.is_(None),
+                    PropertyImage.import_job_id.is_(None),
+                    or_(PropertyImage.variants_leased_until.is_(None), PropertyImage.variants_leased_until <= now),
+                )
+                .values(variants_leased_until=now + timedelta(seconds=IMAGE_PIPELINE_LEASE_SECONDS))
+                .returning(PropertyImage.id)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+        return bool(claimed)
+
+    async def _store(self, variants: dict) -> dict:
+        names = list(variants)
+        uploaded = await storage.upload_files(
+            [(io.BytesIO(variants[name][0]), f"{name}.jpg") for name in names],
+            circuit=storage.background_breaker,
+        )
+        self.variants_stored += len(uploaded)
+        return {
+            name: {"url": item.url, "key": item.key, "width": variants[name][1], "height": variants[name][2]}
+            for name, item in zip(names, uploaded)
+        }
+
+    async def _apply(self, digest: str, values: dict):
+        PropertyImage = models.PropertyImage
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(PropertyImage)
+                .where(PropertyImage.content_hash == digest)
+                .values(**values)
+                .returning(PropertyImage.property_id)
+                .execution_options(synchronize_session=False)
+            )
+            property_ids = set(result.scalars())
+            await db.commit()
+        return property_ids
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": len(self._tasks),
+            "processed": self.processed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "variants_stored": self.variants_stored,
+            "process_seconds_mean": round(self.process_seconds_total / self.processed, 6) if self.processed else 0.0,
+        }
+
+
+pipeline = ImagePipeline()
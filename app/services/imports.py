@@ -0,0 +1,579 @@
+import asyncio
+import codecs
+import csv
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import socket
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import httpx
+from pydantic import ValidationError
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.requests import ClientDisconnect
+
+from app.config.settings import get_settings
+from app.database import AsyncSessionLocal
+from app.models import models
+from app.schemas.schemas import ImportFormat, PropertyCreate
+from app.services import geo, storage
+from app.services.exports import CSV_FORMULA_PREFIXES
+from app.services.images import find_stored, pipeline
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+IMPORT_CHUNK_SIZE = settings.import_chunk_size
+IMPORT_MAX_ERRORS = settings.import_max_errors
+IMPORT_MAX_RECORD_LENGTH = settings.import_max_record_length
+IMPORT_IMAGE_FETCH_CONCURRENCY = settings.import_image_fetch_concurrency
+IMPORT_IMAGE_MAX_BYTES = settings.import_image_max_bytes
+IMPORT_IMAGE_TIMEOUT = settings.import_image_timeout
+IMPORT_IMAGE_LEASE_SECONDS = settings.import_image_lease_seconds
+
+CSV_COLUMNS = ("title", "description", "price", "location")
+# Left blank in a CSV row when a listing has no coordinates
+CSV_OPTIONAL_COLUMNS = ("latitude", "longitude")
+# Images in a CSV cell are separated by "|"
+CSV_IMAGE_SEPARATOR = "|"
+IMAGE_FETCH_BATCH = 100
+# PropertyImage.url is a String(500)
+IMAGE_URL_MAX_LENGTH = 500
+IMAGE_FETCH_MAX_REDIRECTS = 5
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# sqlite3 raises OverflowError for integers past 64 bits without wrapping it
+ROW_ERRORS = (SQLAlchemyError, OverflowError)
+# Job columns the importer counts up in memory between commits
+JOB_COUNTERS = ("rows_total", "rows_imported", "rows_failed", "images_queued")
+
+# What a committed import row looks like to the search index and facet cache
+ImportedProperty = namedtuple("ImportedProperty", "id title description price location owner_id")
+
+
+class ImportFormatError(Exception):
+    """The stream as a whole can't be parsed (bad encoding, missing CSV header)."""
+
+
+async def _lines(stream):
+    """Decode a byte stream into lines without holding more than one line.
+
+    A line longer than IMPORT_MAX_RECORD_LENGTH is dropped as it arrives and
+    yielded as a ValueError in its place, so a body without newlines can't
+    fill memory.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    # Inside a line already reported as too long, up to its newline
+    skipping = False
+    try:
+        async for chunk in stream:
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                if skipping:
+                    skipping = False
+                elif len(line) > IMPORT_MAX_RECORD_LENGTH:
+                    yield _line_too_long()
+                else:
+                    yield line.rstrip("\r")
+            if len(pending) > IMPORT_MAX_RECORD_LENGTH:
+                if not skipping:
+                    yield _line_too_long()
+                skipping = True
+                pending = ""
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as exc:
+        raise ImportFormatError(f"Upload is not valid UTF-8: {exc}")
+    if pending and not skipping:
+        yield pending.rstrip("\r")
+
+
+def _line_too_long() -> ValueError:
+    return ValueError(f"line is longer than {IMPORT_MAX_RECORD_LENGTH} characters")
+
+
+async def _csv_records(stream):
+    header = None
+    record = ""
+    row = 0
+    async for line in _lines(stream):
+        too_long = isinstance(line, ValueError) or len(record) + len(line) + 1 > IMPORT_MAX_RECORD_LENGTH
+        if record and too_long:
+            # Past an unclosed quote every later quote reads the other way round,
+            # so nothing after it can be trusted to line up with its columns
+            raise ImportFormatError(
+                f"CSV row {row + 1}: a quoted field runs past {IMPORT_MAX_RECORD_LENGTH} characters; "
+                "is a closing quote missing?"
+            )
+        if isinstance(line, ValueError):
+            if header is None:
+                raise ImportFormatError(f"CSV header: {line}")
+            row += 1
+            yield row, line
+            continue
+        record = f"{record}\n{line}" if record else line
+        # A quoted field may span lines; the record is complete once quotes balance
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [column.strip().lower() for column in values]
+            missing = [column for column in CSV_COLUMNS if column not in header]
+            if missing:
+                raise ImportFormatError(f"CSV header is missing {', '.join(missing)}")
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, ValueError(f"expected {len(header)} columns, got {len(values)}")
+            continue
+        # Undo the export's guard against spreadsheet formulas
+        fields = {
+            column: value[1:] if value.startswith("'") and value[1:].startswith(CSV_FORMULA_PREFIXES) else value
+            for column, value in zip(header, values)
+        }
+        for column in CSV_OPTIONAL_COLUMNS:
+            if not fields.get(column, "").strip():
+                fields.pop(column, None)
+        urls = fields.pop("image_urls", "")
+        fields["image_urls"] = [url.strip() for url in urls.split(CSV_IMAGE_SEPARATOR) if url.strip()]
+        yield row, fields
+    if record:
+        yield row + 1, ValueError("unterminated quoted field")
+
+
+async def _ndjson_records(stream):
+    row = 0
+    async for line in _lines(stream):
+        if isinstance(line, ValueError):
+            row += 1
+            yield row, line
+            continue
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            fields = json.loads(line)
+        except ValueError as exc:
+            yield row, ValueError(f"invalid JSON: {exc}")
+            continue
+        if not isinstance(fields, dict):
+            yield row, ValueError("expected a JSON object")
+            continue
+        yield row, fields
+
+
+def records(stream, format: ImportFormat):
+    """Yield ``(row_number, fields)`` per record, or ``(row_number, error)``."""
+    if format == ImportFormat.csv:
+        return _csv_records(stream)
+    return _ndjson_records(stream)
+
+
+def validate(fields: dict) -> PropertyCreate:
+    try:
+        listing = PropertyCreate(**{"image_urls": [], **fields})
+    except ValidationError as exc:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+        ))
+    for url in listing.image_urls:
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"image_urls: not an http(s) URL: {url[:200]}")
+        if len(url) > IMAGE_URL_MAX_LENGTH:
+            raise ValueError(f"image_urls: longer than {IMAGE_URL_MAX_LENGTH} characters: {url[:200]}")
+    return listing
+
+
+class BulkImporter:
+    """Streams records into properties, ``chunk_size`` rows per INSERT and commit.
+
+    Only the current chunk is held in memory. Image URLs are stored on their
+    PropertyImage rows (flagged with the job id) and fetched afterwards by
+    the ImageFetcher. ``on_chunk(db, imported)`` runs after each commit. A
+    chunk the database rejects is retried row by row, so one bad row costs
+    only itself; however the run ends, the job is left completed or failed.
+    """
+
+    def __init__(self, db, job: models.ImportJob, on_chunk=None, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.db = db
+        self.job = job
+        # Read once: a rollback expires the job, and async sessions can't lazy-load
+        self.job_id = job.id
+        self.owner_id = job.owner_id
+        self.on_chunk = on_chunk
+        self.chunk_size = chunk_size
+        self._chunk = []
+        self._errors = []
+
+    async def run(self, stream):
+        status = models.ImportStatus.failed
+        try:
+            try:
+                async for row, fields in records(stream, ImportFormat(self.job.format)):
+                    self.job.rows_total += 1
+                    if isinstance(fields, Exception):
+                        self._fail_row(row, fields)
+                        continue
+                    try:
+                        self._chunk.append((row, validate(fields)))
+                    except ValueError as exc:
+                        self._fail_row(row, exc)
+                        continue
+                    if len(self._chunk) >= self.chunk_size:
+                        await self._flush()
+                await self._flush()
+                status = models.ImportStatus.completed
+            except ImportFormatError as exc:
+                self._fail_row(0, exc)
+                await self._flush()
+            except ClientDisconnect:
+                self._fail_row(0, ImportFormatError("upload ended before the whole body was received"))
+                await self._flush()
+        finally:
+            await self._finish(status)
+
+    def _fail_row(self, row: int, error: Exception):
+        self.job.rows_failed += 1
+        if len(self._errors) < IMPORT_MAX_ERRORS:
+            self._errors.append({"row": row, "error": str(error)})
+
+    async def _flush(self):
+        chunk, self._chunk = self._chunk, []
+        try:
+            imported = await self._write(chunk)
+        except ROW_ERRORS:
+            # Find the offending rows one at a time; the rest still go in
+            imported = []
+            for entry in chunk:
+                try:
+                    imported += await self._write([entry])
+                except ROW_ERRORS as exc:
+                    self._fail_row(entry[0], _database_error(exc))
+            await self._write([])
+        if imported and self.on_chunk is not None:
+            self.on_chunk(self.db, imported)
+
+    async def _write(self, chunk) -> list:
+        """Insert ``chunk`` and commit with the job's progress; on an error roll back to the last commit."""
+        job, Property = self.job, models.Property
+        saved = {field: getattr(job, field) for field in JOB_COUNTERS}
+        try:
+            imported = []
+            if chunk:
+                ids = (await self.db.scalars(
+                    insert(Property).returning(Property.id, sort_by_parameter_order=True),
+                    [
+                        {"title": listing.title, "description": listing.description, "price": listing.price,
+                         "location": listing.location, "latitude": listing.latitude,
+                         "longitude": listing.longitude,
+                         "geocell": geo.geocell(listing.latitude, listing.longitude), "owner_id": self.owner_id}
+                        for _, listing in chunk
+                    ],
+                )).all()
+                images = [
+                    {"property_id": property_id, "url": url, "import_job_id": self.job_id}
+                    for property_id, (_, listing) in zip(ids, chunk)
+                    for url in listing.image_urls
+                ]
+                if images:
+                    await self.db.execute(insert(models.PropertyImage), images)
+                imported = [
+                    ImportedProperty(property_id, listing.title, listing.description, listing.price,
+                                     listing.location, self.owner_id)
+                    for property_id, (_, listing) in zip(ids, chunk)
+                ]
+                job.rows_imported += len(chunk)
+                job.images_queued += len(images)
+            # Reassign so the JSON column is flagged dirty
+            job.errors = list(self._errors)
+            await self.db.commit()
+            return imported
+        except ROW_ERRORS:
+            await self._rollback(saved)
+            raise
+
+    async def _rollback(self, counters: dict):
+        await self.db.rollback()
+        await self.db.refresh(self.job)
+        for field, value in counters.items():
+            setattr(self.job, field, value)
+
+    async def _finish(self, status: models.ImportStatus):
+        job = self.job
+        try:
+            # Whatever an interrupted step left in the transaction is dropped first
+            await self._rollback({field: getattr(job, field) for field in JOB_COUNTERS})
+            job.errors = list(self._errors)
+            job.status = status
+            job.finished_at = datetime.utcnow()
+            await self.db.commit()
+        except Exception:
+            logger.exception("Import %s: could not record the job's final status", self.job_id)
+
+
+def _database_error(exc: Exception) -> str:
+    return f"rejected by the database: {getattr(exc, 'orig', None) or exc}"[:500]
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (ip.is_multicast or ip.is_reserved or ip.is_unspecified)
+
+
+async def resolve_public(url: httpx.URL) -> str:
+    """An address to fetch ``url`` from, provided every address its host resolves to is public.
+
+    Import URLs come from agencies, so without this check the server could be
+    made to fetch (and then publish) loopback, private-network or cloud
+    metadata endpoints.
+    """
+    if url.scheme not in ("http", "https") or not url.host:
+        raise ValueError(f"not an http(s) URL: {url}")
+    port = url.port or (443 if url.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        raise ValueError(f"cannot resolve {url.host}: {exc}")
+    addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        if not _is_public(address):
+            raise ValueError(f"{url.host} resolves to a non-public address ({address})")
+    return addresses[0]
+
+
+class ImageFetcher:
+    """Downloads imported image URLs into our storage, one task per job.
+
+    Rows still carrying ``import_job_id`` are the queue, so memory stays flat
+    however many images a job has, and jobs interrupted by a restart are
+    picked up again by ``start``. Fetched files are deduplicated by content
+    hash and handed to the variant pipeline like direct uploads.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, concurrency: int = IMPORT_IMAGE_FETCH_CONCURRENCY):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.on_updated = None
+        self._client = None
+        self._semaphore = None
+        self._tasks = {}
+        self.fetched = 0
+        self.failed = 0
+
+    async def start(self, on_updated=None):
+        """Open the HTTP client and resume jobs a previous process left unfinished."""
+        if on_updated is not None:
+            self.on_updated = on_updated
+        if self._client is not None:
+            return
+        self._open()
+        PropertyImage = models.PropertyImage
+        async with self.session_factory() as db:
+            job_ids = (await db.scalars(
+                select(PropertyImage.import_job_id).where(PropertyImage.import_job_id.is_not(None)).distinct()
+            )).all()
+        for job_id in job_ids:
+            await self.submit(job_id)
+
+    def _open(self):
+        # Redirects are followed by _download, which checks every hop
+        self._client = httpx.AsyncClient(timeout=IMPORT_IMAGE_TIMEOUT, follow_redirects=False)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def submit(self, job_id: int):
+        """Fetch the job's queued images in the background; returns without waiting."""
+        if self._client is None:
+            self._open()
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: int):
+        try:
+            await self._drain(job_id)
+        except Exception:
+            # Rows keep their import_job_id, so the next start picks them up again
+            logger.exception("Import %s: image fetching stopped", job_id)
+
+    async def _drain(self, job_id: int):
+        while True:
+            batch = await self.claim(job_id)
+            if not batch:
+                return
+            await asyncio.gather(*(self._fetch_one(job_id, *image) for image in batch))
+
+    async def claim(self, job_id: int):
+        """Lease a batch of the job's unfetched images; SKIP LOCKED keeps concurrent workers apart.
+
+        Every worker resumes the same unfinished jobs at startup, so without
+        the lease each image would be downloaded and counted once per worker.
+        """
+        PropertyImage = models.PropertyImage
+        now = datetime.utcnow()
+        unleased = and_(
+            PropertyImage.import_job_id == job_id,
+            or_(PropertyImage.import_leased_until.is_(None), PropertyImage.import_leased_until <= now),
+        )
+        async with self.session_factory() as db:
+            batch = (await db.execute(
+                select(PropertyImage.id, PropertyImage.property_id, PropertyImage.url)
+                .where(unleased)
+                .order_by(PropertyImage.id)
+                .limit(IMAGE_FETCH_BATCH)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not batch:
+                return []
+            # Re-checked in the UPDATE for databases without row locks (SQLite)
+            claimed = set((await db.scalars(
+                update(PropertyImage)
+                .where(PropertyImage.id.in_([image.id for image in batch]), unleased)
+                .values(import_leased_until=now + timedelta(seconds=IMPORT_IMAGE_LEASE_SECONDS))
+                .returning(PropertyImage.id)
+                .execution_options(synchronize_session=False)
+            )).all())
+            await db.commit()
+        return [image for image in batch if image.id in claimed]
+
+    async def _fetch_one(self, job_id: int, image_id: int, property_id: int, url: str):
+        async with self._semaphore:
+            try:
+                spool, digest = await self._download(url)
+            except Exception as exc:
+                logger.warning("Import %s: could not fetch %s: %r", job_id, url, exc)
+                # Keep the source URL so the listing still shows something
+                if await self._finish(job_id, image_id, {}, fetched=False):
+                    self.failed += 1
+                return
+
+            try:
+                async with self.session_factory() as db:
+                    known = (await find_stored(db, [digest])).get(digest)
+                if known is not None:
+                    values = {"url": known.url, "storage_key": known.storage_key, "width": known.width,
+                              "height": known.height, "variants": known.variants}
+                    stored = None
+                else:
+                    stored = (await storage.upload_files(
+                        [(spool, os.path.basename(url.split("?")[0]))], circuit=storage.background_breaker,
+                    ))[0]
+                    values = {"url": stored.url, "storage_key": stored.key}
+            except Exception as exc:
+                logger.warning("Import %s: could not store %s: %r", job_id, url, exc)
+                if await self._finish(job_id, image_id, {}, fetched=False):
+                    self.failed += 1
+                return
+            finally:
+                spool.close()
+
+        if not await self._finish(job_id, image_id, {**values, "content_hash": digest}, fetched=True):
+            # Our lease ran out and another worker finished the image first
+            if stored is not None:
+                await storage.discard_files([stored])
+            return
+        self.fetched += 1
+        if stored is not None:
+            await pipeline.submit([(digest, stored)], on_updated=self.on_updated)
+        elif not values["variants"]:
+            await pipeline.submit(
+                [(digest, storage.StoredFile(values["url"], values["storage_key"]))], on_updated=self.on_updated
+            )
+        if self.on_updated is not None:
+            self.on_updated(property_id)
+
+    async def _download(self, url: str):
+        """Stream ``url`` into a spooled temp file, hashing as it arrives.
+
+        Each hop connects to the address ``resolve_public`` checked, not to
+        a second lookup of the name, so DNS can't be switched in between.
+        """
+        digest = hashlib.sha256()
+        spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        size = 0
+        target = httpx.URL(url)
+        try:
+            for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+                address = await resolve_public(target)
+                request = self._client.build_request(
+                    "GET",
+                    target.copy_with(host=address),
+                    headers={"Host": target.netloc.decode("ascii")},
+                    extensions={"sni_hostname": target.host} if target.scheme == "https" else {},
+                )
+                response = await self._client.send(request, stream=True)
+                try:
+                    if response.status_code in REDIRECT_STATUSES and "location" in response.headers:
+                        target = target.join(response.headers["location"])
+                        continue
+                    response.raise_for_status()
+                    content_type = response.headers.get("content-type", "")
+                    if not content_type.lower().startswith("image/"):
+                        raise ValueError(f"not an image: content-type {content_type[:100]!r}")
+                    if int(response.headers.get("content-length") or 0) > IMPORT_IMAGE_MAX_BYTES:
+                        raise ValueError(f"image larger than {IMPORT_IMAGE_MAX_BYTES} bytes")
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > IMPORT_IMAGE_MAX_BYTES:
+                            raise ValueError(f"image larger than {IMPORT_IMAGE_MAX_BYTES} bytes")
+                        digest.update(chunk)
+                        spool.write(chunk)
+                    break
+                finally:
+                    await response.aclose()
+            else:
+                raise ValueError(f"more than {IMAGE_FETCH_MAX_REDIRECTS} redirects")
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool, digest.hexdigest()
+
+    async def _finish(self, job_id: int, image_id: int, values: dict, fetched: bool) -> bool:
+        """Store the outcome and count it, unless another worker already finished the image."""
+        ImportJob, PropertyImage = models.ImportJob, models.PropertyImage
+        counter = ImportJob.images_fetched if fetched else ImportJob.images_failed
+        async with self.session_factory() as db:
+            finished = await db.execute(
+                update(PropertyImage)
+                .where(PropertyImage.id == image_id, PropertyImage.import_job_id == job_id)
+                .values(**values, import_job_id=None, import_leased_until=None)
+                .execution_options(synchronize_session=False)
+            )
+            if not finished.rowcount:
+                return False
+            await db.execute(
+                update(ImportJob)
+                .where(ImportJob.id == job_id)
+                .values({counter: counter + 1})
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return True
+
+    def stats(self) -> dict:
+        return {"jobs": len(self._tasks), "fetched": self.fetched, "failed": self.failed}
+
+
+image_fetcher = ImageFetcher()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import insert
+
+from app.config.settings import get_settings
+from app.database import AsyncSessionLocal
+from app.models import models
+from app.services.conversations import record_messages
+from app.services.replica import sticky_writes
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+MESSAGE_BATCH_SIZE = settings.message_batch_size
+MESSAGE_BATCH_LINGER_MS = settings.message_batch_linger_ms
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+_STOP = object()
+
+
+class MessageWriter:
+    """Group-commits websocket messages.
+
+    Callers enqueue a row and await its future; a single flusher task collects
+    rows from every connection for up to ``linger`` seconds (or until
+    ``batch_size`` rows are waiting), writes them with one multi-row
+    INSERT ... RETURNING and one commit, then resolves every future with the
+    stored row. Callers therefore only ack once their row is durable.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, batch_size: int = MESSAGE_BATCH_SIZE,
+                 linger_ms: float = MESSAGE_BATCH_LINGER_MS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.messages = 0
+        self.failures = 0
+        self.max_batch = 0
+        self.batch_size_counts = {str(bound): 0 for bound in BATCH_SIZE_BUCKETS + ("+Inf",)}
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def write(self, sender_id: int, receiver_id: int, content: str, property_id: int = None) -> dict:
+        if self._task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        values = {
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "content": content,
+            "property_id": property_id,
+        }
+        await self._queue.put((values, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            rows = await self._insert([values for values, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                self.failures += 1
+                _resolve(batch[0][1], exc=exc)
+                return
+            # Retry row by row so one bad message doesn't fail its neighbours
+            logger.warning("Message batch of %d failed (%s); retrying individually", len(batch), exc)
+            for item in batch:
+                await self._flush([item])
+            return
+        elapsed = time.perf_counter() - started
+
+        for (_, future), row in zip(batch, rows):
+            # The sender's next reads must see this message, even over HTTP
+            sticky_writes.mark(row.sender_id)
+            _resolve(future, result=dict(row._mapping))
+
+        size = len(batch)
+        self.batches += 1
+        self.messages += size
+        self.max_batch = max(self.max_batch, size)
+        bucket = next((bound for bound in BATCH_SIZE_BUCKETS if size <= bound), "+Inf")
+        self.batch_size_counts[str(bucket)] += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    async def _insert(self, rows):
+        Message = models.Message
+        statement = insert(Message).returning(
+            Message.id,
+            Message.content,
+            Message.sender_id,
+            Message.receiver_id,
+            Message.property_id,
+            sort_by_parameter_order=True,
+        )
+        async with self.session_factory() as db:
+            result = await db.execute(statement, rows)
+            stored = result.all()
+            await record_messages(db, stored)
+            await db.commit()
+        return stored
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "failures": self.failures,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch": self.max_batch,
+            "mean_batch": round(self.messages / self.batches, 2) if self.batches else 0.0,
+            "batch_size_buckets": dict(self.batch_size_counts),
+            "flush_seconds_total": round(self.flush_seconds_total, 6),
+            "flush_seconds_max": round(self.flush_seconds_max, 6),
+            "flush_seconds_mean": round(self.flush_seconds_total / self.batches, 6) if self.batches else 0.0,
+        }
+
+
+def _resolve(future, result=None, exc=None):
+    # The caller may have gone away (socket closed) while its row was in flight
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,185 @@
+"""Read-replica health and read-your-writes stickiness.
+
+Reads are routed by ``app.database.get_read_db``: to the replica while it is
+healthy, unless the client wrote recently. A successful unsafe request
+(POST/PUT/PATCH/DELETE) sets a short-lived cookie naming the time until
+which that client's reads stay on the primary, so it never reads a replica
+that has not caught up with its own write.
+
+The cookie only comes back from same-site browsers, so writes are also
+marked by user id (from the bearer token, or by the message writer for
+websocket messages) in ``sticky_writes``. That store is in-process by
+default; plug a shared CacheBackend into ``sticky_writes.backend`` so every
+worker sees the mark.
+"""
+import asyncio
+import logging
+import time
+
+from jose import JWTError, jwt
+from sqlalchemy import event, text
+from starlette.datastructures import Headers
+
+from app.config.settings import get_settings
+from app.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+REPLICA_STICKY_SECONDS = settings.replica_sticky_seconds
+STICKY_COOKIE = "db_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Replay lag on a Postgres standby; 0 when it has replayed everything it received
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def bearer_user_id(headers: Headers):
+    """The ``user_id`` claim of a valid bearer token in ``headers``, else None."""
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("user_id")
+    except JWTError:
+        return None
+
+
+class StickyWrites:
+    """Users who wrote within the last ``seconds``; their reads go to the primary.
+
+    A no-op unless ``enabled`` (a replica is configured), so single-database
+    deployments pay nothing for it.
+    """
+
+    def __init__(self, seconds: float, enabled: bool):
+        self.seconds = seconds
+        self.enabled = enabled
+        self.backend = LRUCache(max_entries=100_000, ttl=seconds)
+
+    def mark(self, user_id):
+        if self.enabled and user_id:
+            self.backend.set(f"db-primary-until:{user_id}", time.time() + self.seconds, ttl=self.seconds)
+
+    def pinned(self, user_id) -> bool:
+        if not self.enabled or not user_id:
+            return False
+        until = self.backend.get(f"db-primary-until:{user_id}")
+        return until is not None and until > time.time()
+
+
+sticky_writes = StickyWrites(REPLICA_STICKY_SECONDS, enabled=bool(settings.database_replica_url))
+
+
+def pinned_to_primary(request) -> bool:
+    """Whether this client, by cookie or by user, wrote within the sticky window."""
+    if not sticky_writes.enabled:
+        return False
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    return sticky_writes.pinned(bearer_user_id(request.headers))
+
+
+class ReplicaMonitor:
+    """Pings the replica in the background and flags it unhealthy when it is
+    unreachable or lags more than ``max_lag`` seconds. A disconnect seen by
+    any request also flags it at once; the next good ping clears it."""
+
+    def __init__(self, engine, interval: float, timeout: float, max_lag: float):
+        self.engine = engine
+        self.interval = interval
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self.healthy = True
+        self.lag = None
+        # Start of the last check that found nothing left to replay (epoch seconds)
+        self.caught_up_at = None
+        self.last_error = None
+        self.fallbacks = 0
+        self._task = None
+        event.listen(engine.sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.mark_unhealthy(repr(context.original_exception))
+
+    def mark_unhealthy(self, reason: str):
+        if self.healthy:
+            logger.warning("Read replica unhealthy, reading from the primary: %s", reason)
+        self.healthy = False
+        self.last_error = reason
+
+    async def check(self):
+        started = time.time()
+        try:
+            async with self.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = await asyncio.wait_for(connection.scalar(LAG_QUERY), self.timeout)
+                else:
+                    await asyncio.wait_for(connection.execute(text("SELECT 1")), self.timeout)
+                    lag = 0.0
+        except Exception as exc:
+            self.mark_unhealthy(repr(exc))
+            return
+        self.lag = float(lag or 0)
+        if self.lag == 0:
+            self.caught_up_at = started
+        if self.lag > self.max_lag:
+            self.mark_unhealthy(f"replication lag {self.lag:.1f}s")
+        elif not self.healthy:
+            logger.info("Read replica healthy again")
+            self.healthy = True
+            self.last_error = None
+
+    async def _run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            await self.check()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "lag_seconds": self.lag, "caught_up_at": self.caught_up_at,
+                "last_error": self.last_error, "fallbacks": self.fallbacks}
+
+
+class ReadYourWritesMiddleware:
+    """Marks the writer (sticky cookie and user id) on successful unsafe HTTP
+    requests (pure ASGI). Passes everything through when no replica is configured."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not sticky_writes.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                sticky_writes.mark(bearer_user_id(Headers(scope=scope)))
+                seconds = sticky_writes.seconds
+                until = time.time() + seconds
+                cookie = (
+                    f"{STICKY_COOKIE}={until:.3f}; Max-Age={int(seconds) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
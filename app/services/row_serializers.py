@@ -0,0 +1,91 @@
+"""List responses built straight from row tuples and encoded with orjson.
+
+The hot list endpoints select plain columns instead of ORM entities, so
+there is no identity map, no attribute instrumentation and no per-object
+validation. The rows are assembled into dicts with exactly the fields of
+their response schema. The values come from our own columns, so they need
+no checking on the way out. Keep the field lists in step with
+PropertyOut / PropertyImageOut / MessageOut.
+"""
+import orjson
+from sqlalchemy import select
+
+from app.config.settings import get_settings
+from app.database import read_sessionmaker
+from app.models import models
+
+settings = get_settings()
+STREAM_BATCH_SIZE = settings.stream_batch_size
+
+PROPERTY_FIELDS = ("title", "description", "price", "location", "latitude", "longitude", "id", "owner_id")
+IMAGE_FIELDS = ("id", "url", "width", "height")
+VARIANT_FIELDS = ("url", "width", "height")
+MESSAGE_FIELDS = ("content", "id", "sender_id", "receiver_id", "property_id", "created_at", "read_at")
+
+
+def property_columns():
+    return [getattr(models.Property, field) for field in PROPERTY_FIELDS]
+
+
+def message_columns():
+    return [getattr(models.Message, field) for field in MESSAGE_FIELDS]
+
+
+def _variants(variants) -> dict:
+    # Stored variants also carry their storage key, which PropertyImageOut leaves out
+    return {name: {field: variant[field] for field in VARIANT_FIELDS} for name, variant in (variants or {}).items()}
+
+
+async def property_dicts(db, rows) -> list:
+    """PropertyOut-shaped dicts for ``rows`` (from ``property_columns()``), images in one query."""
+    items = [dict(zip(PROPERTY_FIELDS, row)) for row in rows]
+    by_id = {}
+    for item in items:
+        item["images"] = []
+        by_id[item["id"]] = item["images"]
+    if by_id:
+        PropertyImage = models.PropertyImage
+        images = await db.execute(
+            select(PropertyImage.property_id, *(getattr(PropertyImage, field) for field in IMAGE_FIELDS),
+                   PropertyImage.variants)
+            .where(PropertyImage.property_id.in_(by_id))
+            .order_by(PropertyImage.id)
+        )
+        for property_id, image_id, url, width, height, variants in images:
+            by_id[property_id].append(
+                {"id": image_id, "url": url, "width": width, "height": height, "variants": _variants(variants)}
+            )
+    return items
+
+
+def message_dicts(rows) -> list:
+    return [dict(zip(MESSAGE_FIELDS, row)) for row in rows]
+
+
+def dumps(content) -> bytes:
+    # orjson writes naive datetimes the way pydantic does, without a UTC offset
+    return orjson.dumps(content)
+
+
+async def stream_page(query, limit: int, to_items, next_cursor, primary: bool = False):
+    """Yield a ``{"items": [...], "next_cursor": ...}`` page as its rows come off the cursor.
+
+    ``to_items(db, rows)`` turns each batch of rows into response dicts and
+    ``next_cursor(last_row)`` builds the cursor when another page follows.
+    Like the exports, this runs on its own read session, because the
+    request's session is closed before a streamed body starts.
+    """
+    yield b'{"items":['
+    count, last, more = 0, None, False
+    async with read_sessionmaker(primary)() as db:
+        result = await db.stream(query.limit(limit + 1).execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            if count + len(rows) > limit:
+                rows, more = rows[:limit - count], True
+            if not rows:
+                break
+            items = b",".join(orjson.dumps(item) for item in await to_items(db, rows))
+            yield (b"," if count else b"") + items
+            count += len(rows)
+            last = rows[-1]
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor(last) if more else None) + b"}"
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import get_settings
+from app.database import AsyncSessionLocal
+from app.models import models
+
+settings = get_settings()
+SEARCH_INDEX_CHECK_INTERVAL = settings.search_index_check_interval
+
+# Field weights mirror the setweight() labels of the PostgreSQL tsvector column
+FIELD_WEIGHTS = {"title": 3.0, "location": 2.0, "description": 1.0}
+TS_CONFIG = "english"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or the to with".split()
+)
+
+
+def tokenize(text: str):
+    tokens = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        if token in _STOPWORDS:
+            continue
+        # Cheap plural folding so "apartments" matches "apartment"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class InvertedIndex:
+    """In-process full-text index used when the database has no native search.
+
+    Postings map each term to the weighted term frequency per property id, so a
+    query only touches the postings of its own terms instead of every row.
+
+    Each worker process holds its own copy. Writes made through this process
+    are applied at once; those arriving while a load runs are buffered and
+    replayed onto the new snapshot, so the load can't drop them. Writes made
+    by other processes are caught by ``refresh``, which compares the table's
+    generation (row count, max id, max updated_at) with the one last seen,
+    re-indexes new and edited rows, and reloads when rows were deleted elsewhere.
+    Both read the primary: a lagging replica could hand back an older
+    generation, and reloading from it would drop rows this process just added.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._lock = threading.Lock()
+        # (doc_id, fields or None for a removal) written while a load runs
+        self._pending = None
+        self._refresh_lock = None
+        self.generation = None
+        self.checked_at = 0.0
+        self.loads = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    async def load(self):
+        with self._lock:
+            self._pending = []
+        try:
+            async with self.session_factory() as db:
+                # Read before the rows: anything committed in between is seen again by refresh
+                generation = await _generation(db)
+                rows = await db.stream(
+                    select(
+                        models.Property.id,
+                        models.Property.title,
+                        models.Property.description,
+                        models.Property.location,
+                    ).execution_options(yield_per=1000)
+                )
+                postings = defaultdict(dict)
+                doc_terms = {}
+                async for row in rows:
+                    _index_document(postings, doc_terms, row.id, row.title, row.description, row.location)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for doc_id, fields in self._pending:
+                _unindex_document(postings, doc_terms, doc_id)
+                if fields is not None:
+                    _index_document(postings, doc_terms, doc_id, *fields)
+            self._pending = None
+            self._postings = postings
+            self._doc_terms = doc_terms
+            self.generation = generation
+            self.checked_at = time.monotonic()
+            self.loads += 1
+            self.loaded = True
+
+    async def refresh(self):
+        """Load on first use, then catch up with writes made by other processes."""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if not self.loaded:
+                await self.load()
+                return
+            if time.monotonic() - self.checked_at < SEARCH_INDEX_CHECK_INTERVAL:
+                return
+            async with self.session_factory() as db:
+                generation = await _generation(db)
+                self.checked_at = time.monotonic()
+                if generation == self.generation:
+                    return
+                _, max_id, max_updated = self.generation
+                changed = models.Property.id > (max_id or 0)
+                if max_updated is not None:
+                    changed = or_(changed, models.Property.updated_at >= max_updated)
+                rows = await db.execute(
+                    select(
+                        models.Property.id,
+                        models.Property.title,
+                        models.Property.description,
+                        models.Property.location,
+                    ).where(changed)
+                )
+                for row in rows:
+                    self.add(row.id, row.title, row.description, row.location)
+            if len(self) != generation[0]:
+                # Rows were deleted by another process
+                await self.load()
+            else:
+                self.generation = generation
+
+    def add(self, doc_id: int, title: str, description: str, location: str):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc_id, (title, description, location)))
+            elif not self.loaded:
+                return
+            _unindex_document(self._postings, self._doc_terms, doc_id)
+            _index_document(self._postings, self._doc_terms, doc_id, title, description, location)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc_id, None))
+            _unindex_document(self._postings, self._doc_terms, doc_id)
+
+    def search(self, query: str, limit: int, offset: int = 0):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            # Intersect starting from the rarest term to keep the candidate set small
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+            total = len(self._doc_terms)
+            idf = [math.log(1 + total / len(posting)) for posting in postings]
+            scored = (
+                (sum(w * posting[doc_id] for w, posting in zip(idf, postings)), doc_id)
+                for doc_id in candidates
+            )
+            top = heapq.nlargest(offset + limit, scored)
+        return [doc_id for _, doc_id in top[offset:]]
+
+
+async def _generation(db: AsyncSession):
+    row = (await db.execute(
+        select(func.count(), func.max(models.Property.id), func.max(models.Property.updated_at))
+    )).one()
+    return tuple(row)
+
+
+def _index_document(postings, doc_terms, doc_id, title, description, location):
+    frequencies = defaultdict(float)
+    for field, text in (("title", title), ("location", location), ("description", description)):
+        for token in tokenize(text):
+            frequencies[token] += FIELD_WEIGHTS[field]
+    for term, weight in frequencies.items():
+        postings[term][doc_id] = weight
+    doc_terms[doc_id] = frozenset(frequencies)
+
+
+def _unindex_document(postings, doc_terms, doc_id):
+    for term in doc_terms.pop(doc_id, ()):
+        posting = postings.get(term)
+        if posting is None:
+            continue
+        posting.pop(doc_id, None)
+        if not posting:
+            del postings[term]
+
+
+property_index = InvertedIndex()
+
+
+def uses_native_search(db: AsyncSession) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
+
+def index_property(db: AsyncSession, prop: models.Property):
+    """Keep the in-process index in step with a created or updated property."""
+    if uses_native_search(db):
+        return
+    property_index.add(prop.id, prop.title, prop.description, prop.location)
+
+
+def unindex_property(db: AsyncSession, property_id: int):
+    if uses_native_search(db):
+        return
+    property_index.remove(property_id)
+
+
+async def search_properties(db: AsyncSession, q: str, limit: int, offset: int = 0):
+    if uses_native_search(db):
+        search_vector = literal_column("properties.search_vector")
+        ts_query = func.websearch_to_tsquery(TS_CONFIG, q)
+        result = await db.scalars(
+            select(models.Property)
+            .options(selectinload(models.Property.images))
+            .where(search_vector.op("@@")(ts_query))
+            .order_by(func.ts_rank(search_vector, ts_query).desc(), models.Property.id.desc())
+            .offset(offset)
+            .limit(limit)
+        )
+        return result.all()
+
+    await property_index.refresh()
+    ids = property_index.search(q, limit, offset)
+    if not ids:
+        return []
+    props = (await db.scalars(
+        select(models.Property)
+        .options(selectinload(models.Property.images))
+        .where(models.Property.id.in_(ids))
+    )).all()
+    by_id = {prop.id: prop for prop in props}
+    return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
@@ -0,0 +1,192 @@
+"""Opt-in SQL profiling: per-request query counts, N+1 shapes and slow queries.
+
+Enable with SQL_PROFILER_ENABLED=true. Cursor events on both engines record
+every statement into the QueryLogs active in the running context: the
+current request's and those of any enclosing ``capture_queries`` block. They
+live in a contextvar, so concurrent requests and tests don't mix. Statements
+slower than SQL_SLOW_QUERY_MS are logged with their parameters and the
+database's plan.
+"""
+import logging
+import re
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger("app.sql")
+
+settings = get_settings()
+SQL_PROFILER_ENABLED = settings.sql_profiler_enabled
+SQL_SLOW_QUERY_MS = settings.sql_slow_query_ms
+SQL_N_PLUS_ONE_THRESHOLD = settings.sql_n_plus_one_threshold
+SQL_EXPLAIN_SLOW = settings.sql_explain_slow
+
+Query = namedtuple("Query", "statement parameters seconds")
+
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Every QueryLog collecting in this context, innermost last
+_current = ContextVar("sql_query_logs", default=())
+_installed = set()
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so IN lists of any length compare equal."""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def add(self, query: Query):
+        self.queries.append(query)
+
+    @property
+    def seconds(self) -> float:
+        return sum(query.seconds for query in self.queries)
+
+    def repeated_shapes(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> dict:
+        """Statement shapes run at least ``threshold`` times: likely N+1 loops."""
+        counts = Counter(statement_shape(query.statement) for query in self.queries)
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+    def describe(self) -> str:
+        return "\n".join(
+            f"  {query.seconds * 1000:7.2f}ms  {statement_shape(query.statement)}" for query in self.queries
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["sql_profiler_started"].pop()
+    query = Query(statement, parameters, time.perf_counter() - started)
+    for log in _current.get():
+        log.add(query)
+    if query.seconds * 1000 >= SQL_SLOW_QUERY_MS:
+        _log_slow_query(conn, query, executemany)
+
+
+def _log_slow_query(conn, query: Query, executemany: bool):
+    plan = None
+    if SQL_EXPLAIN_SLOW and not executemany and query.statement.lstrip().upper().startswith("SELECT"):
+        plan = _explain(conn, query)
+    logger.warning(
+        "Slow query (%.1fms): %s\nparameters: %.500r%s",
+        query.seconds * 1000,
+        query.statement,
+        query.parameters,
+        f"\nplan:\n{plan}" if plan else "",
+    )
+
+
+def _explain(conn, query: Query):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    # A separate DBAPI cursor, so the profiled statement's results are untouched
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + query.statement, query.parameters)
+        return "\n".join("  " + " ".join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as exc:
+        return f"  (EXPLAIN failed: {exc!r})"
+    finally:
+        cursor.close()
+
+
+def install(*engines):
+    """Attach the cursor listeners to ``engines`` (default: the app's engines) once."""
+    if not engines:
+        from app.database import async_engine, async_read_engine, engine
+
+        engines = {engine, async_engine.sync_engine, async_read_engine.sync_engine}
+    for engine in engines:
+        if engine in _installed:
+            continue
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _installed.add(engine)
+
+
+@contextmanager
+def _collect(log: QueryLog):
+    token = _current.set(_current.get() + (log,))
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def capture_queries():
+    """Collect the statements run inside the block by this context and the
+    tasks it starts; other requests running meanwhile are not counted."""
+    install()
+    with _collect(QueryLog()) as log:
+        yield log
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail a test when the block runs more than ``limit`` statements.
+
+        with assert_max_queries(3):
+            client.get("/properties/")
+    """
+    with capture_queries() as log:
+        yield log
+    if len(log) > limit:
+        raise AssertionError(f"{len(log)} queries exceeded the budget of {limit}:\n{log.describe()}")
+
+
+class SQLProfilerMiddleware:
+    """Gives each HTTP request its own QueryLog and reports it.
+
+    Adds ``X-DB-Queries`` and a ``Server-Timing`` db entry to responses, and
+    logs requests whose log repeats a statement shape SQL_N_PLUS_ONE_THRESHOLD
+    or more times.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        install()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(len(log)).encode()))
+                headers.append((b"server-timing", f"db;dur={log.seconds * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with _collect(log):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            repeated = log.repeated_shapes()
+            if repeated:
+                logger.warning(
+                    "Possible N+1 in %s %s: %d queries, repeated shapes:\n%s",
+                    scope["method"],
+                    scope["path"],
+                    len(log),
+                    "\n".join(f"  {count}x {shape}" for shape, count in repeated.items()),
+                )
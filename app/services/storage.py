@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+STORAGE_BACKEND = settings.storage_backend
+MEDIA_ROOT = settings.media_root
+MEDIA_URL = settings.media_url
+UPLOAD_WORKERS = settings.upload_workers
+UPLOAD_TIMEOUT = settings.upload_timeout
+UPLOAD_BREAKER_THRESHOLD = settings.upload_breaker_threshold
+UPLOAD_BREAKER_RESET = settings.upload_breaker_reset
+
+StoredFile = namedtuple("StoredFile", "url key")
+
+
+class UploadError(Exception):
+    pass
+
+
+class StorageBackend:
+    """Blocking file storage; callers run it on the upload pool."""
+
+    def save(self, fileobj, filename: str) -> StoredFile:
+        raise NotImplementedError
+
+    def read(self, stored: StoredFile) -> bytes:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class CloudinaryStorage(StorageBackend):
+    def save(self, fileobj, filename):
+        from app.services.cloudinary_config import configure_cloudinary
+        import cloudinary.uploader
+
+        configure_cloudinary()
+
+        uploaded = cloudinary.uploader.upload(fileobj, timeout=UPLOAD_TIMEOUT)
+        return StoredFile(uploaded["secure_url"], uploaded["public_id"])
+
+    def read(self, stored):
+        import httpx
+
+        response = httpx.get(stored.url, timeout=UPLOAD_TIMEOUT, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+
+    def delete(self, key):
+        from app.services.cloudinary_config import configure_cloudinary
+        import cloudinary.uploader
+
+        configure_cloudinary()
+
+        cloudinary.uploader.destroy(key)
+
+
+class LocalStorage(StorageBackend):
+    """Writes under MEDIA_ROOT and serves from MEDIA_URL; for tests and offline runs."""
+
+    def __init__(self, root: str = MEDIA_ROOT, base_url: str = MEDIA_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, fileobj, filename):
+        os.makedirs(self.root, exist_ok=True)
+        extension = os.path.splitext(filename or "")[1].lower()
+        key = uuid.uuid4().hex + extension
+        with open(os.path.join(self.root, key), "wb") as target:
+            while True:
+                chunk = fileobj.read(1024 * 1024)
+                if not chunk:
+                    break
+                target.write(chunk)
+        return StoredFile(f"{self.base_url}/{key}", key)
+
+    def read(self, stored):
+        with open(os.path.join(self.root, stored.key), "rb") as source:
+            return source.read()
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+class CircuitBreaker:
+    """Stops calling a failing backend for ``reset_after`` seconds.
+
+    After ``threshold`` consecutive failures the breaker opens and uploads
+    fail fast. Once the cool-down passes it is half-open: a single trial
+    batch is let through while everyone else still fails fast, and the
+    trial's outcome closes or re-opens it. A trial that never reports back
+    (its request was cancelled) stops blocking others after ``reset_after``.
+    """
+
+    def __init__(self, threshold: int = UPLOAD_BREAKER_THRESHOLD, reset_after: float = UPLOAD_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            now = time.monotonic()
+            if self.trial_started is not None and now - self.trial_started < self.reset_after:
+                return False
+            self.trial_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_started = None
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def _make_backend() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage()
+    return CloudinaryStorage()
+
+
+backend = _make_backend()
+breaker = CircuitBreaker()
+# Variant builds and import fetches: a separate breaker, so background
+# failures never turn user uploads away
+background_breaker = CircuitBreaker()
+# Uploads that finished after their request gave up on them, and were deleted
+late_saves_discarded = 0
+_upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_upload_executor, func, *args)
+
+
+async def upload_files(files, circuit: CircuitBreaker = None):
+    """Upload ``(fileobj, filename)`` pairs concurrently; all succeed or none are kept.
+
+    Raises UploadError when the breaker is open or any upload fails or times
+    out; files that did upload are deleted again on a best-effort basis.
+    ``circuit`` defaults to ``breaker``, which guards user requests; background work
+    passes ``background_breaker`` so it can't trip that one or take its
+    half-open trial.
+    """
+    if not files:
+        # Nothing to upload: don't fail while open, nor spend a half-open trial
+        return []
+    circuit = circuit or breaker
+    if not circuit.allow():
+        raise UploadError("Image storage is temporarily unavailable")
+
+    async def upload(fileobj, filename):
+        future = asyncio.get_running_loop().run_in_executor(_upload_executor, backend.save, fileobj, filename)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), UPLOAD_TIMEOUT)
+        except BaseException:
+            # Timed out or cancelled: the thread keeps going, so delete what it saves
+            future.add_done_callback(_discard_late_save)
+            raise
+
+    results = await asyncio.gather(
+        *(upload(fileobj, filename) for fileobj, filename in files),
+        return_exceptions=True,
+    )
+    stored = [result for result in results if isinstance(result, StoredFile)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if not errors:
+        circuit.record_success()
+        return stored
+
+    for error in errors:
+        logger.warning("Image upload failed: %r", error)
+        circuit.record_failure()
+    await discard_files(stored)
+    raise UploadError(f"{len(errors)} of {len(results)} image uploads failed")
+
+
+def _discard_late_save(future):
+    global late_saves_discarded
+    if future.cancelled() or future.exception() is not None:
+        return
+    late_saves_discarded += 1
+    _upload_executor.submit(_delete_quietly, future.result().key)
+
+
+def _delete_quietly(key: str):
+    try:
+        backend.delete(key)
+    except Exception as exc:
+        logger.warning("Could not delete late upload %s: %r", key, exc)
+
+
+async def read_file(stored: StoredFile) -> bytes:
+    return await asyncio.wait_for(_run(backend.read, stored), UPLOAD_TIMEOUT)
+
+
+async def discard_files(stored):
+    for item in stored:
+        try:
+            await _run(backend.delete, item.key)
+        except Exception as exc:
+            logger.warning("Could not delete orphaned upload %s: %r", item.key, exc)
@@ -0,0 +1,214 @@
+"""Delivers the email outbox: ``python -m app.workers.email_worker``.
+
+Runs beside the web workers (any number of copies). Each pass claims a
+batch of due rows, sends them over a small pool of persistent SMTP
+connections and records the outcome; failures are retried with
+exponential backoff until OUTBOX_MAX_ATTEMPTS.
+"""
+import argparse
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import aiosmtplib
+from sqlalchemy import select, update
+
+from app.config.settings import get_settings
+from app.database import AsyncSessionLocal
+from app.models.models import EmailOutbox, OutboxStatus
+
+logger = logging.getLogger("app.workers.email_worker")
+
+settings = get_settings()
+SMTP_HOST = settings.smtp_host
+SMTP_PORT = settings.smtp_port
+# Implicit TLS (465) by default; set SMTP_USE_TLS=false for STARTTLS or the local sink
+SMTP_USE_TLS = settings.smtp_use_tls
+SMTP_STARTTLS = settings.smtp_starttls
+SMTP_USERNAME = settings.smtp_username or settings.email
+SMTP_PASSWORD = settings.smtp_password or settings.password
+SMTP_TIMEOUT = settings.smtp_timeout
+SMTP_POOL_SIZE = settings.smtp_pool_size
+MAIL_FROM = settings.mail_from or settings.email
+
+OUTBOX_BATCH_SIZE = settings.outbox_batch_size
+OUTBOX_POLL_INTERVAL = settings.outbox_poll_interval
+OUTBOX_MAX_ATTEMPTS = settings.outbox_max_attempts
+OUTBOX_BACKOFF_BASE = settings.outbox_backoff_base
+OUTBOX_BACKOFF_MAX = settings.outbox_backoff_max
+# A claimed row becomes due again after this long, so a crashed worker's batch is retried
+OUTBOX_LEASE_SECONDS = settings.outbox_lease_seconds
+
+
+def _smtp_client():
+    return aiosmtplib.SMTP(
+        hostname=SMTP_HOST,
+        port=SMTP_PORT,
+        username=SMTP_USERNAME if SMTP_PASSWORD else None,
+        password=SMTP_PASSWORD or None,
+        use_tls=SMTP_USE_TLS,
+        start_tls=SMTP_STARTTLS,
+        timeout=SMTP_TIMEOUT,
+    )
+
+
+class SMTPPool:
+    """A few long-lived SMTP sessions shared by every send.
+
+    Connections are opened on first use and kept for the life of the worker,
+    so a burst of signups costs ``size`` TLS handshakes, not one per mail. A
+    session the server has dropped is reconnected once before giving up.
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE, factory=_smtp_client):
+        self.size = size
+        self.factory = factory
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+        self.connects = 0
+
+    async def send(self, message: EmailMessage):
+        client = await self._idle.get()
+        try:
+            for attempt in (1, 2):
+                if client is None or not client.is_connected:
+                    client = self.factory()
+                    await client.connect()
+                    self.connects += 1
+                try:
+                    await client.send_message(message)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    client = None
+                    if attempt == 2:
+                        raise
+        except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPResponseException):
+            # The server rejected this mail; the session itself is still good
+            raise
+        except Exception:
+            await _quietly_close(client)
+            client = None
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+    async def close(self):
+        while not self._idle.empty():
+            await _quietly_close(self._idle.get_nowait())
+
+
+async def _quietly_close(client):
+    if client is None or not client.is_connected:
+        return
+    try:
+        await client.quit()
+    except Exception:
+        client.close()
+
+
+def build_message(row) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = row.recipient
+    message["Subject"] = row.subject
+    message.set_content(row.body, subtype="html")
+    return message
+
+
+def backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class EmailWorker:
+    def __init__(self, session_factory=AsyncSessionLocal, pool: SMTPPool = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.session_factory = session_factory
+        self.pool = pool or SMTPPool()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self.failed = 0
+
+    async def run(self, once: bool = False):
+        try:
+            while True:
+                sent = await self.run_batch()
+                if once and not sent:
+                    return
+                if sent < self.batch_size:
+                    await asyncio.sleep(0 if once else self.poll_interval)
+        finally:
+            await self.pool.close()
+
+    async def claim(self):
+        """Lease a batch of due rows; SKIP LOCKED keeps concurrent workers apart."""
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            rows = (await db.scalars(
+                select(EmailOutbox)
+                .where(EmailOutbox.status == OutboxStatus.pending, EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if rows:
+                await db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id.in_([row.id for row in rows]))
+                    .values(
+                        attempts=EmailOutbox.attempts + 1,
+                        next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        return rows
+
+    async def run_batch(self) -> int:
+        rows = await self.claim()
+        if not rows:
+            return 0
+        results = await asyncio.gather(
+            *(self.pool.send(build_message(row)) for row in rows), return_exceptions=True
+        )
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            for row, result in zip(rows, results):
+                attempts = row.attempts + 1
+                if not isinstance(result, BaseException):
+                    values = {"status": OutboxStatus.sent, "sent_at": now, "dedup_key": None, "last_error": None}
+                    self.sent += 1
+                elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                    values = {"status": OutboxStatus.failed, "dedup_key": None, "last_error": repr(result)}
+                    self.failed += 1
+                    logger.error("Giving up on mail %s to %s: %r", row.id, row.recipient, result)
+                else:
+                    values = {
+                        "next_attempt_at": now + timedelta(seconds=backoff(attempts)),
+                        "last_error": repr(result),
+                    }
+                    logger.warning("Mail %s to %s failed (attempt %d): %r", row.id, row.recipient, attempts, result)
+                await db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id == row.id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="drain due mail and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(EmailWorker().run(once=args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Local SMTP stand-in: ``python -m app.workers.smtp_sink [--port 1025]``.
+
+Accepts every mail and logs it instead of delivering, for development and
+tests. Point the email worker at it with SMTP_HOST=localhost SMTP_PORT=1025
+SMTP_USE_TLS=false. Messages received in-process are kept in ``SMTPSink.messages``.
+"""
+import argparse
+import asyncio
+import logging
+from email import message_from_bytes, policy
+
+logger = logging.getLogger("app.workers.smtp_sink")
+
+
+class SMTPSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025):
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.sessions = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        await self.start()
+        logger.info("SMTP sink listening on %s:%d", self.host, self.port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _session(self, reader, writer):
+        self.sessions += 1
+
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 lanvera SMTP sink")
+        sender, recipients = None, []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    await reply("250-lanvera")
+                    await reply("250-8BITMIME")
+                    await reply("250 SMTPUTF8")
+                elif verb == "HELO":
+                    await reply("250 lanvera")
+                elif verb == "MAIL":
+                    sender, recipients = command.split(":", 1)[1].strip(), []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[1].strip())
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data = await reader.readline()
+                        if data in (b".\r\n", b".\n", b""):
+                            break
+                        lines.append(data[1:] if data.startswith(b"..") else data)
+                    message = message_from_bytes(b"".join(lines), policy=policy.default)
+                    self.messages.append((sender, recipients, message))
+                    logger.info("Mail for %s: %s", ", ".join(recipients), message["Subject"])
+                    await reply("250 OK queued")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                elif verb in ("RSET", "NOOP"):
+                    sender, recipients = (None, []) if verb == "RSET" else (sender, recipients)
+                    await reply("250 OK")
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(SMTPSink(args.host, args.port).serve_forever())
+
+
+if __name__ == "__main__":
+    main()
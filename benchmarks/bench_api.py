@@ -0,0 +1,315 @@
+"""End-to-end API benchmark against a seeded database.
+
+Seeds the database (see benchmarks.seed), starts the real app in-process
+with its lifespan, and drives it through httpx's ASGI transport plus a
+minimal in-process websocket client. Image storage is replaced by a stub
+and mail only reaches the outbox (no email worker runs), so nothing leaves
+the process. Each scenario reports throughput and p50/p95/p99 latency; the
+results are written as JSON and can be compared against an earlier run.
+
+    python -m benchmarks.bench_api --requests 500 --concurrency 16
+    python -m benchmarks.bench_api --baseline benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from collections import namedtuple
+
+SCENARIOS = ("listing", "detail", "map", "login", "inbox", "websocket")
+
+# Enough of a User for user_token_claims()
+Account = namedtuple("Account", "id email role")
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run_scenario(operation, requests: int, concurrency: int) -> dict:
+    """Run ``operation(i)`` ``requests`` times with ``concurrency`` callers in flight."""
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def caller():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                await operation(index)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+class ASGIWebSocket:
+    """Just enough of a websocket client to talk to the app without a server."""
+
+    def __init__(self, app, path: str, query: str):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": [(b"host", b"bench")],
+            "client": ("bench", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self._to_app = asyncio.Queue()
+        self._from_app = asyncio.Queue()
+        self._task = None
+
+    async def connect(self):
+        await self._to_app.put({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._from_app.put))
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"websocket rejected: {message}")
+        return self
+
+    async def send_text(self, text: str):
+        await self._to_app.put({"type": "websocket.receive", "text": text})
+
+    async def receive_text(self) -> str:
+        message = await self._from_app.get()
+        if message["type"] != "websocket.send":
+            raise ConnectionError(f"websocket closed: {message}")
+        return message["text"]
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        await self._task
+
+
+class StubStorage:
+    def save(self, fileobj, filename):
+        from app.services.storage import StoredFile
+
+        return StoredFile(f"https://images.bench.example/{filename}", filename)
+
+    def read(self, stored):
+        return b""
+
+    def delete(self, key):
+        pass
+
+
+async def benchmark(args, dataset) -> dict:
+    import httpx
+
+    from app.main import app
+    from app.security import create_access_token, user_token_claims
+    from app.services import storage
+    from benchmarks.seed import LOCATIONS
+
+    storage.backend = StubStorage()
+    rng = random.Random(args.seed)
+    users = dataset["users"]
+    tokens = {
+        user_id: create_access_token(user_token_claims(Account(user_id, email, role)))
+        for user_id, email, role in users
+    }
+    property_ids = dataset["property_ids"]
+    locations = ["Lagos", "Lekki", "Ikoyi", "Abuja", "Kano"]
+    results = {}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def checked(response):
+                if response.status_code >= 400:
+                    raise RuntimeError(response.status_code)
+
+            async def listing(index):
+                params = {"limit": 20, "sort": rng.choice(["newest", "price_asc", "price_desc"])}
+                if rng.random() < 0.5:
+                    params["location"] = rng.choice(locations)
+                if rng.random() < 0.5:
+                    params["min_price"] = rng.randrange(0, 5_000_000, 250_000)
+                await checked(await client.get("/properties/", params=params))
+
+            async def detail(index):
+                await checked(await client.get(f"/properties/{rng.choice(property_ids)}"))
+
+            async def map_view(index):
+                # Viewports from street to city scale, and the occasional radius search
+                lat, lng = rng.choice(list(LOCATIONS.values()))
+                if rng.random() < 0.25:
+                    params = {"lat": lat, "lng": lng, "radius_km": rng.choice([1, 2, 5, 10])}
+                    await checked(await client.get("/properties/nearby", params=params))
+                    return
+                span = rng.choice([0.01, 0.05, 0.1, 0.3])
+                lat += rng.uniform(-0.1, 0.1)
+                lng += rng.uniform(-0.1, 0.1)
+                params = {"south": lat - span / 2, "north": lat + span / 2, "west": lng - span / 2, "east": lng + span / 2}
+                await checked(await client.get("/properties/within", params=params))
+
+            async def login(index):
+                _, email, _ = rng.choice(users)
+                await checked(await client.post("/auth/login", json={"email": email, "password": dataset["password"]}))
+
+            async def inbox(index):
+                user_id = rng.choice(dataset["user_ids"] + dataset["agency_ids"])
+                headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+                await checked(await client.get("/messages/inbox", headers=headers))
+
+            operations = {"listing": listing, "detail": detail, "map": map_view, "login": login, "inbox": inbox}
+            for name in args.scenarios:
+                if name in operations:
+                    requests = args.login_requests if name == "login" else args.requests
+                    results[name] = await run_scenario(operations[name], requests, args.concurrency)
+                    print(f"{name:<10} {_format(results[name])}", flush=True)
+
+        if "websocket" in args.scenarios:
+            results["websocket"] = await websocket_round_trips(app, args, dataset, tokens)
+            print(f"{'websocket':<10} {_format(results['websocket'])}", flush=True)
+    return results
+
+
+async def websocket_round_trips(app, args, dataset, tokens) -> dict:
+    """Sender-to-receiver delivery time, over ``concurrency`` user/agency pairs."""
+    pairs = list(zip(dataset["user_ids"], dataset["agency_ids"] * len(dataset["user_ids"])))[:args.concurrency]
+    sockets = []
+    for sender, receiver in pairs:
+        outgoing = await ASGIWebSocket(app, "/messages/ws", f"token={tokens[sender]}").connect()
+        incoming = await ASGIWebSocket(app, "/messages/ws", f"token={tokens[receiver]}").connect()
+        sockets.append((outgoing, incoming, receiver))
+
+    per_pair = max(1, args.requests // len(sockets))
+    latencies, errors = [], 0
+
+    async def converse(outgoing, incoming, receiver):
+        nonlocal errors
+        for index in range(per_pair):
+            started = time.perf_counter()
+            await outgoing.send_text(json.dumps({"receiver_id": receiver, "content": f"bench {index}"}))
+            delivered = json.loads(await incoming.receive_text())
+            latencies.append(time.perf_counter() - started)
+            if "error" in delivered:
+                errors += 1
+            await outgoing.receive_text()  # the sender's own ack
+
+    started = time.perf_counter()
+    await asyncio.gather(*(converse(*pair) for pair in sockets))
+    elapsed = time.perf_counter() - started
+    for outgoing, incoming, _ in sockets:
+        await outgoing.close()
+        await incoming.close()
+    return summarize(latencies, errors, elapsed)
+
+
+def _format(result: dict) -> str:
+    return (
+        f"{result['throughput_rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+        f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  errors {result['errors']}"
+    )
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions beyond ``tolerance`` (a fraction) in throughput or p95."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database-url", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"),
+        help="file-backed SQLite or Postgres; the database is dropped and reseeded",
+    )
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--agencies", type=int, default=20)
+    parser.add_argument("--properties", type=int, default=2000)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=50, help="logins run real bcrypt; keep this small")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", default="benchmarks/results/latest.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    # Settings are read on first import, so configure the app before importing it
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("STORAGE_BACKEND", "local")
+    os.environ.setdefault("DB_WARM_CONNECTIONS", str(min(args.concurrency, 5)))
+    from app.database import engine
+    from benchmarks.seed import seed
+
+    started = time.perf_counter()
+    dataset = seed(engine, args.users, args.agencies, args.properties, args.images, args.messages, args.seed)
+    print(f"seeded in {time.perf_counter() - started:.1f}s", flush=True)
+
+    results = asyncio.run(benchmark(args, dataset))
+    report = {
+        "meta": {
+            "database": engine.dialect.name,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "dataset": {
+                "users": args.users, "agencies": args.agencies, "properties": args.properties,
+                "images": args.images, "messages": args.messages, "seed": args.seed,
+            },
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as source:
+            regressions = compare(results, json.load(source), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
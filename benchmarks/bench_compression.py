@@ -0,0 +1,105 @@
+"""Response compression and streamed list pages: bytes on the wire and time to first byte.
+
+Seeds a database (see benchmarks.seed) and calls the app directly over
+ASGI, timing the first and the last body chunk of listing pages:
+
+    buffered  /properties/?limit=100, the largest regular page
+    streamed  /properties/?limit=1000&stream=true
+
+Each page is fetched with every installed encoding and with identity. The
+response cache is off, so every request builds its page.
+
+    python -m benchmarks.bench_compression --properties 5000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+
+async def fetch(app, path: str, query: str, encoding: str):
+    """(seconds to first body byte, seconds to last, body bytes) for one GET."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+        "headers": [(b"host", b"bench"), (b"accept-encoding", encoding.encode())],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+    first = None
+    size = 0
+    requested = False
+    done = asyncio.Event()
+    started = time.perf_counter()
+
+    async def receive():
+        # The request once, then nothing until the client "disconnects" at the end
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first, size
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"{path}?{query}: {message['status']}")
+        if message["type"] == "http.response.body" and message.get("body"):
+            if first is None:
+                first = time.perf_counter() - started
+            size += len(message["body"])
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    return first, time.perf_counter() - started, size
+
+
+async def run(args):
+    from app.database import async_engine
+    from app.main import app
+    from app.services.compression import ENCODINGS
+
+    pages = {"buffered": "limit=100", "streamed": "limit=1000&stream=true"}
+    async with app.router.lifespan_context(app):
+        for name, query in pages.items():
+            identity = None
+            for encoding in ["identity"] + ENCODINGS:
+                samples = [await fetch(app, "/properties/", query, encoding) for _ in range(args.repeat)]
+                first = sorted(sample[0] for sample in samples)[len(samples) // 2]
+                last = sorted(sample[1] for sample in samples)[len(samples) // 2]
+                size = samples[0][2]
+                identity = identity or size
+                print(
+                    f"{name:<9} {encoding:<9} ttfb {first * 1000:7.2f} ms  total {last * 1000:7.2f} ms  "
+                    f"{size:9d} bytes  {identity / size:5.1f}x smaller",
+                    flush=True,
+                )
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database-url", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"),
+        help="file-backed SQLite or Postgres; the database is dropped and reseeded",
+    )
+    parser.add_argument("--properties", type=int, default=5000)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # Settings are read on first import, so configure the app before importing it
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+    os.environ.setdefault("STORAGE_BACKEND", "local")
+    from app.database import engine
+    from benchmarks.seed import seed
+
+    seed(engine, users=10, agencies=10, properties=args.properties, images=args.images, messages=0, seed=args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
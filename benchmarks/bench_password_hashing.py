@@ -0,0 +1,53 @@
+"""Login throughput microbenchmark for the bcrypt worker pool.
+
+Compares serial verification on the event loop thread with
+``verify_password_async`` fanned out over the hashing pool, and reports
+verifications per second per core.
+
+    python -m benchmarks.bench_password_hashing --rounds 12 --requests 64
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", 12)))
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.workers:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    from app import security
+
+    hashed = security.hash_password("correct horse battery staple")
+    workers = security.PASSWORD_HASH_WORKERS
+    cores = min(workers, os.cpu_count() or 1)
+
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        security.verify_password("correct horse battery staple", hashed)
+    serial = args.requests / (time.perf_counter() - started)
+
+    async def pooled():
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            security.verify_password_async("correct horse battery staple", hashed)
+            for _ in range(args.requests)
+        ))
+        return args.requests / (time.perf_counter() - started)
+
+    pool = asyncio.run(pooled())
+    print(f"bcrypt rounds={args.rounds} requests={args.requests} workers={workers} cores={cores}")
+    print(f"serial  {serial:8.1f} verifications/s")
+    print(f"pooled  {pool:8.1f} verifications/s  ({pool / cores:.1f}/s per core, {pool / serial:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
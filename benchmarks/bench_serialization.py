@@ -0,0 +1,102 @@
+"""PropertyOut list serialization benchmark: ORM + pydantic vs row tuples + orjson.
+
+Seeds a database (see benchmarks.seed) and builds the same listing pages
+three ways, timing query plus encoding:
+
+    stdlib   ORM entities, PropertyOut validation, jsonable_encoder + json.dumps
+             (the old response_model + JSONResponse path)
+    pydantic ORM entities, TypeAdapter validation, pydantic-core dump_json
+    rows     column tuples and one image query, dicts encoded by orjson
+             (app.services.row_serializers, used by list_properties)
+
+Every variant must produce the same JSON document; the run fails otherwise.
+
+    python -m benchmarks.bench_serialization --properties 5000 --page-sizes 20 100 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+
+async def run(args):
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    from app.database import AsyncSessionLocal, async_engine
+    from app.models import models
+    from app.schemas import schemas
+    from app.services import row_serializers
+
+    adapter = schemas.PropertyOutList
+
+    async def stdlib(db, limit):
+        query = select(models.Property).options(selectinload(models.Property.images)).order_by(models.Property.id)
+        rows = (await db.scalars(query.limit(limit))).all()
+        items = [schemas.PropertyOut.model_validate(row, from_attributes=True) for row in rows]
+        return json.dumps(jsonable_encoder(items)).encode()
+
+    async def pydantic(db, limit):
+        query = select(models.Property).options(selectinload(models.Property.images)).order_by(models.Property.id)
+        rows = (await db.scalars(query.limit(limit))).all()
+        return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+    async def rows(db, limit):
+        query = select(*row_serializers.property_columns()).order_by(models.Property.id)
+        result = (await db.execute(query.limit(limit))).all()
+        return row_serializers.dumps(await row_serializers.property_dicts(db, result))
+
+    variants = {"stdlib": stdlib, "pydantic": pydantic, "rows": rows}
+    for limit in args.page_sizes:
+        baseline = None
+        for name, build in variants.items():
+            # A fresh session per page, like a request; nothing carries over in the identity map
+            async with AsyncSessionLocal() as db:
+                reference = json.loads(await build(db, limit))
+            if baseline is None:
+                baseline = reference
+            elif reference != baseline:
+                raise SystemExit(f"{name} output differs from stdlib at page size {limit}")
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                async with AsyncSessionLocal() as db:
+                    await build(db, limit)
+            elapsed = time.perf_counter() - started
+            pages = args.repeat / elapsed
+            if name == "stdlib":
+                slowest = pages
+            print(
+                f"page={limit:<5} {name:<9} {pages:8.1f} pages/s  {pages * limit:10.0f} items/s  "
+                f"{elapsed / args.repeat * 1000:8.2f} ms/page  {pages / slowest:5.2f}x",
+                flush=True,
+            )
+    # aiosqlite's connection threads would otherwise keep the interpreter alive
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database-url", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"),
+        help="file-backed SQLite or Postgres; the database is dropped and reseeded",
+    )
+    parser.add_argument("--properties", type=int, default=5000)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    from app.database import engine
+    from benchmarks.seed import seed
+
+    seed(engine, users=10, agencies=10, properties=args.properties, images=args.images, messages=0, seed=args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
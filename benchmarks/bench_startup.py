@@ -0,0 +1,64 @@
+"""Cold-start benchmark: time to import app.main and to finish lifespan startup.
+
+Each sample runs in a fresh interpreter so nothing is already imported.
+Track the numbers across changes; importing must stay free of network and
+DDL work.
+
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SAMPLE = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+    return ready
+
+ready = asyncio.run(startup())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def sample(env) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", SAMPLE], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print a machine-readable summary")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")
+    samples = [sample(env) for _ in range(args.repeat)]
+    summary = {
+        metric: {
+            "median": round(statistics.median(s[metric] for s in samples), 1),
+            "min": round(min(s[metric] for s in samples), 1),
+        }
+        for metric in ("import_ms", "startup_ms")
+    }
+    if args.json:
+        print(json.dumps(summary))
+        return
+    print(f"runs={args.repeat}")
+    for metric, values in summary.items():
+        print(f"{metric:<11} median {values['median']:8.1f}  min {values['min']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
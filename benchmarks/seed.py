@@ -0,0 +1,160 @@
+"""Seed a database with a synthetic, reproducible dataset for benchmarks.
+
+Creates users, agencies owning properties with images, and message
+histories between users and agencies (with their conversation rows), using
+bulk inserts on the sync engine. The same --seed always yields the same data.
+
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.seed --properties 5000
+"""
+import argparse
+import os
+import random
+from collections import defaultdict
+
+# Rough city centres; listings scatter up to ~15km around them
+LOCATIONS = {
+    "Lagos": (6.5244, 3.3792), "Lekki": (6.4698, 3.5852), "Ikoyi": (6.4549, 3.4366), "Abuja": (9.0765, 7.3986),
+    "Maitama": (9.0882, 7.4934), "Port Harcourt": (4.8156, 7.0498), "Ibadan": (7.3775, 3.9470),
+    "Enugu": (6.4584, 7.5464), "Kano": (12.0022, 8.5920), "Calabar": (4.9757, 8.3417),
+}
+KINDS = ["apartment", "duplex", "bungalow", "penthouse", "terrace", "villa", "studio", "mansion"]
+FEATURES = ["sea view", "pool", "gym", "garden", "smart home", "24h power", "gated estate", "parking"]
+PASSWORD = "benchmark-password"
+CHUNK = 1000
+
+
+def _chunks(rows, size=CHUNK):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def seed(engine, users: int = 500, agencies: int = 20, properties: int = 2000, images: int = 3,
+         messages: int = 5000, seed: int = 42) -> dict:
+    """Create the schema on ``engine`` and fill it; returns ids the benchmarks need."""
+    from sqlalchemy import insert
+
+    from app.models import models
+    from app.security import hash_password
+    from app.services.geo import geocell
+
+    rng = random.Random(seed)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+
+    # One hash for every account; hashing per user would dominate seeding
+    password = hash_password(PASSWORD)
+    user_rows = []
+    for index in range(users + agencies):
+        is_agency = index >= users
+        user_rows.append({
+            "id": index + 1,
+            "username": f"{'agency' if is_agency else 'user'}{index}",
+            "email": f"{'agency' if is_agency else 'user'}{index}@bench.example",
+            "phone": f"080{index:08d}",
+            "password": password,
+            "is_verified": True,
+            "role": models.UserRole.agency if is_agency else models.UserRole.user,
+            "agency_name": f"Agency {index}" if is_agency else None,
+        })
+    user_ids = [row["id"] for row in user_rows[:users]]
+    agency_ids = [row["id"] for row in user_rows[users:]]
+
+    property_rows, image_rows = [], []
+    for property_id in range(1, properties + 1):
+        kind, location = rng.choice(KINDS), rng.choice(list(LOCATIONS))
+        latitude, longitude = (centre + rng.uniform(-0.15, 0.15) for centre in LOCATIONS[location])
+        property_rows.append({
+            "id": property_id,
+            "title": f"{rng.randint(1, 6)} bedroom {kind} in {location}",
+            "description": f"{kind.title()} with {', '.join(rng.sample(FEATURES, 3))}.",
+            "price": rng.randrange(20_000, 10_000_000, 1000),
+            "location": location,
+            "latitude": latitude,
+            "longitude": longitude,
+            "geocell": geocell(latitude, longitude),
+            "owner_id": rng.choice(agency_ids),
+        })
+        for position in range(images):
+            digest = f"{property_id:032x}{position:032x}"
+            image_rows.append({
+                "property_id": property_id,
+                "url": f"https://images.bench.example/{digest}.jpg",
+                "storage_key": digest,
+                "content_hash": digest,
+                "width": 1600,
+                "height": 1067,
+                "variants": {
+                    name: {"url": f"https://images.bench.example/{digest}-{name}.jpg", "width": edge, "height": edge * 2 // 3}
+                    for name, edge in (("thumbnail", 320), ("card", 800), ("full", 1600))
+                },
+            })
+
+    message_rows = []
+    threads = defaultdict(lambda: [0, 0])
+    for message_id in range(1, messages + 1):
+        user_id, agency_id = rng.choice(user_ids), rng.choice(agency_ids)
+        sender, receiver = (user_id, agency_id) if rng.random() < 0.6 else (agency_id, user_id)
+        property_id = rng.randint(1, properties) if properties and rng.random() < 0.8 else None
+        message_rows.append({
+            "id": message_id,
+            "content": f"Message {message_id} about the listing",
+            "sender_id": sender,
+            "receiver_id": receiver,
+            "property_id": property_id,
+        })
+        receiver_view = threads[(receiver, sender, property_id)]
+        receiver_view[0] = message_id
+        receiver_view[1] += 1
+        threads[(sender, receiver, property_id)][0] = message_id
+    conversation_rows = [
+        {"user_id": user_id, "peer_id": peer_id, "property_id": property_id,
+         "last_message_id": last_message_id, "unread_count": unread}
+        for (user_id, peer_id, property_id), (last_message_id, unread) in threads.items()
+    ]
+
+    with engine.begin() as connection:
+        for model, rows in (
+            (models.User, user_rows),
+            (models.Property, property_rows),
+            (models.PropertyImage, image_rows),
+            (models.Message, message_rows),
+            (models.Conversation, conversation_rows),
+        ):
+            for chunk in _chunks(rows):
+                connection.execute(insert(model), chunk)
+        if engine.dialect.name == "postgresql":
+            # Explicit ids bypass the sequences; move them past the seeded rows
+            for model in (models.User, models.Property, models.Message):
+                table = model.__tablename__
+                connection.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                )
+
+    return {
+        "users": [(row["id"], row["email"], row["role"].value) for row in user_rows],
+        "user_ids": user_ids,
+        "agency_ids": agency_ids,
+        "property_ids": [row["id"] for row in property_rows],
+        "password": PASSWORD,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--agencies", type=int, default=20)
+    parser.add_argument("--properties", type=int, default=2000)
+    parser.add_argument("--images", type=int, default=3, help="images per property")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///bench.db")
+    from app.database import engine
+
+    seed(engine, args.users, args.agencies, args.properties, args.images, args.messages, args.seed)
+    print(f"Seeded {engine.url.render_as_string(hide_password=True)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Shared fixtures: the app on throwaway SQLite files, reset before every test.
+
+Settings are read once on first import, so the environment is set up here
+before anything from ``app`` is imported.
+"""
+import os
+import pathlib
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+TMP = tempfile.mkdtemp(prefix="lanvera-tests-")
+os.chdir(ROOT)  # mail templates load from app/templates
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TMP}/primary.db",
+    "SECRET_KEY": "test-secret",
+    "SESSION_SECRET_KEY": "test-session",
+    "STORAGE_BACKEND": "local",
+    "MEDIA_ROOT": f"{TMP}/media",
+    "BCRYPT_ROUNDS": "4",
+    "DB_WARM_CONNECTIONS": "0",
+    "IMAGE_WORKERS": "1",
+})
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import security
+from app.database import engine
+from app.models import models
+from app.services import admission, compression, facets, search
+from app.services.cache import response_cache
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+
+    # The lifespan resumes unfinished imports, so the tables must exist first
+    models.Base.metadata.create_all(bind=engine)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    response_cache.backend.clear()
+    compression.compressed_cache.clear()
+    security.principal_cache.clear()
+    facets.facet_cache.clear()
+    search.property_index.__init__()
+    for bucket in admission.rate_limits.values():
+        bucket._buckets.clear()
+    yield
+
+
+@pytest.fixture
+def run(client):
+    """Run a coroutine function on the app's event loop (the one the engine's pool lives on)."""
+    return client.portal.call
+
@@ -0,0 +1,31 @@
+"""Rows for tests, written straight through the sync session."""
+from app import security
+from app.database import SessionLocal
+from app.models import models
+
+
+def make_user(email: str, role: models.UserRole = models.UserRole.user):
+    """A verified user and the Authorization header to act as them."""
+    with SessionLocal() as db:
+        user = models.User(
+            username=email.split("@")[0], email=email, phone="1", password=security.hash_password("secret1"),
+            is_verified=True, role=role,
+        )
+        db.add(user)
+        db.commit()
+        token = security.create_access_token(security.user_token_claims(user))
+        return user.id, {"Authorization": f"Bearer {token}"}
+
+
+def make_properties(owner_id: int, count: int, **fields):
+    with SessionLocal() as db:
+        props = [
+            models.Property(
+                title=f"Listing {index}", description="A listing", price=fields.get("price", 1000 + index),
+                location=fields.get("location", "Lagos"), owner_id=owner_id,
+            )
+            for index in range(count)
+        ]
+        db.add_all(props)
+        db.commit()
+        return [prop.id for prop in props]
@@ -0,0 +1,37 @@
+import pytest
+
+from app.services import admission
+
+
+def scope(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return {"type": "http", "client": (peer, 1234), "headers": headers}
+
+
+@pytest.mark.parametrize("peer, forwarded, expected", [
+    ("203.0.113.9", None, "203.0.113.9"),
+    # Untrusted peers can't pick their own key
+    ("203.0.113.9", "198.51.100.1", "203.0.113.9"),
+    ("10.0.0.2", "198.51.100.1", "198.51.100.1"),
+    # A spoofed first hop is ignored: the trusted proxy appended the real one
+    ("10.0.0.2", "1.1.1.1, 198.51.100.1", "198.51.100.1"),
+    ("10.0.0.2", "198.51.100.1, 10.0.0.3", "198.51.100.1"),
+    ("10.0.0.2", None, "10.0.0.2"),
+])
+def test_client_address_believes_only_trusted_proxies(monkeypatch, peer, forwarded, expected):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", [admission.ipaddress.ip_network("10.0.0.0/8")])
+    assert admission.client_address(scope(peer, forwarded)) == expected
+
+
+def test_clients_behind_a_proxy_get_their_own_buckets(client, monkeypatch):
+    monkeypatch.setattr(admission, "TRUST_ALL_PROXIES", True)
+    bucket = admission.rate_limits[("POST", "/auth/forgot-password")]
+
+    def forgot(address):
+        return client.post(
+            "/auth/forgot-password", json={"email": "nobody@x.com"}, headers={"X-Forwarded-For": address}
+        ).status_code
+
+    statuses = [forgot("198.51.100.1") for _ in range(bucket.burst + 1)]
+    assert statuses[-1] == 429 and 429 not in statuses[:-1]
+    assert forgot("198.51.100.2") != 429
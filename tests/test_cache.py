@@ -0,0 +1,52 @@
+from app.database import SessionLocal
+from app.models import models
+from app.routers import properties
+from tests.factories import make_properties, make_user
+
+
+def test_list_is_revalidated_and_invalidated_by_writes(client):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    make_properties(owner_id, 3)
+
+    first = client.get("/properties/")
+    etag = first.headers["etag"]
+    assert client.get("/properties/", headers={"If-None-Match": etag}).status_code == 304
+
+    prop_id = first.json()["items"][0]["id"]
+    assert client.put(f"/properties/{prop_id}", json={"title": "Renamed"}, headers=headers).status_code == 200
+
+    after = client.get("/properties/", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.json()["items"][0]["title"] == "Renamed"
+
+
+def test_detail_is_invalidated_by_update_and_delete(client):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    [prop_id] = make_properties(owner_id, 1)
+
+    assert client.get(f"/properties/{prop_id}").json()["title"] == "Listing 0"
+    client.put(f"/properties/{prop_id}", json={"title": "Renamed"}, headers=headers)
+    assert client.get(f"/properties/{prop_id}").json()["title"] == "Renamed"
+    client.delete(f"/properties/{prop_id}", headers=headers)
+    assert client.get(f"/properties/{prop_id}").status_code == 404
+
+
+def test_detail_built_before_a_write_is_not_served_after_it(client, monkeypatch):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    [prop_id] = make_properties(owner_id, 1)
+    load = properties._get_property_with_images
+
+    async def load_then_lose_the_race(db, id):
+        prop = await load(db, id)
+        # The update commits and invalidates while this request is still building
+        with SessionLocal() as other:
+            other.get(models.Property, id).title = "Renamed"
+            other.commit()
+        properties._invalidate_cached_reads(id)
+        return prop
+
+    monkeypatch.setattr(properties, "_get_property_with_images", load_then_lose_the_race)
+    assert client.get(f"/properties/{prop_id}").json()["title"] == "Listing 0"
+    monkeypatch.setattr(properties, "_get_property_with_images", load)
+
+    assert client.get(f"/properties/{prop_id}").json()["title"] == "Renamed"
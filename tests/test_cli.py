@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from app.cli import upgrade_schema
+from app.models import models
+from tests.conftest import TMP
+
+# The tables as the first release created them
+FIRST_RELEASE = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, email VARCHAR NOT NULL UNIQUE, "
+    "phone VARCHAR, password VARCHAR NOT NULL, is_verified BOOLEAN, role VARCHAR(6) NOT NULL, "
+    "agency_name VARCHAR(255), agency_address VARCHAR(255))",
+    "CREATE TABLE properties (id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, description TEXT NOT NULL, "
+    "price INTEGER NOT NULL, location VARCHAR(255) NOT NULL, owner_id INTEGER NOT NULL REFERENCES users (id))",
+    "CREATE TABLE property_images (id INTEGER PRIMARY KEY, property_id INTEGER NOT NULL REFERENCES properties (id), "
+    "url VARCHAR(500) NOT NULL)",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, content TEXT NOT NULL, sender_id INTEGER REFERENCES users (id), "
+    "receiver_id INTEGER REFERENCES users (id), property_id INTEGER REFERENCES properties (id))",
+    "INSERT INTO users VALUES (1, 'a', 'a@x.com', NULL, 'x', 1, 'agency', NULL, NULL), "
+    "(2, 'b', 'b@x.com', NULL, 'x', 1, 'user', NULL, NULL)",
+    "INSERT INTO properties VALUES (1, 'Flat', 'Two beds', 1000, 'Lagos', 1)",
+    "INSERT INTO property_images VALUES (1, 1, 'http://img/1.jpg')",
+    "INSERT INTO messages VALUES (1, 'hi', 2, 1, 1), (2, 'hello', 1, 2, 1), (3, 'other', 2, 1, NULL)",
+]
+
+
+def test_create_schema_upgrades_first_release_tables():
+    engine = create_engine(f"sqlite:///{TMP}/first-release.db")
+    with engine.begin() as connection:
+        for table in ("messages", "property_images", "properties", "users", "conversations"):
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for statement in FIRST_RELEASE:
+            connection.execute(text(statement))
+
+    upgrade_schema(engine, models.Base.metadata)
+    upgrade_schema(engine, models.Base.metadata)  # a second run changes nothing
+
+    inspector = inspect(engine)
+    for name in ("properties", "property_images", "messages"):
+        table = models.Base.metadata.tables[name]
+        assert {column["name"] for column in inspector.get_columns(name)} == set(table.c.keys())
+        assert {index["name"] for index in inspector.get_indexes(name)} >= {
+            index.name for index in table.indexes if index._ddl_if is None  # not the PostgreSQL-only ones
+        }
+    with Session(engine) as db:
+        prop = db.get(models.Property, 1)
+        assert prop.created_at is not None and prop.updated_at == prop.created_at
+        assert all(message.read_at is not None for message in db.scalars(select(models.Message)))
+        threads = db.execute(select(
+            models.Conversation.user_id, models.Conversation.peer_id, models.Conversation.property_id,
+            models.Conversation.last_message_id, models.Conversation.unread_count,
+        ).order_by(models.Conversation.user_id, models.Conversation.property_id)).all()
+    assert [tuple(thread) for thread in threads] == [(1, 2, None, 3, 0), (1, 2, 1, 2, 0), (2, 1, None, 3, 0), (2, 1, 1, 2, 0)]
+    engine.dispose()
@@ -0,0 +1,30 @@
+from app.models import models
+from app.services import compression
+from tests.factories import make_properties, make_user
+
+
+def revalidate(client, path):
+    first = client.get(path, headers={"Accept-Encoding": "gzip"})
+    again = client.get(path, headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    return first, again
+
+
+def test_not_modified_keeps_the_strong_etag_of_an_uncompressed_body(client, monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_MIN_SIZE", 10_000)
+    first, again = revalidate(client, "/properties/")
+
+    assert "content-encoding" not in first.headers
+    assert not first.headers["etag"].startswith("W/")
+    assert again.headers["etag"] == first.headers["etag"]
+
+
+def test_not_modified_weakens_the_etag_of_a_compressed_body(client, monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_MIN_SIZE", 100)
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    make_properties(owner_id, 5)
+    first, again = revalidate(client, "/properties/")
+
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["etag"].startswith("W/")
+    assert again.headers["etag"] == first.headers["etag"]
@@ -0,0 +1,31 @@
+import csv
+import io
+
+from app.database import SessionLocal
+from app.models import models
+from tests.factories import make_user
+
+
+def test_csv_export_defuses_formulas_and_imports_back(client):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    titles = ["=HYPERLINK(\"http://evil\")", "+1", "-2 beds", "@SUM(A1)", "\tTabbed", "Plain"]
+    with SessionLocal() as db:
+        db.add_all([
+            models.Property(title=title, description="d", price=1, location="Lagos", longitude=-3.5, latitude=6.5,
+                            owner_id=owner_id)
+            for title in titles
+        ])
+        db.commit()
+
+    export = client.get("/properties/export", params={"format": "csv"}, headers=headers)
+    rows = list(csv.DictReader(io.StringIO(export.text)))
+    assert [row["title"] for row in rows] == ["'" + title for title in titles[:-1]] + ["Plain"]
+    assert rows[0]["longitude"] == "-3.5"
+
+    with SessionLocal() as db:
+        db.query(models.Property).delete()
+        db.commit()
+    imported = client.post("/properties/import", params={"format": "csv"}, content=export.content, headers=headers)
+    assert imported.json()["rows_imported"] == len(titles)
+    with SessionLocal() as db:
+        assert sorted(prop.title for prop in db.query(models.Property)) == sorted(titles)
@@ -0,0 +1,27 @@
+from app.models import models
+from app.services.facets import FacetFilters, PropertySnapshot, facet_cache
+from tests.factories import make_properties, make_user
+
+EVERYTHING = FacetFilters(None, None, None, None)
+
+
+def test_counts_read_across_a_write_are_not_cached():
+    counts = {"location": {"Lagos": 1}, "price": {0: 1}, "owner_id": {1: 1}}
+    version = facet_cache.version
+    # A write lands between the count query and set; the counts may or may not include it
+    facet_cache.property_added(PropertySnapshot(500, "Lagos", 1))
+    facet_cache.set(EVERYTHING, counts, version)
+    assert facet_cache.get(EVERYTHING) is None
+
+    facet_cache.set(EVERYTHING, counts, facet_cache.version)
+    assert facet_cache.get(EVERYTHING) == counts
+
+
+def test_cached_counts_follow_writes(client):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 2)[0]
+    assert client.get("/facets/properties").json()["total"] == 2
+
+    assert client.delete(f"/properties/{prop_id}", headers=headers).status_code == 200
+    assert facet_cache.get(EVERYTHING) is not None
+    assert client.get("/facets/properties").json()["total"] == 1
@@ -0,0 +1,121 @@
+import asyncio
+
+import asyncpg
+
+from app.services import hub as hub_module
+from app.services.hub import ConnectionHub, PostgresBroker
+
+
+class FakeConnection:
+    def __init__(self, fail_execute=False):
+        self.fail_execute = fail_execute
+        self.closed = False
+        self.on_terminate = None
+        self.executed = []
+
+    def add_termination_listener(self, callback):
+        self.on_terminate = callback
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    async def execute(self, *args):
+        if self.fail_execute:
+            raise ConnectionResetError("gone")
+        self.executed.append(args)
+
+    def is_closed(self):
+        return self.closed
+
+    def drop(self):
+        self.closed = True
+        self.on_terminate(self)
+
+    def terminate(self):
+        self.closed = True
+
+    async def close(self):
+        self.closed = True
+
+
+def fake_connect(monkeypatch, outcomes):
+    """Each connect pops the next outcome: a FakeConnection or an exception."""
+    connections = []
+
+    async def connect(dsn):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        connections.append(outcome)
+        return outcome
+
+    monkeypatch.setattr(asyncpg, "connect", connect)
+    monkeypatch.setattr(hub_module, "HUB_RECONNECT_MIN", 0.001)
+    return connections
+
+
+async def until(condition):
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("condition never held")
+
+
+def test_listener_reconnects_after_a_drop_and_a_failed_connect(monkeypatch):
+    first, second = FakeConnection(), FakeConnection()
+    connections = fake_connect(monkeypatch, [first, OSError("refused"), second])
+
+    async def scenario():
+        broker = PostgresBroker("postgresql://db")
+        await broker.start(lambda payload: None)
+        await until(lambda: connections == [first])
+        first.drop()
+        await until(lambda: connections == [first, second] and broker._listener is second)
+        await broker.stop()
+        return broker
+
+    broker = asyncio.run(scenario())
+    assert broker.reconnects == 1
+    assert second.closed
+
+
+def test_publisher_reconnects_after_a_failed_publish(monkeypatch):
+    broken, fresh = FakeConnection(fail_execute=True), FakeConnection()
+    fake_connect(monkeypatch, [broken, fresh])
+
+    async def scenario():
+        broker = PostgresBroker("postgresql://db")
+        try:
+            await broker.publish("one")
+        except ConnectionResetError:
+            pass
+        await broker.publish("two")
+
+    asyncio.run(scenario())
+    assert broken.closed
+    assert [args[-1] for args in fresh.executed] == ["two"]
+
+
+class FailingBroker(hub_module.Broker):
+    async def publish(self, payload):
+        raise ConnectionResetError("gone")
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+def test_send_to_user_survives_a_publish_failure():
+    hub = ConnectionHub(FailingBroker())
+    socket = FakeSocket()
+    hub.connect(1, socket)
+
+    asyncio.run(hub.send_to_user(1, {"content": "hi"}))
+
+    assert socket.sent == ['{"content": "hi"}']
+    assert hub.publish_failures == 1
@@ -0,0 +1,150 @@
+import asyncio
+import functools
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import models
+from app.services import images, storage
+from tests.factories import make_properties, make_user
+
+
+def jpeg() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), "red").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pipeline(run, monkeypatch):
+    # Threads instead of spawned processes keep the tests quick; the work is the same
+    monkeypatch.setattr(images, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    monkeypatch.setattr(images, "IMAGE_PIPELINE_RETRY_DELAY", 0)
+    pipeline = images.ImagePipeline(workers=1)
+    yield pipeline
+    run(pipeline.stop)
+
+
+def add_images(rows, imported=()):
+    """Stored images from ``rows``, plus images an import has not fetched yet from ``imported``."""
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 1)[0]
+    with SessionLocal() as db:
+        job = models.ImportJob(owner_id=owner_id, format="ndjson")
+        db.add(job)
+        db.flush()
+        db.add_all([models.PropertyImage(property_id=prop_id, **row) for row in rows])
+        db.add_all([models.PropertyImage(property_id=prop_id, import_job_id=job.id, **row) for row in imported])
+        db.commit()
+
+
+def image_rows():
+    with SessionLocal() as db:
+        return {image.url: image for image in db.scalars(select(models.PropertyImage))}
+
+
+async def drain(*pipelines, on_updated=None):
+    for pipeline in pipelines:
+        await pipeline.start(on_updated=on_updated)
+    while any(pipeline._tasks for pipeline in pipelines):
+        await asyncio.gather(*(task for pipeline in pipelines for task in list(pipeline._tasks.values())))
+
+
+def test_start_resumes_images_left_without_variants(run, pipeline, monkeypatch):
+    add_images(
+        [
+            {"url": "/media/a.jpg", "storage_key": "a.jpg", "content_hash": "a"},
+            {"url": "/media/a-again.jpg", "storage_key": "a.jpg", "content_hash": "a"},
+        ],
+        # Still the agency's source URL; the import fetcher owns it
+        imported=[{"url": "http://example.com/b.jpg", "content_hash": "b"}],
+    )
+    reads = []
+
+    async def read_file(stored):
+        reads.append(stored.key)
+        return jpeg()
+
+    monkeypatch.setattr(storage, "read_file", read_file)
+    updated = []
+    run(functools.partial(drain, pipeline, on_updated=updated.append))
+
+    assert reads == ["a.jpg"]
+    rows = image_rows()
+    for url in ("/media/a.jpg", "/media/a-again.jpg"):
+        assert set(rows[url].variants) == {"thumbnail", "card", "full"}
+        assert (rows[url].width, rows[url].height) == (40, 30)
+        assert rows[url].variants_leased_until is None
+    assert rows["http://example.com/b.jpg"].variants is None
+    assert len(set(updated)) == 1
+
+
+def test_workers_resuming_the_same_images_build_each_hash_once(run, pipeline, monkeypatch):
+    add_images([{"url": f"/media/{index}.jpg", "storage_key": f"{index}.jpg", "content_hash": str(index)}
+                for index in range(4)])
+    reads = []
+
+    async def read_file(stored):
+        reads.append(stored.key)
+        await asyncio.sleep(0)
+        return jpeg()
+
+    monkeypatch.setattr(storage, "read_file", read_file)
+    other = images.ImagePipeline(workers=1)
+    try:
+        run(drain, pipeline, other)
+    finally:
+        run(other.stop)
+
+    assert sorted(reads) == [f"{index}.jpg" for index in range(4)]
+    assert pipeline.processed + other.processed == 4
+    assert all(row.variants for row in image_rows().values())
+
+
+def test_failed_builds_are_retried_before_giving_up(run, pipeline, monkeypatch):
+    add_images([{"url": "/media/a.jpg", "storage_key": "a.jpg", "content_hash": "a"}])
+    attempts = []
+
+    async def flaky(stored):
+        attempts.append(stored.key)
+        if len(attempts) == 1:
+            raise storage.UploadError("storage unavailable")
+        return jpeg()
+
+    monkeypatch.setattr(storage, "read_file", flaky)
+    run(drain, pipeline)
+
+    assert len(attempts) == 2
+    assert (pipeline.retried, pipeline.failed, pipeline.processed) == (1, 0, 1)
+    assert image_rows()["/media/a.jpg"].variants
+
+
+def test_images_that_keep_failing_are_left_for_the_next_start(run, pipeline, monkeypatch):
+    add_images([{"url": "/media/a.jpg", "storage_key": "a.jpg", "content_hash": "a"}])
+    attempts = []
+
+    async def broken(stored):
+        attempts.append(stored.key)
+        raise storage.UploadError("storage unavailable")
+
+    monkeypatch.setattr(storage, "read_file", broken)
+    run(drain, pipeline)
+
+    assert len(attempts) == images.IMAGE_PIPELINE_MAX_ATTEMPTS
+    assert (pipeline.failed, pipeline.processed) == (1, 0)
+    row = image_rows()["/media/a.jpg"]
+    assert row.variants is None and row.variants_leased_until is None
+
+    # The lease was released, so a restarted worker tries the hash again
+    monkeypatch.setattr(storage, "read_file", lambda stored: asyncio.sleep(0, jpeg()))
+    restarted = images.ImagePipeline(workers=1)
+    try:
+        run(drain, restarted)
+    finally:
+        run(restarted.stop)
+    assert restarted.processed == 1
+    assert image_rows()["/media/a.jpg"].variants
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import tempfile
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+from starlette.requests import ClientDisconnect
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import models
+from app.schemas.schemas import PropertyCreate
+from app.services import imports
+from tests.factories import make_user
+
+# A literal public address resolves without DNS
+PUBLIC = "http://93.184.216.34"
+
+
+def fetcher_with(handler):
+    fetcher = imports.ImageFetcher()
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return fetcher
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/a.jpg",
+    "http://localhost/a.jpg",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/a.jpg",
+    "http://[::1]/a.jpg",
+    "http://[::ffff:127.0.0.1]/a.jpg",
+    "http://0.0.0.0/a.jpg",
+    "ftp://93.184.216.34/a.jpg",
+])
+def test_resolve_public_refuses_internal_addresses(run, url):
+    with pytest.raises(ValueError):
+        run(imports.resolve_public, httpx.URL(url))
+
+
+def test_download_checks_every_redirect_hop(run):
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        return httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data/"})
+
+    with pytest.raises(ValueError, match="non-public"):
+        run(fetcher_with(handler)._download, f"{PUBLIC}/a.jpg")
+    assert requested == [f"{PUBLIC}/a.jpg"]
+
+
+def test_download_connects_to_the_checked_address(run):
+    def handler(request):
+        if request.url.path == "/start":
+            return httpx.Response(301, headers={"Location": "/photo.jpg"})
+        assert request.headers["host"] == "93.184.216.34"
+        return httpx.Response(200, headers={"Content-Type": "image/jpeg"}, content=b"jpeg bytes")
+
+    spool, digest = run(fetcher_with(handler)._download, f"{PUBLIC}/start")
+    assert spool.read() == b"jpeg bytes"
+    spool.close()
+
+
+def test_download_requires_an_image(run):
+    def handler(request):
+        return httpx.Response(200, headers={"Content-Type": "text/html"}, content=b"<html>")
+
+    with pytest.raises(ValueError, match="not an image"):
+        run(fetcher_with(handler)._download, f"{PUBLIC}/a.jpg")
+
+
+def test_download_caps_the_body(run, monkeypatch):
+    monkeypatch.setattr(imports, "IMPORT_IMAGE_MAX_BYTES", 10)
+
+    def handler(request):
+        return httpx.Response(200, headers={"Content-Type": "image/png"}, content=b"x" * 11)
+
+    with pytest.raises(ValueError, match="larger than"):
+        run(fetcher_with(handler)._download, f"{PUBLIC}/a.png")
+
+
+def ndjson(*rows):
+    return "\n".join(json.dumps(row) for row in rows).encode()
+
+
+LISTING = {"title": "Flat", "description": "Two beds", "price": 1000, "location": "Lagos"}
+
+
+def test_import_records_row_errors_and_completes(client):
+    _, headers = make_user("agency@x.com", models.UserRole.agency)
+    body = ndjson(LISTING, {**LISTING, "price": 10**20}, {**LISTING, "title": "x" * 256}, {"title": "only"})
+    response = client.post("/properties/import?format=ndjson", content=body, headers=headers)
+
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "completed"
+    assert (job["rows_total"], job["rows_imported"], job["rows_failed"]) == (4, 1, 3)
+    assert [error["row"] for error in job["errors"]] == [2, 3, 4]
+
+
+async def import_rows(stream, owner_id, chunk_size=10, format="ndjson"):
+    async with AsyncSessionLocal() as db:
+        job = models.ImportJob(owner_id=owner_id, format=format, status=models.ImportStatus.running)
+        db.add(job)
+        await db.commit()
+        importer = imports.BulkImporter(db, job, chunk_size=chunk_size)
+        try:
+            await importer.run(stream)
+        finally:
+            job_id = job.id
+    async with AsyncSessionLocal() as db:
+        job = await db.get(models.ImportJob, job_id)
+        titles = (await db.scalars(select(models.Property.title).order_by(models.Property.id))).all()
+        return job, titles
+
+
+async def chunks(*parts, error=None):
+    for part in parts:
+        yield part
+    if error is not None:
+        raise error
+
+
+def test_rows_the_database_rejects_are_retried_one_by_one(run, monkeypatch):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    # Skip the schema's bounds so the rejection comes from the database
+    monkeypatch.setattr(imports, "validate", lambda fields: PropertyCreate.model_construct(
+        latitude=None, longitude=None, image_urls=[], **fields
+    ))
+    body = ndjson({**LISTING, "title": "a"}, {**LISTING, "title": "b", "price": 10**20}, {**LISTING, "title": "c"})
+
+    job, titles = run(import_rows, chunks(body), owner_id)
+
+    assert job.status == models.ImportStatus.completed
+    assert titles == ["a", "c"]
+    assert (job.rows_total, job.rows_imported, job.rows_failed) == (3, 2, 1)
+    assert job.errors[0]["row"] == 2 and "rejected by the database" in job.errors[0]["error"]
+
+
+def test_disconnect_marks_the_job_failed_and_keeps_committed_rows(run):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    stream = chunks(ndjson({**LISTING, "title": "a"}) + b"\n", error=ClientDisconnect())
+
+    job, titles = run(import_rows, stream, owner_id)
+
+    assert job.status == models.ImportStatus.failed
+    assert job.finished_at is not None
+    assert titles == ["a"]
+    assert "upload ended" in job.errors[-1]["error"]
+
+
+def test_unexpected_error_still_finishes_the_job(run):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    stream = chunks(ndjson({**LISTING, "title": "a"}) + b"\n", error=RuntimeError("boom"))
+
+    with pytest.raises(RuntimeError):
+        run(import_rows, stream, owner_id)
+    with SessionLocal() as db:
+        job = db.scalars(select(models.ImportJob)).one()
+        assert job.status == models.ImportStatus.failed
+        assert job.rows_total == 1
+
+
+def test_overlong_ndjson_lines_fail_their_row_without_being_buffered(run, monkeypatch):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    monkeypatch.setattr(imports, "IMPORT_MAX_RECORD_LENGTH", 200)
+    # One line arriving in pieces, none of which holds its newline
+    stream = chunks(*[b"x" * 150] * 4, b"\n" + ndjson({**LISTING, "title": "a"}))
+
+    job, titles = run(import_rows, stream, owner_id)
+
+    assert job.status == models.ImportStatus.completed
+    assert titles == ["a"]
+    assert (job.rows_total, job.rows_failed) == (2, 1)
+    assert job.errors == [{"row": 1, "error": "line is longer than 200 characters"}]
+
+
+def test_csv_with_an_unterminated_quote_is_rejected_at_the_cap(run, monkeypatch):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    monkeypatch.setattr(imports, "IMPORT_MAX_RECORD_LENGTH", 200)
+    lines = ["title,description,price,location", "Flat,Two beds,1000,Lagos", 'Villa,"Pool,2000,Lagos']
+    # Everything after the stray quote reads as one field that never ends
+    lines += [f"House {index},Garden,3000,Abuja" for index in range(20)]
+    stream = chunks(*[f"{line}\n".encode() for line in lines])
+
+    job, titles = run(import_rows, stream, owner_id, 10, "csv")
+
+    assert job.status == models.ImportStatus.failed
+    assert titles == ["Flat"]
+    assert "CSV row 2: a quoted field runs past 200 characters" in job.errors[-1]["error"]
+
+
+def test_workers_resuming_the_same_job_fetch_each_image_once(run, monkeypatch):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    with SessionLocal() as db:
+        job = models.ImportJob(owner_id=owner_id, format="ndjson", images_queued=6)
+        prop = models.Property(title="a", description="d", price=1, location="Lagos", owner_id=owner_id)
+        db.add_all([job, prop])
+        db.flush()
+        db.add_all([
+            models.PropertyImage(property_id=prop.id, url=f"{PUBLIC}/{index}.jpg", import_job_id=job.id)
+            for index in range(6)
+        ])
+        db.commit()
+        job_id = job.id
+
+    downloads = []
+
+    async def download(self, url):
+        downloads.append(url)
+        await asyncio.sleep(0)
+        spool = tempfile.SpooledTemporaryFile()
+        spool.write(url.encode())
+        spool.seek(0)
+        return spool, hashlib.sha256(url.encode()).hexdigest()
+
+    async def no_variants(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(imports.ImageFetcher, "_download", download)
+    monkeypatch.setattr(imports.pipeline, "submit", no_variants)
+    monkeypatch.setattr(imports, "IMAGE_FETCH_BATCH", 2)
+
+    async def two_workers():
+        workers = [imports.ImageFetcher(), imports.ImageFetcher()]
+        for worker in workers:
+            worker._open()
+        await asyncio.gather(*(worker._drain(job_id) for worker in workers))
+
+    run(two_workers)
+
+    assert sorted(downloads) == sorted(f"{PUBLIC}/{index}.jpg" for index in range(6))
+    with SessionLocal() as db:
+        job = db.get(models.ImportJob, job_id)
+        assert (job.images_fetched, job.images_failed) == (6, 0)
+        assert db.scalar(select(func.count()).where(models.PropertyImage.import_job_id.is_not(None))) == 0
@@ -0,0 +1,18 @@
+import pytest
+
+from app import security
+from app.models import models
+from tests.factories import make_user
+
+
+@pytest.mark.parametrize("path", ["/internal/cache", "/metrics"])
+def test_operational_endpoints_need_an_admin_or_the_internal_token(client, monkeypatch, path):
+    _, user = make_user("user@x.com")
+    _, admin = make_user("admin@x.com", models.UserRole.admin)
+    monkeypatch.setattr(security, "INTERNAL_TOKEN", "scraper-token")
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=user).status_code == 403
+    assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get(path, headers=admin).status_code == 200
+    assert client.get(path, headers={"Authorization": "Bearer scraper-token"}).status_code == 200
@@ -0,0 +1,51 @@
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.models import EmailOutbox, OutboxStatus
+from app.services.email import enqueue_email
+from app.workers.email_worker import EmailWorker
+
+
+async def enqueue(body: str):
+    async with AsyncSessionLocal() as db:
+        await enqueue_email(db, "reset_password", "Ada@x.com", "Reset", body)
+        await db.commit()
+
+
+def outbox():
+    with SessionLocal() as db:
+        return [(row.body, row.dedup_key, row.status) for row in db.scalars(select(EmailOutbox).order_by(EmailOutbox.id))]
+
+
+class RecordingPool:
+    def __init__(self, during_send=None):
+        self.bodies = []
+        self.during_send = during_send
+
+    async def send(self, message):
+        self.bodies.append(message.get_content().strip())
+        if self.during_send is not None:
+            await self.during_send()
+
+    async def close(self):
+        pass
+
+
+def test_repeated_requests_queue_one_mail_with_the_newest_body(run):
+    run(enqueue, "first link")
+    run(enqueue, "second link")
+
+    assert outbox() == [("second link", "reset_password:ada@x.com", OutboxStatus.pending)]
+
+
+def test_a_request_while_the_mail_is_being_sent_queues_a_fresh_one(run):
+    run(enqueue, "first link")
+    pool = RecordingPool(during_send=lambda: enqueue("second link"))
+    worker = EmailWorker(pool=pool)
+
+    run(worker.run_batch)
+    pool.during_send = None
+    run(worker.run_batch)
+
+    assert pool.bodies == ["first link", "second link"]
+    assert outbox() == [("first link", None, OutboxStatus.sent), ("second link", None, OutboxStatus.sent)]
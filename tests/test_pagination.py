@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.database import SessionLocal
+from app.models import models
+from app.routers.properties import filter_properties
+from tests.factories import make_user
+
+PRICES = [500, 300, 300, 900, 100, 300, 700]
+
+
+@pytest.fixture
+def listings():
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    with SessionLocal() as db:
+        props = [
+            models.Property(title=f"Listing {index}", description="d", price=price, location="Lagos", owner_id=owner_id)
+            for index, price in enumerate(PRICES)
+        ]
+        db.add_all(props)
+        db.commit()
+        return [(prop.id, prop.price) for prop in props]
+
+
+def walk(client, limit, **params):
+    ids, cursor = [], None
+    while True:
+        page = client.get("/properties/", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert page.status_code == 200
+        body = page.json()
+        assert len(body["items"]) <= limit
+        ids += [item["id"] for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("sort, key", [
+    ("newest", lambda prop: -prop[0]),
+    ("oldest", lambda prop: prop[0]),
+    ("price_asc", lambda prop: (prop[1], prop[0])),
+    ("price_desc", lambda prop: (-prop[1], -prop[0])),
+])
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+def test_pages_walk_every_listing_once_in_order(client, listings, sort, key, limit):
+    assert walk(client, limit, sort=sort) == [prop[0] for prop in sorted(listings, key=key)]
+
+
+def test_a_listing_added_mid_walk_does_not_shift_pages(client, listings):
+    first = client.get("/properties/", params={"limit": 3}).json()
+    with SessionLocal() as db:
+        db.add(models.Property(title="New", description="d", price=1, location="Lagos", owner_id=1))
+        db.commit()
+    rest = walk_from(client, first["next_cursor"])
+    ids = [item["id"] for item in first["items"]] + rest
+    assert ids == sorted((prop[0] for prop in listings), reverse=True)
+
+
+def walk_from(client, cursor):
+    ids = []
+    while cursor:
+        body = client.get("/properties/", params={"limit": 3, "cursor": cursor}).json()
+        ids += [item["id"] for item in body["items"]]
+        cursor = body["next_cursor"]
+    return ids
+
+
+def test_bad_cursors_are_rejected(client, listings):
+    assert client.get("/properties/", params={"cursor": "not-a-cursor"}).status_code == 400
+    first = client.get("/properties/", params={"limit": 1}).json()
+    assert client.get("/properties/", params={"cursor": first["next_cursor"], "sort": "price_asc"}).status_code == 400
+
+
+def test_location_filter_is_a_case_insensitive_literal_prefix(client):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    with SessionLocal() as db:
+        db.add_all([
+            models.Property(title=location, description="d", price=1, location=location, owner_id=owner_id)
+            for location in ("Lagos Island", "lagos mainland", "Abuja", "50% Lekki", "500 Lekki")
+        ])
+        db.commit()
+
+    def locations(prefix):
+        items = client.get("/properties/", params={"location": prefix}).json()["items"]
+        return sorted(item["location"] for item in items)
+
+    assert locations("LAGOS") == ["Lagos Island", "lagos mainland"]
+    assert locations("50%") == ["50% Lekki"]
+
+
+def test_location_filter_matches_the_postgres_prefix_index():
+    query = filter_properties(select(models.Property.id), location="Lagos")
+    sql = str(query.compile(dialect=asyncpg.dialect(), compile_kwargs={"render_postcompile": True}))
+    assert "lower(properties.location) LIKE 'lagos%'" in sql
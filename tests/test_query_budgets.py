@@ -0,0 +1,42 @@
+import threading
+
+from app.database import SessionLocal
+from app.models import models
+from app.services.sql_profiler import assert_max_queries, capture_queries
+from tests.factories import make_properties, make_user
+
+
+def listings_with_images(count=20, images=3):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    ids = make_properties(owner_id, count)
+    with SessionLocal() as db:
+        db.add_all([
+            models.PropertyImage(property_id=prop_id, url=f"http://img/{prop_id}/{index}.jpg")
+            for prop_id in ids
+            for index in range(images)
+        ])
+        db.commit()
+    return ids
+
+
+def test_list_properties_stays_within_its_query_budget(client):
+    listings_with_images()
+    with assert_max_queries(2):
+        page = client.get("/properties/", params={"limit": 20})
+    assert len(page.json()["items"]) == 20
+    assert all(len(item["images"]) == 3 for item in page.json()["items"])
+
+
+def test_get_property_stays_within_its_query_budget(client):
+    prop_id = listings_with_images()[0]
+    with assert_max_queries(2):
+        assert len(client.get(f"/properties/{prop_id}").json()["images"]) == 3
+
+
+def test_captures_do_not_count_other_requests(client):
+    listings_with_images(count=2)
+    other = threading.Thread(target=lambda: [client.get("/properties/") for _ in range(5)])
+    with capture_queries() as log:
+        other.start()
+        other.join()
+    assert len(log) == 0
@@ -0,0 +1,117 @@
+"""Read-your-writes with a replica: a second SQLite file that only "replicates"
+when a test copies rows into it."""
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import database
+from app.database import SessionLocal, to_async_url
+from app.models import models
+from app.services.message_writer import message_writer
+from app.services import search
+from app.services.replica import ReplicaMonitor, sticky_writes
+from tests.conftest import TMP
+from tests.factories import make_properties, make_user
+
+REPLICA_URL = f"sqlite:///{TMP}/replica.db"
+
+
+@pytest.fixture
+def replica(run, monkeypatch):
+    sync_engine = create_engine(REPLICA_URL)
+    models.Base.metadata.drop_all(bind=sync_engine)
+    models.Base.metadata.create_all(bind=sync_engine)
+    engine = create_async_engine(to_async_url(REPLICA_URL))
+    monitor = ReplicaMonitor(engine, interval=5, timeout=2, max_lag=30)
+    monkeypatch.setattr(database, "replica", monitor)
+    monkeypatch.setattr(database, "ReadSessionLocal", async_sessionmaker(
+        engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    ))
+    monkeypatch.setattr(sticky_writes, "enabled", True)
+    sticky_writes.backend.clear()
+    yield sync_engine
+    run(engine.dispose)
+    sync_engine.dispose()
+
+
+def catch_up(replica_engine):
+    """Copy every property row from the primary, as replication would."""
+    with SessionLocal() as db:
+        rows = [dict(row._mapping) for row in db.execute(select(models.Property.__table__))]
+    with replica_engine.begin() as connection:
+        connection.execute(models.Property.__table__.delete())
+        if rows:
+            connection.execute(insert(models.Property.__table__), rows)
+
+
+def test_bearer_client_reads_its_write_without_the_cookie(client, replica):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 1)[0]
+    catch_up(replica)
+
+    updated = client.put(f"/properties/{prop_id}", json={"title": "Renamed"}, headers=headers)
+    assert updated.status_code == 200
+    # A cross-site SPA never sends the SameSite=Lax cookie back
+    client.cookies.clear()
+
+    # Anyone else still reads the replica, which has not caught up
+    assert client.get(f"/properties/{prop_id}").json()["title"] == "Listing 0"
+    assert client.get(f"/properties/{prop_id}", headers=headers).json()["title"] == "Renamed"
+
+
+def test_websocket_messages_pin_the_sender(client, run, replica):
+    sender_id, headers = make_user("a@x.com")
+    receiver_id, _ = make_user("b@x.com")
+
+    run(message_writer.write, sender_id, receiver_id, "hello")
+
+    sent = client.get("/messages/sent", headers=headers)
+    assert [message["content"] for message in sent.json()["items"]] == ["hello"]
+
+
+def test_replica_bodies_are_not_cached_until_it_caught_up(client, replica):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    database.replica.caught_up_at = None
+    make_properties(owner_id, 1)
+
+    assert client.get("/properties/").json()["items"] == []
+    catch_up(replica)
+    assert len(client.get("/properties/").json()["items"]) == 1
+
+    database.replica.caught_up_at = time.time()
+    first = client.get("/properties/")
+    assert client.get("/properties/", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+
+def test_pinned_clients_skip_cached_replica_bodies(client, replica):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 1)[0]
+    catch_up(replica)
+    database.replica.caught_up_at = time.time()
+    assert client.get(f"/properties/{prop_id}").json()["title"] == "Listing 0"
+
+    sticky_writes.mark(owner_id)
+    with SessionLocal() as db:
+        db.get(models.Property, prop_id).title = "Renamed"
+        db.commit()
+
+    assert client.get(f"/properties/{prop_id}", headers=headers).json()["title"] == "Renamed"
+
+
+def test_facets_are_counted_on_the_primary(client, replica):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    make_properties(owner_id, 2)
+
+    # Cached counts are only patched by later writes, so a lagging replica would stick
+    assert client.get("/facets/properties").json()["total"] == 2
+
+
+def test_search_index_is_built_from_the_primary(client, replica):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    ids = make_properties(owner_id, 2)
+
+    # The replica has none of the rows yet; the index must not be built from it
+    assert client.get("/properties/search", params={"q": "listing"}).json() == []
+    assert sorted(search.property_index.search("listing", 10)) == sorted(ids)
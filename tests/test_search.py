@@ -0,0 +1,51 @@
+from app.database import SessionLocal
+from app.models import models
+from app.services import search
+from tests.factories import make_properties, make_user
+
+
+def search_titles(client, q):
+    response = client.get("/properties/search", params={"q": q})
+    assert response.status_code == 200
+    return sorted(prop["title"] for prop in response.json())
+
+
+def test_writes_during_a_load_survive_it(run, monkeypatch):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    kept, removed = make_properties(owner_id, 2)
+    index = search.InvertedIndex()
+    index_document = search._index_document
+
+    def index_and_interleave(postings, doc_terms, doc_id, *fields):
+        # Another request writes while the load is still streaming rows
+        if doc_id == kept:
+            index.add(999, "Lighthouse", "On the coast", "Lagos")
+            index.remove(removed)
+        index_document(postings, doc_terms, doc_id, *fields)
+
+    monkeypatch.setattr(search, "_index_document", index_and_interleave)
+
+    run(index.load)
+    assert index.search("lighthouse", 10) == [999]
+    assert index.search("listing", 10) == [kept]
+
+
+def test_searches_catch_up_with_writes_from_other_processes(client, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_INDEX_CHECK_INTERVAL", 0)
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    first, second = make_properties(owner_id, 2)
+    assert search_titles(client, "0") == ["Listing 0"]
+
+    # Straight to the database, as another worker would
+    with SessionLocal() as db:
+        db.get(models.Property, first).title = "Lighthouse"
+        db.add(models.Property(title="Windmill", description="d", price=1, location="Lagos", owner_id=owner_id))
+        db.commit()
+    assert search_titles(client, "lighthouse") == ["Lighthouse"]
+    assert search_titles(client, "windmill") == ["Windmill"]
+    assert search_titles(client, "0") == []
+
+    with SessionLocal() as db:
+        db.delete(db.get(models.Property, second))
+        db.commit()
+    assert search_titles(client, "1") == []
@@ -0,0 +1,45 @@
+from app import security
+from app.database import SessionLocal
+from app.models import models
+from tests.factories import make_properties, make_user
+
+
+def rename(client, prop_id, headers):
+    return client.put(f"/properties/{prop_id}", json={"title": "Renamed"}, headers=headers)
+
+
+def test_agency_role_comes_from_the_user_not_the_token_claim(client):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 1)[0]
+    assert rename(client, prop_id, headers).status_code == 200
+
+    # Demoted after the token was issued; the token still claims agency
+    with SessionLocal() as db:
+        db.get(models.User, owner_id).role = models.UserRole.user
+        db.commit()
+    security.invalidate_principal("agency@x.com")
+    assert rename(client, prop_id, headers).status_code == 403
+
+
+
+def test_deleted_agencies_lose_access(client):
+    owner_id, _ = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 1)[0]
+    gone_id, headers = make_user("gone@x.com", models.UserRole.agency)
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    with SessionLocal() as db:
+        db.delete(db.get(models.User, gone_id))
+        db.commit()
+    security.invalidate_principal("gone@x.com")
+    assert rename(client, prop_id, headers).status_code == 401
+
+
+def test_cached_agencies_skip_the_user_lookup(client, run):
+    owner_id, headers = make_user("agency@x.com", models.UserRole.agency)
+    prop_id = make_properties(owner_id, 1)[0]
+    assert rename(client, prop_id, headers).status_code == 200
+    assert security.principal_cache.get("agency@x.com") is not None
+
+    principal = run(security.get_current_agency, headers["Authorization"].split()[1], None)
+    assert principal == security.Principal(owner_id, "agency@x.com", models.UserRole.agency)
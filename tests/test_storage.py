@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from app.services import storage
+
+
+def test_half_open_breaker_admits_a_single_trial():
+    breaker = storage.CircuitBreaker(threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+class SlowStorage(storage.StorageBackend):
+    def __init__(self):
+        self.release = threading.Event()
+        self.deleted = []
+
+    def save(self, fileobj, filename):
+        self.release.wait(5)
+        return storage.StoredFile(f"/media/{filename}", filename)
+
+    def delete(self, key):
+        self.deleted.append(key)
+
+
+def test_uploads_that_land_after_a_timeout_are_deleted(run, monkeypatch):
+    slow = SlowStorage()
+    monkeypatch.setattr(storage, "backend", slow)
+    monkeypatch.setattr(storage, "UPLOAD_TIMEOUT", 0.05)
+    monkeypatch.setattr(storage, "breaker", storage.CircuitBreaker())
+
+    with pytest.raises(storage.UploadError):
+        run(storage.upload_files, [(None, "late.jpg")])
+    assert slow.deleted == []
+
+    slow.release.set()
+    for _ in range(100):
+        if slow.deleted:
+            break
+        time.sleep(0.01)
+    assert slow.deleted == ["late.jpg"]
+
+
+def test_an_empty_batch_neither_fails_nor_spends_the_trial(run, monkeypatch):
+    breaker = storage.CircuitBreaker(threshold=1, reset_after=0.05)
+    monkeypatch.setattr(storage, "breaker", breaker)
+    breaker.record_failure()
+
+    # Every photo was a duplicate: nothing to upload while open...
+    assert run(storage.upload_files, []) == []
+    time.sleep(0.06)
+    # ...nor while half-open, where the trial is still left for a real upload
+    assert run(storage.upload_files, []) == []
+    assert breaker.state == "half-open" and breaker.allow()
+
+
+def test_background_uploads_have_their_own_breaker(run, monkeypatch):
+    class Failing(storage.StorageBackend):
+        def save(self, fileobj, filename):
+            raise OSError("down")
+
+    monkeypatch.setattr(storage, "backend", Failing())
+    monkeypatch.setattr(storage, "breaker", storage.CircuitBreaker(threshold=1))
+    monkeypatch.setattr(storage, "background_breaker", storage.CircuitBreaker(threshold=1))
+
+    with pytest.raises(storage.UploadError):
+        run(storage.upload_files, [(None, "variant.jpg")], storage.background_breaker)
+    assert storage.background_breaker.state == "open"
+    assert storage.breaker.state == "closed"